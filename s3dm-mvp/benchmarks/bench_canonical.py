@@ -0,0 +1,96 @@
+# benchmarks/bench_canonical.py
+# Micro-benchmarks for ZTDIGS document hashing: the legacy sorted-keys JSON hash versus the canonical
+# encoder (pure Python and, if installed, cbor2) on payloads of realistic sizes.
+# Run from s3dm-mvp/:  python benchmarks/bench_canonical.py [--repeat 5]
+import argparse
+import os
+import sys
+import time
+import timeit
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/s3dm_db") # Never connected to; core only needs it set
+
+from services.ztdigs.core import calculate_data_hash, calculate_entry_hash, HASH_SCHEME_JSON, HASH_SCHEME_CBOR
+from services.ztdigs.canonical import canonical_sha256, cbor2
+
+def small_payload():
+    return {"device_id": "DEV001", "error_code": "E-42", "reported_issue": "AC not cooling", "priority": 2, "remote": False}
+
+def provenance_entry():
+    return {
+        "_id": ObjectId(),
+        "ticket_id": "TKT-2024-000123",
+        "agent_id": "AGT001_Tech",
+        "event_type": "task_completed",
+        "details": "Technician completed the repair and uploaded the service report.",
+        "data_payload": {"repair_status": "Fixed", "device_id": "DEV001", "report_link": "http://report.example.com/1", "parts": ["compressor", "fan"]},
+        "data_hash": "ab" * 32,
+        "hash_scheme": HASH_SCHEME_CBOR,
+        "timestamp": time.time(),
+        "contract_id": str(ObjectId()),
+        "chain_id": "ticket:TKT-2024-000123",
+        "sequence": 42,
+        "previous_log_hash": "cd" * 32,
+        "key_id": "0123456789abcdef",
+        "signature": "ef" * 256
+    }
+
+def contract():
+    return {
+        "ticket_id": "TKT-2024-000123",
+        "parties_involved": [{"agent_id": f"AGT00{i}", "role": role} for i, role in enumerate(["technician", "billing", "logistics"])],
+        "data_elements_allowed": ["device_id", "error_code", "customer_address", "repair_status", "report_link"],
+        "purpose": "for_diagnostics_and_repair",
+        "expiry_timestamp": time.time() + 86400,
+        "jurisdiction_rules_applied": ["GDPR"],
+        "created_at": time.time(),
+        "hash_scheme": HASH_SCHEME_CBOR
+    }
+
+def large_payload(readings: int = 2000):
+    # e.g. a diagnostic telemetry dump attached to a ticket (~100 KB as JSON)
+    return {
+        "device_id": "DEV001",
+        "readings": [{"t": 1700000000.0 + i * 0.5, "temp_c": 20.0 + (i % 37) * 0.25, "ok": i % 11 != 0, "code": f"R{i % 97}"} for i in range(readings)]
+    }
+
+def best_of(stmt, repeat: int) -> float:
+    """Best per-call time in microseconds."""
+    timer = timeit.Timer(stmt)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = {
+        "small payload": small_payload(),
+        "provenance entry": provenance_entry(),
+        "contract": contract(),
+        "large payload": large_payload()
+    }
+    candidates = {
+        "json (legacy)": lambda doc: calculate_data_hash(doc, HASH_SCHEME_JSON),
+        "canonical/python": lambda doc: canonical_sha256(doc, "python")
+    }
+    if cbor2 is not None:
+        candidates["canonical/cbor2"] = lambda doc: canonical_sha256(doc, "cbor2")
+    else:
+        print("cbor2 not installed; skipping the C backend.\n")
+
+    print(f"{'document':<18}" + "".join(f"{name:>20}" for name in candidates))
+    for label, document in documents.items():
+        if label == "provenance entry":
+            # Chain links hash the stored entry, which still carries its ObjectId
+            row = {"json (legacy)": best_of(lambda: calculate_entry_hash(dict(document, hash_scheme=HASH_SCHEME_JSON)), args.repeat)}
+            row.update({name: best_of(lambda fn=fn: fn({k: v for k, v in document.items() if k != "_id"}), args.repeat) for name, fn in candidates.items() if name != "json (legacy)"})
+        else:
+            row = {name: best_of(lambda fn=fn: fn(document), args.repeat) for name, fn in candidates.items()}
+        print(f"{label:<18}" + "".join(f"{row[name]:>17.1f} us" for name in candidates))
+
+if __name__ == "__main__":
+    main()
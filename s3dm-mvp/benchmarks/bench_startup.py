@@ -0,0 +1,84 @@
+# benchmarks/bench_startup.py
+# Cold start of the monolith: the time to import main (in a fresh interpreter) and, for each
+# S3DM_STARTUP_MODE, the time from spawning uvicorn to the first served request and to being warmed up.
+# Needs MongoDB at MONGO_URI (eager startup fails without it; warmup and lazy serve anyway).
+# Run from s3dm-mvp/:  python benchmarks/bench_startup.py [--repeat 5] [--modes eager,warmup,lazy]
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/s3dm_db") # Inherited by the servers; set MONGO_URI to benchmark against another server
+
+def import_time(module: str) -> float:
+    """Seconds to import module in a fresh interpreter (interpreter startup excluded)."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def get(url: str):
+    """(status, JSON body) of a GET, or None while nothing is listening."""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+def cold_start(mode: str, timeout: float = 60.0):
+    """(seconds to first response, seconds to warmed up, warmup report) for one uvicorn start."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/health/startup"
+    env = dict(os.environ, S3DM_STARTUP_MODE=mode, S3DM_SEED_SAMPLE_AGENTS="false", LLOS_SAMPLER_AUTOSTART="false")
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_response = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode} during {mode} startup (is MongoDB running?)")
+            result = get(url)
+            if result is not None:
+                first_response = first_response or time.perf_counter() - start
+                if result[1]["ready"]:
+                    return first_response, time.perf_counter() - start, result[1]
+            time.sleep(0.01)
+        raise RuntimeError(f"{mode} startup did not finish within {timeout:.0f} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modes", default="eager,warmup,lazy")
+    args = parser.parse_args()
+
+    print("Import time (median, fresh interpreter):")
+    for module in ("fastapi", "pymongo", "services.ztdigs.core", "main"):
+        print(f"  {module:<28}{statistics.median(import_time(module) for _ in range(args.repeat)) * 1000:>10.0f} ms")
+
+    print("\nCold start with uvicorn (median):")
+    print(f"  {'mode':<10}{'first request':>16}{'warmed up':>14}   slowest warmup tasks")
+    for mode in args.modes.split(","):
+        runs = [cold_start(mode) for _ in range(args.repeat)]
+        tasks = sorted(runs[-1][2]["tasks"].items(), key=lambda item: -item[1].get("duration_ms", 0))[:3]
+        slowest = ", ".join(f"{name} {task['duration_ms']:.0f} ms" for name, task in tasks)
+        print(f"  {mode:<10}{statistics.median(r[0] for r in runs) * 1000:>13.0f} ms{statistics.median(r[1] for r in runs) * 1000:>11.0f} ms   {slowest}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,11 @@
 # app/db.py
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-from dotenv import load_dotenv # Used to load environment variables from .env
+import services # Loads environment variables from the central .env file at the project root (services/__init__.py)
 import os
+import threading
 from typing import Optional
 
-# Load environment variables from the central .env file at the project root.
-# This ensures that MONGO_URI is available.
-load_dotenv() 
-
 # Retrieve MONGO_URI from environment variables.
 # This variable should be set in your .env file in the s3dm-mvp/ directory.
 MONGO_URI = os.getenv("MONGO_URI")
@@ -21,6 +18,7 @@ if not MONGO_URI:
 # This allows the connection to be reused across different parts of your application
 # without creating a new connection for every database operation.
 _mongo_client: Optional[MongoClient] = None
+_mongo_client_lock = threading.Lock() # Startup warmup tasks may ask for the client from several threads at once
 
 def get_mongo_db_connection():
     """
@@ -30,19 +28,22 @@ def get_mongo_db_connection():
     """
     global _mongo_client
     if _mongo_client is None:
-        try:
-            # Attempt to create a new MongoClient instance
-            _mongo_client = MongoClient(MONGO_URI)
-            
-            # The 'ismaster' or 'ping' command is a lightweight way to check if
-            # the MongoDB server is reachable and authenticable.
-            _mongo_client.admin.command('ping')
-            print("DB: MongoDB connection successful!")
-        except ConnectionFailure as e:
-            # If connection fails, print an error and re-raise the exception
-            # so the calling part of the application can handle it.
-            print(f"DB: MongoDB connection failed: {e}")
-            raise ConnectionFailure(f"Database connection error: {e}")
+        with _mongo_client_lock:
+            if _mongo_client is None:
+                try:
+                    # Attempt to create a new MongoClient instance
+                    new_client = MongoClient(MONGO_URI)
+
+                    # The 'ismaster' or 'ping' command is a lightweight way to check if
+                    # the MongoDB server is reachable and authenticable.
+                    new_client.admin.command('ping')
+                    _mongo_client = new_client # Published only once it is known to work
+                    print("DB: MongoDB connection successful!")
+                except ConnectionFailure as e:
+                    # If connection fails, print an error and re-raise the exception
+                    # so the calling part of the application can handle it.
+                    print(f"DB: MongoDB connection failed: {e}")
+                    raise ConnectionFailure(f"Database connection error: {e}")
     
     # Extract the database name from the MONGO_URI.
     # This handles both standard URIs (mongodb://host:port/dbname)
@@ -1,18 +1,53 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Body, Query, status
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Depends, Header, status
+from fastapi.responses import Response, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 import os
 import time
+import asyncio
+import importlib
 
 # Import all logic modules
 from db.db import  close_mongo_db_connection, get_mongo_db_connection
-from services.gars.gars_core import register_agent, query_agents, get_all_capabilities, add_sample_agents
+from services.gars.gars_core import get_mongo_db_connection as get_gars_db, register_agent, query_agents, get_all_capabilities, add_sample_agents, backfill_agent_fields
 from services.issue_mapping_agent.map_issue import map_issue as map_issue_llm
-from services.ztdigs.core import generate_and_store_contract, get_data_contract, log_provenance_event, verify_provenance_chain, check_duplicate_claim, create_data_contract_doc, create_provenance_log_entry_data
-# from services. import submit_feedback_db, get_observability_metrics_db, get_agent_trust_scores_db
-from services.rsps.main  import plan_and_submit_ticket # The main integrated planning function
+from services.ztdigs.core import generate_and_store_contract, get_data_contract, log_provenance_event, log_provenance_events_batch, LOG_BATCH_MAX_EVENTS, verify_provenance_chain, check_duplicate_claim, create_data_contract_doc, create_provenance_log_entry_data, get_provenance_inclusion_proof, seal_pending_merkle_block, SIGNING_MODE, MERKLE_SEAL_INTERVAL_SECONDS, anchor_chain_heads, chain_id_for_ticket, get_ticket_provenance_page, verify_ticket_provenance, TICKET_TIMELINE_MAX_LIMIT, CHAIN_MODE, CHAIN_ANCHOR_INTERVAL_SECONDS, bootstrap_claim_window, archive_provenance_entries, ARCHIVE_INTERVAL_SECONDS, sweep_expired_contracts, CONTRACT_SWEEP_INTERVAL_SECONDS
+from services.ztdigs.contract_cache import contract_cache
+from services.ztdigs.policy import policy_cache
+from services.ztdigs.claim_window import claim_window
+from services.ztdigs.core import get_mongo_db_connection as get_ztdigs_db
+from services.ztdigs.signers import get_active_signer
+from services.ztdigs.verify_jobs import start_verification_job, get_verification_job, VERIFY_MAX_WORKERS
+from services.rsps.main  import plan_and_submit_ticket, get_mongo_db_connection as get_rsps_db # The main integrated planning function
+from services.rsps.idempotency import ticket_submissions, idempotency_key_for, request_fingerprint, IdempotencyConflict, IdempotencyPending, IDEMPOTENCY_HEADER
+from services.rsps.workflows import workflow_templates
+from services.rsps.tickets import list_tickets, get_ticket, TICKET_PAGE_DEFAULT_LIMIT, TICKET_PAGE_MAX_LIMIT
+from services.rsps.events import ticket_events, ticket_event, format_sse, StreamLimitReached, STREAM_HEARTBEAT_SECONDS
+from services.rsps.runtime import apply_step_event, load_step_deadlines, step_timers, STEP_TIMEOUTS_ENABLED, STEP_EVENTS
+from services.rsps.admission import ticket_admission, normalize_severity, preclassify_severity, AdmissionRejected
+from services.cluster import CLUSTER_MODE
+from services.cluster.leader import leader, LEADER_RENEW_SECONDS
+from services.cluster.invalidation import invalidation_bus
+from services.warmup import warmup, STARTUP_MODE, SEED_SAMPLE_AGENTS
+from services.llos.metrics import install_mongo_listener, observe_request, render_metrics, registry as metrics_registry, PROMETHEUS_CONTENT_TYPE
+from services.llos.feedback import submit_feedback_batch, apply_pending_feedback, get_agent_trust_scores, FEEDBACK_BATCH_MAX, TRUST_APPLY_INTERVAL_SECONDS
+from services.llos.profiling import request_profiler, profiled_to_thread, stack_sampler, admin_token_valid, profile_to_text, profile_to_pstats, PROFILE_HEADER, ADMIN_TOKEN, ADMIN_TOKEN_HEADER, SAMPLER_AUTOSTART
+from services.llos.rollups import get_rollups, get_rollup_totals, rebuild_rollups, ROLLUP_MAX_HOURS
+from services.llos.tracing import install_mongo_tracer, start_trace, list_recent_traces, get_recent_trace, trace_to_tree, trace_to_otlp, TRACE_BUFFER_SIZE
+
+# Time and trace MongoDB reads and writes (only affects clients created from here on, i.e. all of them)
+install_mongo_listener()
+install_mongo_tracer()
+metrics_registry.register_stats_source("ztdigs_contracts", contract_cache.stats)
+metrics_registry.register_stats_source("ztdigs_policies", policy_cache.stats)
+metrics_registry.register_stats_source("ztdigs_claim_window", claim_window.stats)
+metrics_registry.register_stats_source("rsps_idempotency", ticket_submissions.stats)
+metrics_registry.register_stats_source("rsps_admission", ticket_admission.stats)
+metrics_registry.register_stats_source("rsps_step_timers", step_timers.stats)
+metrics_registry.register_stats_source("rsps_ticket_streams", ticket_events.stats)
 
 
 app = FastAPI(
@@ -20,23 +55,187 @@ app = FastAPI(
     description="Centralized API for Smart Home Device Maintenance (Fellowship of the Cogs).",
     version="1.0.0"
 )
-app.mount("/ui", StaticFiles(directory="services/ui-ds/cisc/build", html=True), name="static_ui")
+UI_BUILD_DIR = "services/ui-ds/cisc/build"
+if os.path.isdir(UI_BUILD_DIR):
+    app.mount("/ui", StaticFiles(directory=UI_BUILD_DIR, html=True), name="static_ui")
+else:
+    print(f"App: {UI_BUILD_DIR} not found, /ui is not served (run npm run build in services/ui-ds/cisc).")
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    with start_trace(f"{request.method} {request.url.path}", **{"http.method": request.method, "http.target": request.url.path}) as root_span:
+        profile = request_profiler.start(request.headers.get(PROFILE_HEADER)) # None unless this request is profiled
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            if root_span is not None:
+                response.headers["X-Trace-Id"] = root_span.trace.trace_id
+            if profile is not None:
+                response.headers["X-Profile-Id"] = profile.profile_id
+            return response
+        finally:
+            route = request.scope.get("route") # Route template, so /tickets/{id} is one series
+            route_path = route.path if route else "unmatched"
+            if profile is not None:
+                request_profiler.finish(profile, request.method, route_path, status_code, root_span.trace.trace_id if root_span is not None else None)
+            observe_request(request.method, route_path, status_code, time.perf_counter() - start)
+            if root_span is not None:
+                root_span.name = f"{request.method} {route_path}"
+                root_span.attributes.update({"http.route": route_path, "http.status_code": status_code})
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin endpoints are disabled (S3DM_ADMIN_TOKEN is not set).")
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Missing or invalid {ADMIN_TOKEN_HEADER} header.")
 
 # --- Application Lifecycle Events ---
 @app.on_event("startup")
 async def startup_event():
-    print("App: Starting up S3DM Monolith...")
-    # Initialize DB connection
-    get_mongo_db_connection()
-    # Add sample agents to GARS (will only add if not present)
-    add_sample_agents()
+    print(f"App: Starting up S3DM Monolith ({STARTUP_MODE} startup)...")
+    if CLUSTER_MODE == "multi":
+        asyncio.create_task(leader_lease_loop())
+    # Receive cache invalidations from the other workers
+    invalidation_bus.start()
+    # Reassign or escalate workflow steps that miss their deadlines
+    if STEP_TIMEOUTS_ENABLED:
+        step_timers.start()
+    # Subsystems initialize on first use; warmup does it up front, in parallel, so early requests don't pay for it
+    add_warmup_tasks()
+    if STARTUP_MODE == "eager":
+        await warmup.run(raise_errors=True)
+    elif STARTUP_MODE == "warmup":
+        warmup.start_background()
+    elif STEP_TIMEOUTS_ENABLED:
+        # Lazy startup runs no warmup, but steps that were running before the restart still need their timers
+        asyncio.create_task(asyncio.to_thread(elect_leader_and_load_deadlines))
+    # Periodically seal partially filled Merkle blocks so entries don't stay unsigned
+    if SIGNING_MODE == "merkle":
+        asyncio.create_task(merkle_sealer_loop())
+    # Periodically commit to all chain heads when events are spread over several chains
+    if CHAIN_MODE != "global":
+        asyncio.create_task(chain_anchor_loop())
+    # Periodically move old, finished chain ranges into cold archive segments
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        asyncio.create_task(provenance_archive_loop())
+    # Opt-in stack sampling from startup (it can also be started at runtime via /llos/profiler/sampler/start)
+    if SAMPLER_AUTOSTART:
+        stack_sampler.start()
+    # Periodically fold new feedback into agent trust scores
+    if TRUST_APPLY_INTERVAL_SECONDS > 0:
+        asyncio.create_task(trust_score_loop())
+    # Periodically archive and delete expired data contracts
+    if CONTRACT_SWEEP_INTERVAL_SECONDS > 0:
+        asyncio.create_task(contract_sweeper_loop())
     # Initialize LLM (downloads model if not present)
     # get_llm_generator()
     print("App: S3DM Monolith started.")
 
+def add_warmup_tasks():
+    # Connect every service's MongoDB client (each module keeps its own)
+    warmup.add("mongo", get_mongo_db_connection)
+    warmup.add("gars_mongo", get_gars_db)
+    warmup.add("rsps_mongo", get_rsps_db)
+    warmup.add("ztdigs_mongo", get_ztdigs_db)
+    # With several workers, one-off startup tasks and the background loops below run on the leader only
+    warmup.add("leader", elect_leader_and_seed)
+    # Load recent claim events so duplicate checks are answered in memory
+    warmup.add("claim_window", bootstrap_claim_window)
+    # Load (or, without a configured key, generate) the ZTDIGS signing key
+    warmup.add("signing_key", get_active_signer)
+    # The LLM HTTP client is imported on first use
+    warmup.add("llm_client", lambda: importlib.import_module("httpx"))
+
+def elect_leader_and_seed():
+    if not leader.renew(get_mongo_db_connection()):
+        return
+    # Agents stored before created_at/cost were recorded would fail AgentOutput validation
+    backfill_agent_fields()
+    if SEED_SAMPLE_AGENTS:
+        # Add sample agents to GARS (will only add if not present)
+        add_sample_agents()
+    if STEP_TIMEOUTS_ENABLED:
+        # Deadlines of steps started before this (or another) worker restarted
+        load_step_deadlines(get_rsps_db())
+
+def elect_leader_and_load_deadlines():
+    try:
+        if leader.renew(get_mongo_db_connection()):
+            load_step_deadlines(get_rsps_db())
+    except Exception as e:
+        print(f"App: Loading step deadlines failed: {e}")
+
+async def leader_lease_loop():
+    while True:
+        await asyncio.sleep(LEADER_RENEW_SECONDS)
+        was_leader = leader.is_leader
+        if await asyncio.to_thread(leader.renew, get_mongo_db_connection()) and not was_leader and STEP_TIMEOUTS_ENABLED:
+            # Took over the lease: the previous leader's step deadlines are this worker's to enforce now
+            try:
+                await asyncio.to_thread(load_step_deadlines, get_rsps_db())
+            except Exception as e:
+                print(f"App: Loading step deadlines failed: {e}")
+
+async def merkle_sealer_loop():
+    while True:
+        await asyncio.sleep(MERKLE_SEAL_INTERVAL_SECONDS)
+        if not leader.is_leader:
+            continue
+        try:
+            while await asyncio.to_thread(seal_pending_merkle_block, True):
+                pass
+        except Exception as e:
+            print(f"App: Merkle block sealing failed: {e}")
+
+async def chain_anchor_loop():
+    while True:
+        await asyncio.sleep(CHAIN_ANCHOR_INTERVAL_SECONDS)
+        if not leader.is_leader:
+            continue
+        try:
+            await asyncio.to_thread(anchor_chain_heads)
+        except Exception as e:
+            print(f"App: Chain head anchoring failed: {e}")
+
+async def provenance_archive_loop():
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+        if not leader.is_leader:
+            continue
+        try:
+            await asyncio.to_thread(archive_provenance_entries)
+        except Exception as e:
+            print(f"App: Provenance archiving failed: {e}")
+
+async def trust_score_loop():
+    while True:
+        await asyncio.sleep(TRUST_APPLY_INTERVAL_SECONDS)
+        if not leader.is_leader:
+            continue
+        try:
+            await asyncio.to_thread(apply_pending_feedback, get_mongo_db_connection())
+        except Exception as e:
+            print(f"App: Applying feedback to trust scores failed: {e}")
+
+async def contract_sweeper_loop():
+    while True:
+        await asyncio.sleep(CONTRACT_SWEEP_INTERVAL_SECONDS)
+        if not leader.is_leader:
+            continue
+        try:
+            await asyncio.to_thread(sweep_expired_contracts)
+        except Exception as e:
+            print(f"App: Contract expiry sweep failed: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     print("App: Shutting down S3DM Monolith...")
+    stack_sampler.stop()
+    step_timers.stop()
+    invalidation_bus.stop()
+    leader.resign(get_mongo_db_connection())
     close_mongo_db_connection()
     print("App: S3DM Monolith shut down.")
 
@@ -60,9 +259,9 @@ class AgentOutput(BaseModel):
     jurisdiction_country: str
     jurisdiction_city: str
     cost: int
-    trust_score: int
+    trust_score: float # EWMA of customer feedback (1-10), see services.llos.feedback
     active: int
-    compliant_regions: List[str]
+    compliant_regions: List[str] = Field(default_factory=list) # Absent on agents registered before regions were recorded
     created_at: float
 
     class Config:
@@ -95,6 +294,8 @@ class DataContractOutput(DataContractInput):
     id: str = Field(..., alias="_id")
     policy_hash: str
     created_at: float
+    hash_scheme: Optional[str] = None # Absent on contracts hashed before hash schemes were recorded
+    expires_at: Optional[datetime] = None # TTL backstop (expiry plus grace period), not part of policy_hash
 
     class Config:
         populate_by_name = True
@@ -113,39 +314,87 @@ class ProvenanceLogOutput(ProvenanceLogInput):
     id: str = Field(..., alias="_id")
     timestamp: float
     previous_log_hash: Optional[str] = None
-    signature: str
+    hash_scheme: Optional[str] = None
+    signature: Optional[str] = None # None for Merkle-batched entries until their block is sealed
+    key_id: Optional[str] = None # Signing key used for this entry
+    signing_mode: Optional[str] = None
+    chain_id: Optional[str] = None
+    sequence: Optional[int] = None
+    duplicate_claim_suspected: Optional[bool] = None
+    block_index: Optional[int] = None
+    leaf_index: Optional[int] = None
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
         json_encoders = {object: str}
 
-# Removed LLOS Models
-# class FeedbackInput(BaseModel):
-#     ticket_id: str
-#     rating: int = Field(..., ge=1, le=5)
-#     comments: Optional[str] = None
-#     fraud_flag: bool = False
+class ProvenanceLogBatchInput(BaseModel):
+    events: List[ProvenanceLogInput] = Field(..., min_length=1)
+
+class ProvenanceLogBatchResult(BaseModel):
+    index: int
+    status: str # "logged", "rejected" (invalid event) or "failed" (could not be written; safe to resubmit)
+    entry: Optional[ProvenanceLogOutput] = None
+    error: Optional[str] = None
+
+class ProvenanceLogBatchOutput(BaseModel):
+    results: List[ProvenanceLogBatchResult]
+    logged_count: int
+    rejected_count: int
+    failed_count: int = 0
 
-# class FeedbackOutput(FeedbackInput):
-#     id: str = Field(..., alias="_id")
-#     timestamp: float
+class ProvenanceTimelineOutput(BaseModel):
+    ticket_id: str
+    entries: List[ProvenanceLogOutput]
+    next_cursor: Optional[str] = None # Pass as cursor to fetch the next page; None on the last page
+    verification: Optional[Dict[str, Any]] = None # Result of verifying the ticket's slice of the chain, if requested
+
+# LLOS Models
+class FeedbackInput(BaseModel):
+    ticket_id: str
+    rating: int = Field(..., ge=1, le=5)
+    comments: Optional[str] = None
+    fraud_flag: bool = False
+    agent_id: Optional[str] = None # Credit one assigned agent only (default: every agent assigned to the ticket)
 
-#     class Config:
-#         populate_by_name = True
-#         arbitrary_types_allowed = True
-#         json_encoders = {ObjectId: str}
+class FeedbackOutput(FeedbackInput):
+    id: str = Field(..., alias="_id")
+    timestamp: float
+    agent_ids: List[str] = Field(default_factory=list) # Agents whose trust scores this feedback will update
+
+    class Config:
+        populate_by_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {object: str}
+
+class FeedbackBatchInput(BaseModel):
+    items: List[FeedbackInput] = Field(..., min_length=1)
+
+class FeedbackBatchResult(BaseModel):
+    index: int
+    status: str # "accepted" or "rejected"
+    feedback: Optional[FeedbackOutput] = None
+    error: Optional[str] = None
+
+class FeedbackBatchOutput(BaseModel):
+    results: List[FeedbackBatchResult]
+    accepted_count: int
+    rejected_count: int
 
 class ObservabilityMetricsOutput(BaseModel):
     total_tickets: int = 0  # Defaulting for now as actual metrics might come from ZTDIGS directly
     avg_csat_score: float = 0.0
     fraud_flags_count: int = 0
+    caches: Dict[str, Dict[str, Any]] = Field(default_factory=dict) # In-process cache statistics (per worker)
 
-# Removed AgentTrustScoreOutput
-# class AgentTrustScoreOutput(BaseModel):
-#     agent_id: str
-#     agent_name: str
-#     trust_score: float
+class AgentTrustScoreOutput(BaseModel):
+    agent_id: str
+    agent_name: str
+    trust_score: float
+    feedback_count: int = 0
+    fraud_flag_count: int = 0
+    trust_updated_at: Optional[float] = None
 
 # RSPS Models (for ticket submission)
 class CustomerConstraintsInput(BaseModel):
@@ -155,10 +404,15 @@ class CustomerConstraintsInput(BaseModel):
 
 class TicketSubmissionInput(BaseModel):
     user_message: str
+    user_id: Optional[str] = None
+    severity: Optional[str] = None # Priority hint for admission control (critical, high, medium, low)
     user_location: str = "Bengaluru, India"
     customer_constraints: Optional[Dict[str, Any]] = None
     
 class WorkflowStepOutput(BaseModel):
+    step_id: Optional[str] = None # Absent on tickets planned before workflow templates were DAGs
+    depends_on: List[str] = Field(default_factory=list)
+    estimated_minutes: Optional[float] = None
     task_name: str
     capability: str
     description: str
@@ -167,10 +421,15 @@ class WorkflowStepOutput(BaseModel):
     assigned_agent_name: Optional[str] = None
     start_time: Optional[float] = None
     end_time: Optional[float] = None
+    deadline_at: Optional[float] = None
+    acknowledged_at: Optional[float] = None
+    reassignments: int = 0
+    escalated_at: Optional[float] = None
     contract_id: Optional[str] = None
 
 class TicketSubmissionOutput(BaseModel):
     id: str = Field(..., alias="_id")
+    user_id: Optional[str] = None
     original_user_message: str
     issue_type: str
     device_type: str
@@ -178,8 +437,14 @@ class TicketSubmissionOutput(BaseModel):
     user_location: str
     status: str
     planned_workflow: List[WorkflowStepOutput]
-    current_step_index: int
+    current_step_index: int # Number of leading completed steps (steps are in dependency order)
+    workflow_revision: int = 0 # Bumped on every workflow change; ticket stream events carry it too
     created_at: float
+    updated_at: Optional[float] = None
+    template_version: Optional[int] = None
+    critical_path: Optional[List[str]] = None # step_ids of the longest chain of dependent steps
+    estimated_completion_at: Optional[float] = None
+    resolved_at: Optional[float] = None
     customer_constraints: Optional[Dict[str, Any]] = None
     total_planned_cost: Optional[float] = None
     total_hops: Optional[int] = None
@@ -189,6 +454,53 @@ class TicketSubmissionOutput(BaseModel):
         object = True
         json_encoders = {object: str}
 
+class TicketSummaryOutput(BaseModel):
+    id: str = Field(..., alias="_id")
+    user_id: Optional[str] = None
+    original_user_message: str
+    issue_type: str
+    device_type: str
+    severity: str
+    user_location: str
+    status: str
+    current_step_index: int = 0
+    created_at: float
+    updated_at: Optional[float] = None
+    estimated_completion_at: Optional[float] = None
+    resolved_at: Optional[float] = None
+
+    class Config:
+        populate_by_name = True
+
+class TicketPageOutput(BaseModel):
+    tickets: List[TicketSummaryOutput]
+    next_cursor: Optional[str] = None # Pass back as cursor for the next (older) page
+
+class StepEventInput(BaseModel):
+    event: str = Field(..., pattern=f"^({'|'.join(STEP_EVENTS)})$")
+    agent_id: Optional[str] = None # When given, must be the step's assigned agent
+    details: Optional[str] = None
+
+class WorkflowTemplateStepInput(BaseModel):
+    step_id: str
+    task_name: str
+    capability: str
+    description: str = ""
+    estimated_minutes: float = Field(0, ge=0)
+    depends_on: List[str] = Field(default_factory=list)
+
+class WorkflowTemplateInput(BaseModel):
+    steps: List[WorkflowTemplateStepInput]
+
+class WorkflowTemplateOutput(BaseModel):
+    issue_type: str = Field(..., alias="_id")
+    steps: List[WorkflowTemplateStepInput]
+    version: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        populate_by_name = True
+
 # --- Health Check ---
 # @app.get("/health", summary="Overall API Health Check")
 # async def health_check():
@@ -245,7 +557,7 @@ async def map_issue_api(input: UserMessageInput):
 @app.post("/ztdigs/contracts/generate", response_model=DataContractOutput, summary="Generate and store a new data-sharing contract")
 async def generate_contract_api(contract_data_input: DataContractInput):
     try:
-        new_contract = generate_and_store_contract(contract_data_input.model_dump())
+        new_contract = generate_and_store_contract(create_data_contract_doc(**contract_data_input.model_dump())) # Adds created_at and policy_hash
         return DataContractOutput(**new_contract)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to generate contract: {e}")
@@ -276,13 +588,127 @@ async def log_provenance_api(log_input: ProvenanceLogInput):
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to log provenance: {e}")
 
-@app.get("/ztdigs/provenance/verify", response_model=Dict[str, Any], summary="Verify the integrity of the entire provenance chain")
-async def verify_provenance_api():
+@app.post("/ztdigs/provenance/log_batch", response_model=ProvenanceLogBatchOutput, summary="Log an ordered batch of events to the provenance chain in one round trip")
+async def log_provenance_batch_api(batch_input: ProvenanceLogBatchInput, response: Response):
+    if len(batch_input.events) > LOG_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Batch exceeds the maximum of {LOG_BATCH_MAX_EVENTS} events.")
     try:
-        return verify_provenance_chain()
+        events = [
+            create_provenance_log_entry_data(
+                ticket_id=log_input.ticket_id,
+                agent_id=log_input.agent_id,
+                event_type=log_input.event_type,
+                details=log_input.details,
+                data_payload=log_input.data_payload,
+                contract_id=log_input.contract_id
+            )
+            for log_input in batch_input.events
+        ]
+        # Rejected events are reported per item; the rest of the batch is still logged
+        results = await profiled_to_thread(log_provenance_events_batch, events)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to log provenance batch: {e}")
+    counts = {result_status: sum(1 for result in results if result["status"] == result_status) for result_status in ("logged", "rejected", "failed")}
+    if counts["failed"]:
+        response.status_code = status.HTTP_207_MULTI_STATUS # Part of the batch was written; see the per-event results
+    return ProvenanceLogBatchOutput(
+        results=[ProvenanceLogBatchResult(**result) for result in results],
+        logged_count=counts["logged"],
+        rejected_count=counts["rejected"],
+        failed_count=counts["failed"]
+    )
+
+@app.get("/ztdigs/provenance/verify", response_model=Dict[str, Any], summary="Verify the integrity of the provenance chain(s)")
+async def verify_provenance_api(
+    ticket_id: Optional[str] = Query(None, description="Only verify the chain holding this ticket's events (all chains if omitted).")
+):
+    try:
+        return verify_provenance_chain(chain_id_for_ticket(ticket_id) if ticket_id else None)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to verify provenance: {e}")
 
+@app.get("/ztdigs/provenance/ticket/{ticket_id}", response_model=ProvenanceTimelineOutput, summary="Get the provenance timeline of one ticket")
+async def get_ticket_provenance_api(
+    ticket_id: str,
+    limit: int = Query(50, ge=1, le=TICKET_TIMELINE_MAX_LIMIT, description="Maximum number of entries per page."),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+    event_type: Optional[str] = Query(None, description="Only return events of this type."),
+    verify: bool = Query(False, description="Also verify this ticket's slice of the provenance chain.")
+):
+    try:
+        page = await profiled_to_thread(get_ticket_provenance_page, ticket_id, limit, cursor, event_type)
+        verification = await profiled_to_thread(verify_ticket_provenance, ticket_id) if verify else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Provenance timeline error: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to retrieve provenance timeline: {e}")
+    return ProvenanceTimelineOutput(
+        ticket_id=ticket_id,
+        entries=[ProvenanceLogOutput(**entry) for entry in page["entries"]],
+        next_cursor=page["next_cursor"],
+        verification=verification
+    )
+
+@app.post("/ztdigs/provenance/anchor", response_model=Dict[str, Any], summary="Sign a global anchor over the current head of every provenance chain", dependencies=[Depends(require_admin_token)])
+async def anchor_chain_heads_api():
+    try:
+        anchor = await profiled_to_thread(anchor_chain_heads)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to anchor chain heads: {e}")
+    if anchor:
+        return anchor
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Nothing to anchor (empty log or concurrent anchor).")
+
+@app.post("/ztdigs/provenance/archive", response_model=Dict[str, Any], summary="Move old, finished provenance chain ranges into cold archive segments", dependencies=[Depends(require_admin_token)])
+async def archive_provenance_api():
+    try:
+        segments = await profiled_to_thread(archive_provenance_entries)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to archive provenance entries: {e}")
+    return {
+        "segments_written": len(segments),
+        "entries_archived": sum(segment["entry_count"] for segment in segments),
+        "segments": [{key: segment[key] for key in ("id", "segment_index", "file", "entry_count", "content_sha256")} for segment in segments]
+    }
+
+@app.post("/ztdigs/contracts/sweep", response_model=Dict[str, int], summary="Archive and delete expired data contracts", dependencies=[Depends(require_admin_token)])
+async def sweep_expired_contracts_api():
+    try:
+        return await profiled_to_thread(sweep_expired_contracts)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to sweep expired contracts: {e}")
+
+@app.post("/ztdigs/provenance/verify/jobs", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED, summary="Start a background parallel verification of the provenance chain", dependencies=[Depends(require_admin_token)])
+async def start_verification_job_api(
+    workers: Optional[int] = Query(None, ge=1, le=VERIFY_MAX_WORKERS, description="Worker processes to use (defaults to ZTDIGS_VERIFY_WORKERS / CPU count)."),
+    chunk_size: Optional[int] = Query(None, ge=1, description="Entries per verified range (defaults to ZTDIGS_VERIFY_CHUNK_SIZE).")
+):
+    try:
+        return start_verification_job(workers, chunk_size)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to start verification job: {e}")
+
+@app.get("/ztdigs/provenance/verify/jobs/{job_id}", response_model=Dict[str, Any], summary="Get progress and result of a provenance verification job")
+async def get_verification_job_api(job_id: str):
+    job = get_verification_job(job_id)
+    if job:
+        return job
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Verification job not found.")
+
+@app.get("/ztdigs/provenance/proof/{entry_id}", response_model=Dict[str, Any], summary="Get a Merkle inclusion proof for a provenance entry")
+async def get_inclusion_proof_api(entry_id: str):
+    try:
+        proof = get_provenance_inclusion_proof(entry_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to build inclusion proof: {e}")
+    if proof:
+        return proof
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Provenance entry not found.")
+
 @app.get("/ztdigs/claims/check_duplicate", response_model=Dict[str, Any], summary="Check for duplicate claims (e.g., invoices) for a ticket")
 async def check_duplicate_claim_api(
     ticket_id: str = Query(..., description="Ticket ID to check for duplicates."),
@@ -294,64 +720,316 @@ async def check_duplicate_claim_api(
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to check duplicate claims: {e}")
 
-# Removed LLOS Endpoints
-# @app.post("/llos/feedback", response_model=FeedbackOutput, summary="Submit customer feedback for a ticket")
-# async def submit_feedback_api(feedback_data: FeedbackInput):
-#     try:
-#         new_feedback = submit_feedback_db(feedback_data.model_dump())
-#         return FeedbackOutput(**new_feedback)
-#     except Exception as e:
-#         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to submit feedback: {e}")
+# --- LLOS Endpoints ---
+@app.post("/llos/feedback", response_model=FeedbackOutput, summary="Submit customer feedback for a ticket")
+async def submit_feedback_api(feedback_data: FeedbackInput):
+    try:
+        result = (await profiled_to_thread(submit_feedback_batch, get_mongo_db_connection(), [feedback_data.model_dump()]))[0]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to submit feedback: {e}")
+    if result["status"] == "rejected":
+        error_status = status.HTTP_404_NOT_FOUND if result["error"].endswith("not found.") else status.HTTP_400_BAD_REQUEST
+        raise HTTPException(status_code=error_status, detail=result["error"])
+    return FeedbackOutput(**result["feedback"])
+
+@app.post("/llos/feedback/batch", response_model=FeedbackBatchOutput, summary="Submit ratings and fraud flags for many tickets in one request")
+async def submit_feedback_batch_api(batch_input: FeedbackBatchInput):
+    if len(batch_input.items) > FEEDBACK_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Batch exceeds the maximum of {FEEDBACK_BATCH_MAX} items.")
+    try:
+        # Unknown tickets are reported per item; the rest of the batch is still stored
+        results = await profiled_to_thread(submit_feedback_batch, get_mongo_db_connection(), [item.model_dump() for item in batch_input.items])
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to submit feedback batch: {e}")
+    accepted_count = sum(1 for result in results if result["status"] == "accepted")
+    return FeedbackBatchOutput(
+        results=[FeedbackBatchResult(**result) for result in results],
+        accepted_count=accepted_count,
+        rejected_count=len(results) - accepted_count
+    )
+
+@app.post("/llos/trust_scores/apply", response_model=Dict[str, int], summary="Fold pending feedback into agent trust scores now", dependencies=[Depends(require_admin_token)])
+async def apply_trust_scores_api():
+    try:
+        return await profiled_to_thread(apply_pending_feedback, get_mongo_db_connection())
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to apply feedback to trust scores: {e}")
+
+@app.get("/llos/agents/trust_scores", response_model=List[AgentTrustScoreOutput], summary="Get trust scores for all agents")
+async def get_agent_trust_scores_api():
+    try:
+        return get_agent_trust_scores(get_mongo_db_connection())
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to get agent trust scores: {e}")
+
+@app.get("/metrics", summary="Prometheus metrics: per-stage, MongoDB and request latency histograms, cache statistics")
+async def prometheus_metrics_api():
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/health/startup", response_model=Dict[str, Any], summary="Startup mode and warmup progress with per-task timings (503 until warmed up, for readiness probes)")
+async def startup_health_api(response: Response):
+    startup = warmup.status()
+    if not startup["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return startup
+
+@app.get("/llos/traces", response_model=List[Dict[str, Any]], summary="List recent traces (newest first) from this worker's trace buffer")
+async def list_traces_api(
+    limit: int = Query(50, ge=1, le=TRACE_BUFFER_SIZE),
+    min_duration_ms: float = Query(0.0, ge=0, description="Only traces at least this slow"),
+    name: Optional[str] = Query(None, description="Substring of the root span name, e.g. '/tickets/submit'"),
+    errors_only: bool = Query(False)
+):
+    return list_recent_traces(limit, min_duration_ms, name, errors_only)
+
+@app.get("/llos/traces/{trace_id}", response_model=Dict[str, Any], summary="Get one recent trace as a span tree, or as OTLP/JSON")
+async def get_trace_api(trace_id: str, format: str = Query("tree", pattern="^(tree|otlp)$")):
+    trace = get_recent_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trace not found (not sampled, handled by another worker, or no longer buffered).")
+    return trace_to_otlp(trace) if format == "otlp" else trace_to_tree(trace)
+
+@app.get("/cluster/status", response_model=Dict[str, Any], summary="Cluster mode, this worker's id and leadership, and invalidation broadcast counters", dependencies=[Depends(require_admin_token)])
+async def cluster_status_api():
+    status_info = await profiled_to_thread(leader.status, get_mongo_db_connection())
+    return dict(status_info, invalidations=invalidation_bus.stats())
+
+# --- Profiling Endpoints (admin token required) ---
+@app.get("/llos/profiler", response_model=Dict[str, Any], summary="Profiler status: request profile captures and stack sampler of this worker", dependencies=[Depends(require_admin_token)])
+async def profiler_status_api():
+    return {"request_profiles": request_profiler.stats(), "sampler": stack_sampler.stats()}
+
+@app.get("/llos/profiles", response_model=List[Dict[str, Any]], summary="List recent request profiles (newest first) captured by this worker", dependencies=[Depends(require_admin_token)])
+async def list_profiles_api():
+    return request_profiler.list()
+
+@app.get("/llos/profiles/{profile_id}", summary="Get one request profile as a pstats report, or as a binary .prof file", dependencies=[Depends(require_admin_token)])
+async def get_profile_api(
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|pstats)$"),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls|pcalls|name|filename)$"),
+    limit: int = Query(50, ge=1, le=1000)
+):
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found (captured by another worker, or no longer buffered).")
+    if format == "pstats":
+        return Response(content=profile_to_pstats(profile), media_type="application/octet-stream", headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+    return PlainTextResponse(await profiled_to_thread(profile_to_text, profile, sort, limit))
+
+@app.post("/llos/profiler/sampler/start", response_model=Dict[str, Any], summary="Start the stack sampler", dependencies=[Depends(require_admin_token)])
+async def start_sampler_api(interval_ms: Optional[float] = Query(None, ge=1, le=1000)):
+    started = stack_sampler.start(interval_ms)
+    return dict(stack_sampler.stats(), started=started)
+
+@app.post("/llos/profiler/sampler/stop", response_model=Dict[str, Any], summary="Stop the stack sampler (samples are kept)", dependencies=[Depends(require_admin_token)])
+async def stop_sampler_api(reset: bool = Query(False, description="Also discard the collected samples")):
+    stopped = await profiled_to_thread(stack_sampler.stop)
+    if reset:
+        stack_sampler.reset()
+    return dict(stack_sampler.stats(), stopped=stopped)
+
+@app.get("/llos/profiler/stacks", summary="Sampled stacks aggregated across requests: collapsed (flamegraph.pl, speedscope) or top functions", dependencies=[Depends(require_admin_token)])
+async def get_sampled_stacks_api(
+    format: str = Query("collapsed", pattern="^(collapsed|top)$"),
+    include_idle: bool = Query(False, description="Also include threads waiting in select, locks or queues"),
+    limit: int = Query(30, ge=1, le=500, description="Functions returned by format=top")
+):
+    if format == "top":
+        return {"stats": stack_sampler.stats(), "functions": stack_sampler.top_functions(limit)}
+    return PlainTextResponse(stack_sampler.collapsed(include_idle))
 
 @app.get("/llos/metrics", response_model=ObservabilityMetricsOutput, summary="Get overall system observability metrics (Simplified from ZTDIGS data)")
 async def get_observability_metrics_api():
-    # This endpoint will now rely on data available directly via MongoDB for tickets and provenance
-    # LLOS logic to update agent trust scores etc. is not present in the app/llos_logic.py provided
-    # so we'll just pull simple counts from DB here.
+    # Totals come from the LLOS rollups, maintained as tickets and feedback are written
     try:
         db = get_mongo_db_connection()
         tickets_collection = db["tickets"]
-        
-        # In a full LLOS, feedback would also be here, for now it's not handled.
-        # feedback_collection = db["feedback"] 
-        
-        total_tickets = tickets_collection.count_documents({})
-        
-        # Placeholder for CSAT and fraud flags as LLOS logic is removed
-        # In future, these would come from the full LLOS logic.
-        avg_csat_score = 0.0 
-        fraud_flags_count = 0 
-        
+
+        # Count tickets only if rollups were never built
+        rollup_totals = get_rollup_totals(db) or {}
+        total_tickets = rollup_totals["tickets_created"] if "tickets_created" in rollup_totals else tickets_collection.count_documents({})
+
+        feedback_totals = rollup_totals.get("feedback", {})
+        avg_csat_score = feedback_totals.get("rating_sum", 0) / feedback_totals["ratings"] if feedback_totals.get("ratings") else 0.0
+        fraud_flags_count = feedback_totals.get("fraud_flags", 0)
+
         return ObservabilityMetricsOutput(
             total_tickets=total_tickets,
             avg_csat_score=avg_csat_score,
-            fraud_flags_count=fraud_flags_count
+            fraud_flags_count=fraud_flags_count,
+            caches={"ztdigs_contracts": contract_cache.stats(), "ztdigs_policies": policy_cache.stats(), "ztdigs_claim_window": claim_window.stats()}
         )
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to get metrics: {e}")
 
-# Removed AgentTrustScoreOutput endpoint
-# @app.get("/llos/agents/trust_scores", response_model=List[AgentTrustScoreOutput], summary="Get trust scores for all agents")
-# async def get_agent_trust_scores_api():
-#     try:
-#         return get_agent_trust_scores_db()
-#     except Exception as e:
-#         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to get agent trust scores: {e}")
+@app.get("/llos/rollups", response_model=Dict[str, Any], summary="Hourly ticket rollups (by status, issue type, severity, city, unassigned capability) for a time window")
+async def get_rollups_api(
+    hours: int = Query(24, ge=1, le=ROLLUP_MAX_HOURS, description="Window ending now (ignored if start is given)"),
+    start: Optional[float] = Query(None, description="Window start (Unix timestamp)"),
+    end: Optional[float] = Query(None, description="Window end (Unix timestamp), default now")
+):
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - hours * 3600
+    try:
+        rollups = get_rollups(get_mongo_db_connection(), start, end)
+        rollups["totals"] = get_rollup_totals(get_mongo_db_connection())
+        return rollups
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to get rollups: {e}")
+
+@app.post("/llos/rollups/rebuild", response_model=Dict[str, int], summary="Recompute ticket rollups from the tickets collection", dependencies=[Depends(require_admin_token)])
+async def rebuild_rollups_api():
+    try:
+        return {"tickets_counted": await profiled_to_thread(rebuild_rollups, get_mongo_db_connection())}
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to rebuild rollups: {e}")
+
 
 
 # --- RSPS Endpoint (Main Ticket Submission) ---
 @app.post("/tickets/submit", response_model=TicketSubmissionOutput, summary="Submit a new smart home device repair ticket and plan its workflow")
-async def submit_ticket_api(ticket_input: TicketSubmissionInput):
-    try:
-        # Call the core planning logic
-        # This function internally calls IMA, GARS, ZTDIGS logic
-        planned_ticket = plan_and_submit_ticket(
-            user_message=ticket_input.user_message,
-            user_location=ticket_input.user_location,
-            # customer_constraints=ticket_input.customer_constraints.model_dump() if ticket_input.customer_constraints else {}
-        )
+async def submit_ticket_api(ticket_input: TicketSubmissionInput, response: Response, idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)):
+    try:
+        # Retries (with the same Idempotency-Key, or from a known user the same content shortly after) get the first request's ticket
+        key = idempotency_key_for(ticket_input.user_id, idempotency_key, ticket_input.user_message, ticket_input.user_location)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Severe tickets are planned first when intake is saturated; the client's severity, else a keyword guess
+    severity = normalize_severity(ticket_input.severity) or preclassify_severity(ticket_input.user_message)
+
+    async def plan_ticket():
+        async with ticket_admission.slot(severity):
+            # Call the core planning logic
+            # This function internally calls IMA, GARS, ZTDIGS logic
+            return await profiled_to_thread(
+                plan_and_submit_ticket,
+                user_message=ticket_input.user_message,
+                user_location=ticket_input.user_location,
+                user_id=ticket_input.user_id
+                # customer_constraints=ticket_input.customer_constraints.model_dump() if ticket_input.customer_constraints else {}
+            )
+
+    try:
+        planned_ticket, replayed = await ticket_submissions.run(key, request_fingerprint(ticket_input.user_message, ticket_input.user_location), plan_ticket)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
         return TicketSubmissionOutput(**planned_ticket)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except IdempotencyPending as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e), headers={"Retry-After": "5"})
     except RuntimeError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred during ticket submission: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred during ticket submission: {e}")
+
+# --- Ticket Read Endpoints ---
+@app.get("/tickets", response_model=TicketPageOutput, summary="List ticket summaries newest first, by user, status and creation time (cursor-paginated)")
+async def list_tickets_api(
+    user_id: Optional[str] = Query(None, description="Only this user's tickets (required without the admin token)."),
+    ticket_status: Optional[str] = Query(None, alias="status", description="Only tickets with this status."),
+    start: Optional[float] = Query(None, description="Created at or after (Unix timestamp)."),
+    end: Optional[float] = Query(None, description="Created before (Unix timestamp)."),
+    limit: int = Query(TICKET_PAGE_DEFAULT_LIMIT, ge=1, le=TICKET_PAGE_MAX_LIMIT, description="Maximum number of tickets per page."),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+    x_admin_token: Optional[str] = Header(None)
+):
+    if user_id is None:
+        await require_admin_token(x_admin_token) # Only operators may list every customer's tickets
+    try:
+        page = await profiled_to_thread(list_tickets, get_rsps_db(), user_id, ticket_status, start, end, limit, cursor)
+        return TicketPageOutput(tickets=[TicketSummaryOutput(**ticket) for ticket in page["tickets"]], next_cursor=page["next_cursor"])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to list tickets: {e}")
+
+@app.get("/tickets/stream", summary="Stream status and workflow step changes of one ticket or of one user's tickets (server-sent events)")
+async def stream_tickets_api(
+    request: Request,
+    ticket_id: Optional[str] = Query(None, description="Follow this ticket (the stream starts with its current state)."),
+    user_id: Optional[str] = Query(None, description="Follow all of this user's tickets, including new ones.")
+):
+    # Subscribe before reading the ticket, so no change between the two is missed
+    try:
+        subscription = ticket_events.subscribe(ticket_id=ticket_id, user_id=user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except StreamLimitReached as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "5"})
+    try:
+        first_event = ("ticket", ticket_event(await profiled_to_thread(get_ticket, get_rsps_db(), ticket_id))) if ticket_id else ("ready", {"user_id": user_id})
+    except ValueError as e:
+        ticket_events.unsubscribe(subscription)
+        code = status.HTTP_404_NOT_FOUND if str(e).endswith("not found.") else status.HTTP_400_BAD_REQUEST
+        raise HTTPException(status_code=code, detail=str(e))
+    except Exception as e:
+        ticket_events.unsubscribe(subscription)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to open ticket stream: {e}")
+
+    if first_event[0] == "ticket":
+        subscription.mark_delivered(first_event[1]) # Changes read before it are not streamed after it
+
+    async def event_stream():
+        try:
+            yield format_sse(*first_event)
+            while True:
+                events = await subscription.next_events(STREAM_HEARTBEAT_SECONDS)
+                if events is None:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n" # Keeps proxies from closing an idle stream
+                    continue
+                for event, data in events:
+                    yield format_sse(event, data)
+        finally:
+            ticket_events.unsubscribe(subscription)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/tickets/{ticket_id}", response_model=TicketSubmissionOutput, summary="Get one ticket with its planned workflow")
+async def get_ticket_api(ticket_id: str):
+    try:
+        ticket = await profiled_to_thread(get_ticket, get_rsps_db(), ticket_id)
+        return TicketSubmissionOutput(**ticket)
+    except ValueError as e:
+        code = status.HTTP_404_NOT_FOUND if str(e).endswith("not found.") else status.HTTP_400_BAD_REQUEST
+        raise HTTPException(status_code=code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to get ticket: {e}")
+
+# --- Workflow Endpoints ---
+@app.get("/rsps/workflow_templates", response_model=List[WorkflowTemplateOutput], summary="List the workflow templates (step DAGs) used to plan tickets, by issue type")
+async def list_workflow_templates_api():
+    try:
+        return await profiled_to_thread(workflow_templates.list, get_rsps_db())
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to list workflow templates: {e}")
+
+@app.put("/rsps/workflow_templates/{issue_type}", response_model=WorkflowTemplateOutput, summary="Create or replace the workflow template of an issue type", dependencies=[Depends(require_admin_token)])
+async def put_workflow_template_api(issue_type: str, template_input: WorkflowTemplateInput):
+    try:
+        steps = [step.model_dump() for step in template_input.steps]
+        return await profiled_to_thread(workflow_templates.put, get_rsps_db(), issue_type, steps)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to store workflow template: {e}")
+
+@app.post("/tickets/{ticket_id}/steps/{step_id}/events", response_model=TicketSubmissionOutput, summary="Report a workflow step event from its agent: started, completed (starts the steps it unblocks) or failed (reassigns or escalates)")
+async def step_event_api(ticket_id: str, step_id: str, event_input: StepEventInput):
+    try:
+        ticket = await profiled_to_thread(apply_step_event, get_rsps_db(), ticket_id, step_id, event_input.event, event_input.agent_id, event_input.details)
+        return TicketSubmissionOutput(**ticket)
+    except ValueError as e:
+        code = status.HTTP_404_NOT_FOUND if str(e).endswith("not found.") else status.HTTP_400_BAD_REQUEST
+        raise HTTPException(status_code=code, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to apply step event: {e}")
@@ -0,0 +1,6 @@
+# services/__init__.py
+from dotenv import load_dotenv
+
+# Load environment variables from the .env file once, before any service reads its configuration
+# (every service module is imported through this package)
+load_dotenv()
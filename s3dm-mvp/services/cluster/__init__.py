@@ -0,0 +1,15 @@
+# services/cluster/__init__.py
+import os
+import socket
+import uuid
+
+# --- Cluster Configuration ---
+# S3DM_CLUSTER_MODE=multi when main.py runs as several worker processes (uvicorn --workers N, gunicorn -w N).
+# Workers then share the ZTDIGS signing key, elect one leader (a MongoDB lease) to run startup tasks and
+# background loops, and broadcast cache invalidations to each other through MongoDB. "single" (default)
+# keeps everything in process.
+CLUSTER_MODE = os.getenv("S3DM_CLUSTER_MODE", "single").lower()
+if CLUSTER_MODE not in ("single", "multi"):
+    raise ValueError(f"Unknown S3DM_CLUSTER_MODE '{CLUSTER_MODE}'. Expected single or multi.")
+# Identifies this worker process in leases and broadcasts
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
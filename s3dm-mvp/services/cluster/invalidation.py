@@ -0,0 +1,158 @@
+# services/cluster/invalidation.py
+from typing import List, Optional, Dict, Any, Callable
+from datetime import datetime, timezone
+import threading
+import time
+import os
+from services.cluster import CLUSTER_MODE, WORKER_ID
+
+# --- Invalidation Broadcast Configuration ---
+# Workers tell each other about changes to state they cache in process (a contract created, an agent
+# registered, a claim recorded) by publishing small messages on topics. The MongoDB transport stores
+# them in cluster_invalidations (expired by a TTL index) and every worker polls for new ones every
+# S3DM_INVALIDATION_POLL_SECONDS, so a worker's caches lag the others by about that much. The local
+# transport delivers between buses of one process and stands in for it in single mode and tests.
+INVALIDATIONS_COLLECTION = "cluster_invalidations"
+INVALIDATION_POLL_SECONDS = float(os.getenv("S3DM_INVALIDATION_POLL_SECONDS", "0.5"))
+INVALIDATION_RETENTION_SECONDS = int(os.getenv("S3DM_INVALIDATION_RETENTION_SECONDS", "3600"))
+# Messages can become visible slightly out of timestamp order across writers; each poll re-reads this much history
+INVALIDATION_LOOKBACK_SECONDS = 5.0
+
+class LocalTransport:
+    """Delivers each message synchronously to every bus attached to this transport (in this process)."""
+
+    def __init__(self):
+        self._buses: List["InvalidationBus"] = []
+
+    def attach(self, bus: "InvalidationBus"):
+        self._buses.append(bus)
+
+    def detach(self, bus: "InvalidationBus"):
+        if bus in self._buses:
+            self._buses.remove(bus)
+
+    def send(self, message: Dict[str, Any]):
+        for bus in list(self._buses):
+            bus.deliver(message)
+
+class MongoTransport:
+    """Publishes messages to a MongoDB collection and polls it for the messages of other workers."""
+
+    def __init__(self, db_provider: Callable[[], Any], poll_seconds: float = INVALIDATION_POLL_SECONDS):
+        self.db_provider = db_provider
+        self.poll_seconds = poll_seconds
+        self._buses: List["InvalidationBus"] = []
+        self._seen: Dict[Any, float] = {}
+        self._last_ts = time.time()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._indexes_ready = False
+
+    def _collection(self):
+        collection = self.db_provider()[INVALIDATIONS_COLLECTION]
+        if not self._indexes_ready:
+            collection.create_index("created_at", expireAfterSeconds=INVALIDATION_RETENTION_SECONDS, name="created_at_ttl")
+            collection.create_index("ts", name="ts")
+            self._indexes_ready = True
+        return collection
+
+    def attach(self, bus: "InvalidationBus"):
+        self._buses.append(bus)
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cluster-invalidations", daemon=True)
+            self._thread.start()
+
+    def detach(self, bus: "InvalidationBus"):
+        if bus in self._buses:
+            self._buses.remove(bus)
+        if not self._buses:
+            self._stop.set()
+
+    def send(self, message: Dict[str, Any]):
+        self._collection().insert_one(dict(message, created_at=datetime.now(timezone.utc)))
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Cluster: Polling invalidations failed: {e}")
+
+    def poll(self) -> int:
+        """Delivers messages published since the last poll to the attached buses; returns how many."""
+        since = self._last_ts - INVALIDATION_LOOKBACK_SECONDS
+        messages = list(self._collection().find({"ts": {"$gte": since}}, {"created_at": 0}).sort("ts", 1))
+        delivered = 0
+        for message in messages:
+            if message["_id"] in self._seen:
+                continue
+            self._seen[message["_id"]] = message["ts"]
+            self._last_ts = max(self._last_ts, message["ts"])
+            for bus in list(self._buses):
+                bus.deliver(message)
+            delivered += 1
+        # Forget ids that can no longer be re-read
+        cutoff = self._last_ts - 2 * INVALIDATION_LOOKBACK_SECONDS
+        for message_id in [message_id for message_id, ts in self._seen.items() if ts < cutoff]:
+            del self._seen[message_id]
+        return delivered
+
+class InvalidationBus:
+    """
+    Topic-based broadcast between workers. publish() reaches every other worker's subscribers for the
+    topic; a worker never receives its own messages (it already applied the change locally).
+    """
+
+    def __init__(self, transport, origin: str = WORKER_ID):
+        self.transport = transport
+        self.origin = origin
+        self._handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._started = False
+        self._stats = {"published": 0, "received": 0, "handler_errors": 0, "publish_errors": 0}
+
+    def subscribe(self, topic: str, handler: Callable[[Dict[str, Any]], None]):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def start(self):
+        if not self._started:
+            self.transport.attach(self)
+            self._started = True
+
+    def stop(self):
+        if self._started:
+            self.transport.detach(self)
+            self._started = False
+
+    def publish(self, topic: str, **payload):
+        """Broadcasts a change. Best effort: a failure is logged, never raised into the write that caused it."""
+        if not self._started:
+            return # Not serving yet (or a script/test without other workers)
+        try:
+            self.transport.send({"topic": topic, "payload": payload, "origin": self.origin, "ts": time.time()})
+            self._stats["published"] += 1
+        except Exception as e:
+            self._stats["publish_errors"] += 1
+            print(f"Cluster: Failed to publish {topic} invalidation: {e}")
+
+    def deliver(self, message: Dict[str, Any]):
+        if message.get("origin") == self.origin:
+            return
+        self._stats["received"] += 1
+        for handler in self._handlers.get(message.get("topic"), ()):
+            try:
+                handler(message.get("payload") or {})
+            except Exception as e:
+                self._stats["handler_errors"] += 1
+                print(f"Cluster: {message.get('topic')} invalidation handler failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, started=self._started, transport=type(self.transport).__name__, topics=sorted(self._handlers))
+
+def _transport_for_mode(mode: str):
+    if mode == "multi":
+        from db.db import get_mongo_db_connection
+        return MongoTransport(get_mongo_db_connection)
+    return LocalTransport()
+
+invalidation_bus = InvalidationBus(_transport_for_mode(CLUSTER_MODE))
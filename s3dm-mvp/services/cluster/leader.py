@@ -0,0 +1,89 @@
+# services/cluster/leader.py
+from typing import Optional, Dict, Any
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import time
+import os
+from services.cluster import CLUSTER_MODE, WORKER_ID
+
+# --- Leader Lease Configuration ---
+# A lease is one document in cluster_locks ({_id: name, owner, expires_at}); the owner renews it every
+# LEADER_RENEW_SECONDS and any worker may take it over once it has not been renewed for
+# LEADER_LEASE_SECONDS. Taking it over is a single conditional upsert, so at most one worker holds it.
+LOCKS_COLLECTION = "cluster_locks"
+LEADER_LEASE_SECONDS = float(os.getenv("S3DM_LEADER_LEASE_SECONDS", "30"))
+LEADER_RENEW_SECONDS = float(os.getenv("S3DM_LEADER_RENEW_SECONDS", str(LEADER_LEASE_SECONDS / 3)))
+
+def try_acquire_lease(db, name: str, owner: str, lease_seconds: float) -> bool:
+    """Takes or renews the named lease for owner; False while another owner holds an unexpired lease."""
+    now = time.time()
+    try:
+        lease = db[LOCKS_COLLECTION].find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + lease_seconds, "renewed_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return False # The lease exists and is held by someone else (the upsert lost the race)
+    return lease is not None and lease.get("owner") == owner
+
+def release_lease(db, name: str, owner: str) -> bool:
+    return db[LOCKS_COLLECTION].delete_one({"_id": name, "owner": owner}).deleted_count == 1
+
+def get_lease(db, name: str) -> Optional[Dict[str, Any]]:
+    return db[LOCKS_COLLECTION].find_one({"_id": name})
+
+class LeaderElection:
+    """
+    Tracks whether this worker is the cluster leader. In single mode the worker always leads and
+    MongoDB is never touched. In multi mode is_leader only turns true after a successful renew().
+    """
+
+    def __init__(self, name: str = "leader", owner: str = WORKER_ID, lease_seconds: float = LEADER_LEASE_SECONDS, mode: str = CLUSTER_MODE):
+        self.name = name
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.single = mode == "single"
+        self._leader_until = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        # Stop acting as leader a little before the lease could be taken over
+        return self.single or time.time() < self._leader_until - min(1.0, self.lease_seconds / 10)
+
+    def renew(self, db) -> bool:
+        """Takes or renews the leadership lease; returns whether this worker leads."""
+        if self.single:
+            return True
+        was_leader = self.is_leader
+        started = time.time()
+        try:
+            acquired = try_acquire_lease(db, self.name, self.owner, self.lease_seconds)
+        except Exception as e:
+            print(f"Cluster: Leader lease renewal failed: {e}")
+            acquired = False
+        self._leader_until = started + self.lease_seconds if acquired else 0.0
+        if acquired and not was_leader:
+            print(f"Cluster: Worker {self.owner} is now the leader.")
+        elif was_leader and not acquired:
+            print(f"Cluster: Worker {self.owner} lost the leadership.")
+        return acquired
+
+    def resign(self, db):
+        """Releases the lease (on shutdown) so another worker takes over without waiting for it to expire."""
+        if not self.single and self._leader_until:
+            self._leader_until = 0.0
+            try:
+                release_lease(db, self.name, self.owner)
+            except Exception as e:
+                print(f"Cluster: Failed to release the leader lease: {e}")
+
+    def status(self, db=None) -> Dict[str, Any]:
+        status = {"mode": "single" if self.single else "multi", "worker_id": self.owner, "is_leader": self.is_leader}
+        if db is not None and not self.single:
+            lease = get_lease(db, self.name)
+            status["leader"] = lease.get("owner") if lease and lease.get("expires_at", 0) > time.time() else None
+        return status
+
+leader = LeaderElection()
@@ -3,12 +3,12 @@ from typing import List, Optional, Dict, Any, Set
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from bson import ObjectId
-from dotenv import load_dotenv
+from services.llos.metrics import timed_stage
+from services.cluster.invalidation import invalidation_bus
+import time
+import threading
 import os
 
-# Load environment variables from .env file
-load_dotenv()
-
 # --- MongoDB Setup ---
 MONGO_URI = os.getenv("MONGO_URI")
 
@@ -16,18 +16,22 @@ if not MONGO_URI:
     raise ValueError("MONGO_URI environment variable not set. Please create a .env file in services/gars.")
 
 client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
 
 def get_mongo_db_connection():
     """Returns the MongoDB database instance."""
     global client
     if client is None:
-        try:
-            client = MongoClient(MONGO_URI)
-            client.admin.command('ping') # Test connection
-            print("GARS Core: MongoDB connection successful!")
-        except ConnectionFailure as e:
-            print(f"GARS Core: MongoDB connection failed: {e}")
-            raise ConnectionFailure(f"Database connection error: {e}") # Re-raise for calling code to handle
+        with _client_lock:
+            if client is None:
+                try:
+                    new_client = MongoClient(MONGO_URI)
+                    new_client.admin.command('ping') # Test connection
+                    client = new_client
+                    print("GARS Core: MongoDB connection successful!")
+                except ConnectionFailure as e:
+                    print(f"GARS Core: MongoDB connection failed: {e}")
+                    raise ConnectionFailure(f"Database connection error: {e}") # Re-raise for calling code to handle
     
     db_name_from_uri = MONGO_URI.split('/')[-1].split('?')[0] if '/' in MONGO_URI else ""
     db_name = db_name_from_uri if db_name_from_uri and not db_name_from_uri.startswith('?') else "s3dm_db"
@@ -50,7 +54,8 @@ def create_agent_data(
     jurisdiction_city: str,
     cost: int,
     trust_score: int = 5,
-    active: int = 1
+    active: int = 1,
+    compliant_regions: Optional[List[str]] = None # e.g., ["EU-GDPR", "India-PDPB"]
 ) -> Dict[str, Any]:
     """Helper to structure agent data."""
     return {
@@ -58,9 +63,10 @@ def create_agent_data(
         "capabilities": capabilities,
         "jurisdiction_country": jurisdiction_country,
         "jurisdiction_city": jurisdiction_city,
-        # "cost": cost,
+        "cost": cost,
         "trust_score": trust_score,
-        "active": active
+        "active": active,
+        "compliant_regions": compliant_regions or []
     }
 
 # --- Core GARS Functions ---
@@ -73,18 +79,22 @@ def register_agent(agent_data: Dict[str, Any]) -> Dict[str, Any]:
     if agents_collection.find_one({"name": agent_data["name"]}):
         raise ValueError(f"Agent with name '{agent_data['name']}' already exists.")
         
+    agent_data = dict(agent_data, created_at=time.time())
     result = agents_collection.insert_one(agent_data)
     new_agent_doc = agents_collection.find_one({"_id": result.inserted_id})
     if new_agent_doc:
         new_agent_doc["id"] = str(new_agent_doc.pop("_id")) # Rename _id to id and convert to string
+        invalidation_bus.publish("gars.agent", agent_id=new_agent_doc["id"]) # Other workers may have cached it as unknown
         return new_agent_doc
     else:
         raise RuntimeError("Failed to retrieve newly registered agent.")
 
+@timed_stage("gars_query")
 def query_agents(
     capability: Optional[str] = None,
     country: Optional[str] = None,
-    city: Optional[str] = None
+    city: Optional[str] = None,
+    required_compliance_region: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
     Queries registered agents based on specified criteria.
@@ -103,6 +113,8 @@ def query_agents(
         query_filter["jurisdiction_city"] = {"$in": [city, "Any"]}
     elif city and city.lower() == "any":
         query_filter["jurisdiction_city"] = "Any"
+    if required_compliance_region:
+        query_filter["compliant_regions"] = required_compliance_region
 
     agents_cursor = agents_collection.find(query_filter).sort([("trust_score", -1), ("cost", 1)])
     
@@ -112,6 +124,18 @@ def query_agents(
         agents_list.append(agent)
     return agents_list
 
+@timed_stage("gars_agent_regions")
+def get_agent_compliant_regions(agent_ref: str) -> Optional[List[str]]:
+    """Returns the compliant regions of an agent, looked up by id or by name (None if no such agent)."""
+    db = get_mongo_db_connection()
+    agents_collection = db["agents"]
+
+    query_filter = {"_id": ObjectId(agent_ref)} if ObjectId.is_valid(agent_ref) else {"name": agent_ref}
+    agent = agents_collection.find_one(query_filter, {"compliant_regions": 1})
+    if agent is None:
+        return None
+    return agent.get("compliant_regions", [])
+
 def get_all_capabilities() -> List[str]:
     """Returns a list of all unique capabilities registered by active agents."""
     db = get_mongo_db_connection()
@@ -135,20 +159,36 @@ def add_sample_agents():
     agents_collection = db["agents"]
     
     sample_agents_data = [
-        create_agent_data("Bengaluru Smart Light Repair Co.", ["smart_lighting_repair", "electrical_diagnostics", "general_diagnostics"], "India", "Bengaluru", 50, 8, 1),
-        create_agent_data("Delhi HVAC Solutions Inc.", ["hvac_repair", "temperature_sensor_calibration", "general_diagnostics"], "India", "Delhi", 70, 7, 1),
-        create_agent_data("Global Logistics Express", ["part_delivery", "device_pickup"], "India", "Any", 30, 9, 1),
-        create_agent_data("Smart Device Diagnostics AI", ["remote_diagnostics", "firmware_update"], "Global", "Any", 10, 9, 1),
-        create_agent_data("European Fridge Manufacturer", ["fridge_diagnostics", "compressor_replacement", "part_identification"], "Germany", "Berlin", 100, 8, 1),
-        create_agent_data("Bengaluru General Technician", ["general_diagnostics", "physical_repair"], "India", "Bengaluru", 45, 7, 1),
-        create_agent_data("Global Software Support", ["software_troubleshooting", "firmware_update"], "Global", "Any", 20, 8, 1),
-        create_agent_data("Mumbai Electrician Service", ["electrical_diagnostics", "physical_repair"], "India", "Mumbai", 55, 6, 1)
+        create_agent_data("Bengaluru Smart Light Repair Co.", ["smart_lighting_repair", "electrical_diagnostics", "general_diagnostics"], "India", "Bengaluru", 50, 8, 1, ["India-PDPB"]),
+        create_agent_data("Delhi HVAC Solutions Inc.", ["hvac_repair", "temperature_sensor_calibration", "general_diagnostics"], "India", "Delhi", 70, 7, 1, ["India-PDPB"]),
+        create_agent_data("Global Logistics Express", ["part_delivery", "device_pickup"], "India", "Any", 30, 9, 1, ["India-PDPB"]),
+        create_agent_data("Smart Device Diagnostics AI", ["remote_diagnostics", "firmware_update"], "Global", "Any", 10, 9, 1, ["EU-GDPR", "India-PDPB"]),
+        create_agent_data("European Fridge Manufacturer", ["fridge_diagnostics", "compressor_replacement", "part_identification"], "Germany", "Berlin", 100, 8, 1, ["EU-GDPR"]),
+        create_agent_data("Bengaluru General Technician", ["general_diagnostics", "physical_repair"], "India", "Bengaluru", 45, 7, 1, ["India-PDPB"]),
+        create_agent_data("Global Software Support", ["software_troubleshooting", "firmware_update"], "Global", "Any", 20, 8, 1, ["EU-GDPR", "India-PDPB"]),
+        create_agent_data("Mumbai Electrician Service", ["electrical_diagnostics", "physical_repair"], "India", "Mumbai", 55, 6, 1, ["India-PDPB"])
     ]
 
     for agent_data in sample_agents_data:
         if agents_collection.count_documents({"name": agent_data["name"]}) == 0:
-            agents_collection.insert_one(agent_data)
+            register_agent(agent_data)
             print(f"GARS Core: Added sample agent: {agent_data['name']}.")
+
+def backfill_agent_fields() -> int:
+    """
+    Fills in fields that agents stored by older versions may lack (created_at, cost, trust_score),
+    so every agent document can be returned through the API. Returns the number of fields set.
+    """
+    db = get_mongo_db_connection()
+    agents_collection = db["agents"]
+
+    defaults = {"created_at": time.time(), "cost": 0, "trust_score": 5}
+    updated = 0
+    for field, value in defaults.items():
+        updated += agents_collection.update_many({field: {"$exists": False}}, {"$set": {field: value}}).modified_count
+    if updated:
+        print(f"GARS Core: Backfilled {updated} missing agent field(s).")
+    return updated
             
 def run_gars_tests():
     print("--- Running GARS Core Tests ---")
@@ -1,5 +1,9 @@
 # services/gars/test_gars.py
-from services.gars.main import register_agent, query_agents, get_all_capabilities, add_sample_agents, close_mongo_db_connection, create_agent_data
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+from services.gars.gars_core import register_agent, query_agents, get_all_capabilities, add_sample_agents, backfill_agent_fields, close_mongo_db_connection, create_agent_data, get_mongo_db_connection
+from main import AgentOutput
 from pymongo.errors import ConnectionFailure
 
 def run_gars_tests():
@@ -62,6 +66,27 @@ def run_gars_tests():
         all_caps = get_all_capabilities()
         print(f"All capabilities: {all_caps}")
 
+        # 5. Test Seeded and Legacy Agents Through the Response Model
+        print("\nValidating seeded agents through AgentOutput...")
+        remote_agents = query_agents(capability="remote_diagnostics")
+        seeded = [AgentOutput(**dict(agent, _id=agent["id"])) for agent in remote_agents]
+        assert any(agent.name == "Smart Device Diagnostics AI" for agent in seeded), "Seeded agent not returned!"
+        assert all(agent.created_at > 0 for agent in seeded), "Seeded agent without created_at!"
+
+        print("\nBackfilling an agent stored without created_at and cost...")
+        agents_collection = get_mongo_db_connection()["agents"]
+        legacy_name = "Legacy Backfill Test Agent"
+        agents_collection.delete_many({"name": legacy_name})
+        agents_collection.insert_one({"name": legacy_name, "capabilities": ["legacy_backfill_test"], "jurisdiction_country": "India", "jurisdiction_city": "Pune", "active": 1})
+        try:
+            assert backfill_agent_fields() >= 3, "Missing agent fields not backfilled!"
+            legacy_agent = query_agents(capability="legacy_backfill_test")[0]
+            validated = AgentOutput(**dict(legacy_agent, _id=legacy_agent["id"]))
+            print(f"Validated legacy agent: {validated.name} (cost {validated.cost}, trust {validated.trust_score})")
+            assert backfill_agent_fields() == 0, "Backfill is not idempotent!"
+        finally:
+            agents_collection.delete_many({"name": legacy_name})
+
         print("\n--- GARS Core Tests PASSED! ---")
 
     except ConnectionFailure:
@@ -1,13 +1,7 @@
 import re
 import json
-import httpx
 import os
-from dotenv import load_dotenv
-
-# --- Load Environment Variables ---
-# project_root = os.path.join(os.path.dirname(__file__), "..", "..")
-# env_file_path = os.path.join(project_root, ".env")
-load_dotenv()
+from services.llos.metrics import timed_stage
 
 # --- Groq API Configuration ---
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -80,12 +74,14 @@ def call_groq_llm_sync(prompt: str) -> str:
         "max_tokens": 400
     }
 
+    import httpx # Imported on first use (or by the startup warmup): it is slow to import and only needed here
     with httpx.Client(timeout=30) as client:
         response = client.post(GROQ_URL, headers=headers, json=payload)
         response.raise_for_status()
         return response.json()["choices"][0]["message"]["content"]
 
 # --- Main Function ---
+@timed_stage("llm_mapping")
 def map_issue(user_message: str) -> dict:
     fields = [
         "issue_type", "device_type", "severity", "location", "brand",
@@ -0,0 +1,156 @@
+# services/llos/feedback.py
+from typing import List, Optional, Dict, Any
+from pymongo import UpdateOne
+from bson import ObjectId
+import threading
+import time
+import uuid
+import os
+from services.llos.metrics import registry as metrics_registry, stage_timer
+from services.llos.rollups import record_feedback
+
+# --- Feedback Configuration ---
+# Ratings (1-5) and fraud flags are stored in the feedback collection as they arrive and credited to
+# the agents assigned to the ticket (or to one agent, if the feedback names it). Agent trust scores
+# (1-10) are exponentially weighted moving averages of that feedback, applied to agents in batches
+# every LLOS_TRUST_APPLY_INTERVAL_SECONDS (0 = only via POST /llos/trust_scores/apply), so each
+# agent is written once per batch however much feedback it received.
+FEEDBACK_BATCH_MAX = int(os.getenv("LLOS_FEEDBACK_BATCH_MAX", "1000"))
+TRUST_EWMA_ALPHA = float(os.getenv("LLOS_TRUST_EWMA_ALPHA", "0.1"))
+TRUST_FRAUD_ALPHA = float(os.getenv("LLOS_TRUST_FRAUD_ALPHA", "0.3")) # A fraud flag pulls the score towards the minimum this strongly
+TRUST_APPLY_INTERVAL_SECONDS = float(os.getenv("LLOS_TRUST_APPLY_INTERVAL_SECONDS", "60"))
+TRUST_APPLY_BATCH_SIZE = int(os.getenv("LLOS_TRUST_APPLY_BATCH", "5000"))
+TRUST_SCORE_MIN, TRUST_SCORE_MAX = 1.0, 10.0
+DEFAULT_TRUST_SCORE = 5.0
+
+FEEDBACK_ITEMS = metrics_registry.counter("s3dm_feedback_items_total", "Feedback items received, by outcome.", ("status",))
+_apply_lock = threading.Lock()
+
+def rating_to_trust(rating: int) -> float:
+    """Maps a 1-5 rating onto the 1-10 trust scale."""
+    return TRUST_SCORE_MIN + (rating - 1) / 4 * (TRUST_SCORE_MAX - TRUST_SCORE_MIN)
+
+def update_trust_score(score: float, feedback: Dict[str, Any]) -> float:
+    """One EWMA step for one feedback item."""
+    if feedback.get("fraud_flag"):
+        score += TRUST_FRAUD_ALPHA * (TRUST_SCORE_MIN - score)
+    if feedback.get("rating") is not None:
+        score += TRUST_EWMA_ALPHA * (rating_to_trust(feedback["rating"]) - score)
+    return min(TRUST_SCORE_MAX, max(TRUST_SCORE_MIN, score))
+
+def _ensure_feedback_indexes(db):
+    db["feedback"].create_index([("applied_at", 1), ("timestamp", 1)], name="pending_feedback")
+    db["feedback"].create_index("ticket_id", name="ticket_id")
+
+def submit_feedback_batch(db, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Stores feedback items ({ticket_id, rating, comments, fraud_flag, agent_id?}) in one insert, resolving
+    each to the agents it credits. Returns one result per item, in order:
+    {"index", "status": "accepted", "feedback"} or {"index", "status": "rejected", "error"}.
+    """
+    ticket_ids = {item["ticket_id"] for item in items if ObjectId.is_valid(item["ticket_id"])}
+    tickets = {
+        str(ticket["_id"]): ticket
+        for ticket in db["tickets"].find({"_id": {"$in": [ObjectId(t) for t in ticket_ids]}}, {"planned_workflow.assigned_agent_id": 1})
+    }
+    results, docs = [], []
+    now = time.time()
+    for index, item in enumerate(items):
+        ticket = tickets.get(item["ticket_id"])
+        if ticket is None:
+            results.append({"index": index, "status": "rejected", "error": f"Ticket {item['ticket_id']} not found."})
+            continue
+        assigned = [step["assigned_agent_id"] for step in ticket.get("planned_workflow", []) if step.get("assigned_agent_id")]
+        if item.get("agent_id"):
+            if item["agent_id"] not in assigned:
+                results.append({"index": index, "status": "rejected", "error": f"Agent {item['agent_id']} is not assigned to ticket {item['ticket_id']}."})
+                continue
+            assigned = [item["agent_id"]]
+        doc = dict(item, agent_ids=list(dict.fromkeys(assigned)), timestamp=now, applied_at=None)
+        docs.append(doc)
+        results.append({"index": index, "status": "accepted", "feedback": doc})
+
+    if docs:
+        _ensure_feedback_indexes(db)
+        inserted = db["feedback"].insert_many(docs, ordered=True)
+        for doc, inserted_id in zip(docs, inserted.inserted_ids):
+            doc["id"] = str(inserted_id)
+            doc.pop("_id", None)
+        ratings = [doc["rating"] for doc in docs if doc.get("rating") is not None]
+        record_feedback(db, len(ratings), sum(ratings), sum(1 for doc in docs if doc.get("fraud_flag")))
+    FEEDBACK_ITEMS.inc("accepted", amount=len(docs))
+    FEEDBACK_ITEMS.inc("rejected", amount=len(items) - len(docs))
+    return results
+
+def apply_pending_feedback(db) -> Dict[str, int]:
+    """
+    Folds unapplied feedback (oldest first, up to TRUST_APPLY_BATCH_SIZE items) into agent trust scores
+    with one bulk write. The batch is claimed first and each agent records the last batch applied to it,
+    so a batch interrupted half way is resumed without applying anything twice.
+    """
+    if not _apply_lock.acquire(blocking=False):
+        return {"feedback_applied": 0, "agents_updated": 0} # Already running
+    try:
+        with stage_timer("trust_apply"):
+            return _apply_pending_feedback(db)
+    finally:
+        _apply_lock.release()
+
+def _apply_pending_feedback(db) -> Dict[str, int]:
+    feedback_collection, agents_collection = db["feedback"], db["agents"]
+    _ensure_feedback_indexes(db)
+    # Resume a batch claimed by an interrupted run before claiming a new one
+    claimed = feedback_collection.find_one({"applied_at": None, "trust_batch": {"$exists": True}}, {"trust_batch": 1})
+    if claimed:
+        batch_id = claimed["trust_batch"]
+    else:
+        batch_id = uuid.uuid4().hex
+        pending_ids = [doc["_id"] for doc in feedback_collection.find({"applied_at": None}, {"_id": 1}).sort("timestamp", 1).limit(TRUST_APPLY_BATCH_SIZE)]
+        if not pending_ids:
+            return {"feedback_applied": 0, "agents_updated": 0}
+        feedback_collection.update_many({"_id": {"$in": pending_ids}, "trust_batch": {"$exists": False}}, {"$set": {"trust_batch": batch_id}})
+    batch = list(feedback_collection.find({"trust_batch": batch_id}).sort("timestamp", 1))
+
+    by_agent: Dict[str, List[Dict[str, Any]]] = {}
+    for feedback in batch:
+        for agent_id in feedback.get("agent_ids", []):
+            if ObjectId.is_valid(agent_id):
+                by_agent.setdefault(agent_id, []).append(feedback)
+    agents = agents_collection.find(
+        {"_id": {"$in": [ObjectId(a) for a in by_agent]}, "trust_batch": {"$ne": batch_id}}, # Skip agents this batch already reached
+        {"trust_score": 1}
+    )
+    updates = []
+    for agent in agents:
+        agent_feedback = by_agent[str(agent["_id"])]
+        score = float(agent.get("trust_score", DEFAULT_TRUST_SCORE))
+        for feedback in agent_feedback:
+            score = update_trust_score(score, feedback)
+        updates.append(UpdateOne(
+            {"_id": agent["_id"], "trust_batch": {"$ne": batch_id}},
+            {
+                "$set": {"trust_score": round(score, 4), "trust_batch": batch_id, "trust_updated_at": time.time()},
+                "$inc": {"feedback_count": len(agent_feedback), "fraud_flag_count": sum(1 for f in agent_feedback if f.get("fraud_flag"))}
+            }
+        ))
+    if updates:
+        agents_collection.bulk_write(updates, ordered=False)
+    feedback_collection.update_many({"trust_batch": batch_id}, {"$set": {"applied_at": time.time()}})
+    if batch:
+        print(f"LLOS: Applied {len(batch)} feedback item(s) to {len(updates)} agent trust score(s).")
+    return {"feedback_applied": len(batch), "agents_updated": len(updates)}
+
+def get_agent_trust_scores(db) -> List[Dict[str, Any]]:
+    """All agents with their current trust scores, highest first."""
+    agents = db["agents"].find({}, {"name": 1, "trust_score": 1, "feedback_count": 1, "fraud_flag_count": 1, "trust_updated_at": 1}).sort("trust_score", -1)
+    return [
+        {
+            "agent_id": str(agent["_id"]),
+            "agent_name": agent.get("name", ""),
+            "trust_score": float(agent.get("trust_score", DEFAULT_TRUST_SCORE)),
+            "feedback_count": agent.get("feedback_count", 0),
+            "fraud_flag_count": agent.get("fraud_flag_count", 0),
+            "trust_updated_at": agent.get("trust_updated_at")
+        }
+        for agent in agents
+    ]
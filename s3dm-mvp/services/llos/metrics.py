@@ -0,0 +1,260 @@
+# services/llos/metrics.py
+from typing import List, Optional, Dict, Any, Callable, Tuple
+from pymongo import monitoring
+import bisect
+import functools
+import threading
+import time
+import os
+from services.llos.tracing import span as trace_span
+
+# --- Metrics Configuration ---
+# In-process histograms and counters, rendered in the Prometheus text format at GET /metrics.
+# Values are per worker process; Prometheus aggregates them across workers (sum by le, then
+# histogram_quantile for p99). LLOS_METRICS_ENABLED=false turns all recording into no-ops.
+METRICS_ENABLED = os.getenv("LLOS_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Upper bounds (seconds) shared by all latency histograms: 0.5 ms up to 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+class _Metric:
+    """A metric family: one child per combination of label values, created on first use."""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}.")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float, *labelvalues: str):
+        if METRICS_ENABLED:
+            self.labels(*labelvalues).observe(value)
+
+    def _render_child(self, values, child):
+        counts, total, count = child.snapshot()
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {count}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        if METRICS_ENABLED:
+            self.labels(*labelvalues).inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class MetricsRegistry:
+    """Holds the process's metric families and stats sources, and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._stats_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, labelnames, buckets))
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, labelnames))
+
+    def register_stats_source(self, name: str, stats: Callable[[], Dict[str, Any]]):
+        """Exports the numeric fields of a stats() dict (e.g. a cache's) as s3dm_cache_<field>{cache="<name>"} gauges."""
+        self._stats_sources[name] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        gauges: Dict[str, List[str]] = {}
+        for source, stats in self._stats_sources.items():
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"LLOS: Stats source {source} failed: {e}")
+                continue
+            for field, value in values.items():
+                if isinstance(value, (int, float)): # bools count as 0/1
+                    gauges.setdefault(f"s3dm_cache_{field}", []).append(f's3dm_cache_{field}{{cache="{_escape_label(source)}"}} {_format_value(value)}')
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# --- Stage Metrics ---
+STAGE_SECONDS = registry.histogram("s3dm_stage_duration_seconds", "Time spent in one processing stage (LLM mapping, GARS lookups, signing, ...).", ("stage",))
+STAGE_ERRORS = registry.counter("s3dm_stage_errors_total", "Processing stages that raised an exception.", ("stage",))
+MONGO_SECONDS = registry.histogram("s3dm_mongo_command_duration_seconds", "MongoDB command round trip time, per collection and command.", ("collection", "command", "op"))
+MONGO_FAILURES = registry.counter("s3dm_mongo_command_failures_total", "MongoDB commands that failed, per collection and command.", ("collection", "command", "op"))
+REQUEST_SECONDS = registry.histogram("s3dm_http_request_duration_seconds", "Whole-request latency, per route template.", ("method", "route", "status"))
+
+class _StageTimer:
+    __slots__ = ("stage", "start", "span_scope")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.span_scope = trace_span(self.stage) # Stages are also spans of the current trace, if any
+        self.span_scope.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span_scope.__exit__(exc_type, exc, tb)
+        if METRICS_ENABLED:
+            STAGE_SECONDS.labels(self.stage).observe(time.perf_counter() - self.start)
+            if exc_type is not None:
+                STAGE_ERRORS.labels(self.stage).inc()
+        return False
+
+def stage_timer(stage: str) -> _StageTimer:
+    """Context manager recording the duration (and any exception) of a block as the given stage, and tracing it as a span."""
+    return _StageTimer(stage)
+
+def timed_stage(stage: str):
+    """Decorator recording every call of a function as the given stage."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _StageTimer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe_request(method: str, route: str, status_code: int, seconds: float):
+    REQUEST_SECONDS.observe(seconds, method, route, str(status_code))
+
+# --- MongoDB Command Metrics ---
+_READ_COMMANDS = frozenset(("find", "getMore", "aggregate", "count", "distinct"))
+_WRITE_COMMANDS = frozenset(("insert", "update", "delete", "findAndModify"))
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times reads and writes per collection for every MongoClient created after install_mongo_listener()."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str, str]] = {}
+
+    def started(self, event):
+        command_name = event.command_name
+        op = "read" if command_name in _READ_COMMANDS else "write" if command_name in _WRITE_COMMANDS else None
+        if op is None:
+            return # Handshakes, pings, index builds, ...
+        collection = event.command.get("collection") if command_name == "getMore" else event.command.get(command_name)
+        if isinstance(collection, str):
+            self._pending[(event.connection_id, event.request_id)] = (collection, command_name, op)
+
+    def succeeded(self, event):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels:
+            MONGO_SECONDS.observe(event.duration_micros / 1e6, *labels)
+
+    def failed(self, event):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels:
+            MONGO_SECONDS.observe(event.duration_micros / 1e6, *labels)
+            MONGO_FAILURES.inc(*labels)
+
+_mongo_listener: Optional[MongoCommandMetrics] = None
+
+def install_mongo_listener() -> Optional[MongoCommandMetrics]:
+    """Registers the command listener globally. Must run before the services create their MongoClients."""
+    global _mongo_listener
+    if METRICS_ENABLED and _mongo_listener is None:
+        _mongo_listener = MongoCommandMetrics()
+        monitoring.register(_mongo_listener)
+    return _mongo_listener
+
+def render_metrics() -> str:
+    return registry.render()
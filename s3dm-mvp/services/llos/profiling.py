@@ -0,0 +1,369 @@
+# services/llos/profiling.py
+from typing import List, Optional, Dict, Any, Tuple
+from collections import deque
+from contextvars import ContextVar
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+
+# --- Profiling Configuration ---
+# Two opt-in tools, both off by default and both per worker process:
+# - Request profiles: cProfile around one request, captured when the request carries the admin token
+#   in LLOS_PROFILE_HEADER, or for a fraction LLOS_PROFILE_SAMPLE_RATE of requests (at most one every
+#   LLOS_PROFILE_MIN_INTERVAL_SECONDS). One request is profiled at a time; the last
+#   LLOS_PROFILE_BUFFER_SIZE captures are kept (GET /llos/profiles). cProfile only sees the thread it
+#   is enabled in, so work a profiled request hands to a worker thread is captured only when it goes
+#   through profiled_to_thread (which profiles that thread too and merges it into the capture).
+# - Stack sampler: a thread that records the Python stack of every busy thread each
+#   LLOS_SAMPLER_INTERVAL_MS and aggregates them across requests, for flamegraphs in the collapsed
+#   format. If one sample costs more than LLOS_SAMPLER_MAX_OVERHEAD of its interval, the interval grows.
+# The admin endpoints need S3DM_ADMIN_TOKEN (sent as X-Admin-Token); without it they are disabled.
+ADMIN_TOKEN = os.getenv("S3DM_ADMIN_TOKEN", "")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+PROFILE_HEADER = os.getenv("LLOS_PROFILE_HEADER", "X-Profile-Token")
+PROFILE_SAMPLE_RATE = float(os.getenv("LLOS_PROFILE_SAMPLE_RATE", "0.0"))
+PROFILE_MIN_INTERVAL_SECONDS = float(os.getenv("LLOS_PROFILE_MIN_INTERVAL_SECONDS", "10"))
+PROFILE_BUFFER_SIZE = int(os.getenv("LLOS_PROFILE_BUFFER_SIZE", "20"))
+SAMPLER_AUTOSTART = os.getenv("LLOS_SAMPLER_AUTOSTART", "false").lower() in ("1", "true", "yes")
+SAMPLER_INTERVAL_MS = float(os.getenv("LLOS_SAMPLER_INTERVAL_MS", "10"))
+SAMPLER_MAX_OVERHEAD = float(os.getenv("LLOS_SAMPLER_MAX_OVERHEAD", "0.02"))
+SAMPLER_MAX_STACKS = int(os.getenv("LLOS_SAMPLER_MAX_STACKS", "20000")) # Distinct stacks kept; rarer ones are folded into "[other]"
+SAMPLER_MAX_DEPTH = 128
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def admin_token_valid(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+# --- Request Profiles ---
+class RequestProfile:
+    """One cProfile capture of a request (its profiler, then its stats once finished)."""
+    __slots__ = ("profile_id", "trigger", "profiler", "start", "duration_ms", "method", "route", "status_code", "trace_id", "stats",
+                 "thread_stats", "threads_lock", "context_token")
+
+    def __init__(self, trigger: str):
+        self.profile_id = os.urandom(8).hex()
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.method = self.route = self.trace_id = None
+        self.status_code: Optional[int] = None
+        self.stats: Optional[Dict[Any, Any]] = None
+        self.thread_stats: List[Dict[Any, Any]] = [] # From profiled_to_thread workers, merged in by finish()
+        self.threads_lock = threading.Lock()
+        self.context_token = None
+
+    def add_thread_stats(self, stats: Dict[Any, Any]):
+        with self.threads_lock:
+            if self.stats is None: # Work that outlives the request is not part of its capture
+                self.thread_stats.append(stats)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "profile_id": self.profile_id,
+            "trigger": self.trigger,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "method": self.method,
+            "route": self.route,
+            "status_code": self.status_code,
+            "trace_id": self.trace_id,
+            "functions": len(self.stats or ())
+        }
+
+# The capture of the request being handled, so profiled_to_thread can find it (contextvars follow tasks)
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("llos_current_profile", default=None)
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the recent captures."""
+
+    def __init__(self, sample_rate: float, min_interval: float, buffer_size: int):
+        self.sample_rate = sample_rate
+        self.min_interval = min_interval
+        self._captures: "deque[RequestProfile]" = deque(maxlen=buffer_size)
+        self._active = threading.Lock() # cProfile hooks the whole thread, so one capture at a time
+        self._lock = threading.Lock()
+        self._next_sampled = 0.0
+        self._stats = {"captured": 0, "skipped_busy": 0}
+
+    def start(self, profile_token: Optional[str]) -> Optional[RequestProfile]:
+        """Starts profiling the current request if it asked for it (or is sampled); None otherwise."""
+        if profile_token is None and self.sample_rate <= 0:
+            return None # Disabled: the only cost on the request path
+        if profile_token is not None and admin_token_valid(profile_token):
+            trigger = "header"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate and time.monotonic() >= self._next_sampled:
+            trigger = "sampled"
+        else:
+            return None
+        if not self._active.acquire(blocking=False):
+            self._stats["skipped_busy"] += 1
+            return None
+        if trigger == "sampled":
+            self._next_sampled = time.monotonic() + self.min_interval
+        profile = RequestProfile(trigger)
+        try:
+            profile.profiler.enable()
+        except ValueError: # Another profiler (e.g. a debugger's) already owns this thread
+            self._active.release()
+            return None
+        profile.context_token = _current_profile.set(profile)
+        return profile
+
+    def finish(self, profile: RequestProfile, method: str, route: str, status_code: int, trace_id: Optional[str] = None):
+        """
+        Stops a capture started by start() and keeps it. The profile includes everything else the event loop
+        ran meanwhile, plus the request's profiled_to_thread calls (call from the context start() ran in).
+        """
+        try:
+            profile.profiler.disable()
+        finally:
+            self._active.release()
+            _current_profile.reset(profile.context_token)
+        profile.duration_ms = (time.time() - profile.start) * 1000
+        profile.method, profile.route, profile.status_code, profile.trace_id = method, route, status_code, trace_id
+        profile.profiler.create_stats()
+        with profile.threads_lock:
+            stats = pstats.Stats(_StatsHolder(profile.profiler.stats))
+            for thread_stats in profile.thread_stats:
+                stats.add(_StatsHolder(thread_stats))
+            profile.stats = stats.stats
+            profile.thread_stats = []
+        profile.profiler = None # The raw stats are all that is needed
+        with self._lock:
+            self._captures.append(profile)
+            self._stats["captured"] += 1
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._captures)]
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            for profile in self._captures:
+                if profile.profile_id == profile_id:
+                    return profile
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, buffered=len(self._captures), sample_rate=self.sample_rate, active=self._active.locked())
+
+class _StatsHolder:
+    # pstats.Stats loads any object with create_stats() and .stats
+    def __init__(self, stats: Dict[Any, Any]):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def _run_profiled(profile: RequestProfile, func, args, kwargs):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError: # Another profiler already owns this worker thread
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        profile.add_thread_stats(profiler.stats)
+
+async def profiled_to_thread(func, /, *args, **kwargs):
+    """asyncio.to_thread, which also profiles the worker thread when the current request is being profiled."""
+    profile = _current_profile.get()
+    if profile is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(_run_profiled, profile, func, args, kwargs)
+
+def _pstats(profile: RequestProfile) -> pstats.Stats:
+    return pstats.Stats(_StatsHolder(dict(profile.stats)))
+
+def profile_to_text(profile: RequestProfile, sort: str = "cumulative", limit: int = 50) -> str:
+    """The usual pstats report, top functions first."""
+    out = io.StringIO()
+    stats = _pstats(profile)
+    stats.stream = out
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+def profile_to_pstats(profile: RequestProfile) -> bytes:
+    """The capture in the binary .prof format (pstats.Stats, snakeviz, gprof2dot | dot for a call graph)."""
+    return marshal.dumps(profile.stats)
+
+# --- Stack Sampler ---
+# Leaf frames of threads that are waiting rather than running Python (event loop select, idle executor
+# workers, pymongo monitors); skipped unless idle stacks are requested
+_IDLE_LEAVES = frozenset((
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("periodic_executor.py", "_run"),
+    ("pool.py", "_run"),
+))
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(APP_ROOT + os.sep):
+        return os.path.relpath(filename, APP_ROOT)
+    marker = "site-packages" + os.sep
+    index = filename.rfind(marker)
+    return filename[index + len(marker):] if index >= 0 else os.path.basename(filename)
+
+def _thread_group(name: str) -> str:
+    # asyncio_0, asyncio_1, ... (asyncio.to_thread workers) aggregate into one root frame
+    return name.rstrip("0123456789").rstrip("_-") or name
+
+class StackSampler:
+    """Samples the stacks of all other threads on a fixed interval and counts them in collapsed form."""
+
+    def __init__(self, interval_ms: float, max_overhead: float, max_stacks: int):
+        self.base_interval = interval_ms / 1000
+        self.interval = self.base_interval
+        self.max_overhead = max_overhead
+        self.max_stacks = max_stacks
+        self._counts: Dict[str, int] = {}
+        self._idle_counts: Dict[str, int] = {}
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {"samples": 0, "idle_samples": 0, "folded_samples": 0, "ticks": 0, "busy_seconds": 0.0, "since": time.time()}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None) -> bool:
+        """Starts sampling; False if already running."""
+        with self._lock:
+            if self.running:
+                return False
+            if interval_ms:
+                self.base_interval = interval_ms / 1000
+            self.interval = self.base_interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="llos-stack-sampler", daemon=True)
+            self._thread.start()
+        print(f"LLOS: Stack sampler started ({self.interval * 1000:.1f} ms interval).")
+        return True
+
+    def stop(self) -> bool:
+        """Stops sampling (the counts are kept); False if not running."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return False
+        self._stop.set()
+        thread.join(timeout=5)
+        print("LLOS: Stack sampler stopped.")
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._idle_counts.clear()
+            self._reset_stats()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            start = time.perf_counter()
+            self.sample(own_ident)
+            cost = time.perf_counter() - start
+            with self._lock:
+                self._stats["ticks"] += 1
+                self._stats["busy_seconds"] += cost
+            # Keep the sampler's share of the GIL bounded: stretch the interval when samples get expensive
+            if cost > self.max_overhead * self.interval:
+                self.interval = min(1.0, cost / self.max_overhead)
+            elif self.interval > self.base_interval and cost < self.max_overhead * self.interval / 2:
+                self.interval = max(self.base_interval, self.interval / 2)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            if len(self._labels) < 100000:
+                self._labels[code] = label
+        return label
+
+    def sample(self, skip_ident: Optional[int] = None):
+        """Records one sample of every thread's stack except skip_ident's (the sampler's own)."""
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip_ident:
+                continue
+            leaf = frame.f_code
+            idle = (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES
+            frames = []
+            while frame is not None and len(frames) < SAMPLER_MAX_DEPTH:
+                frames.append(self._label(frame.f_code))
+                frame = frame.f_back
+            frames.append(_thread_group(thread_names.get(ident, "thread")))
+            stack = ";".join(reversed(frames))
+            with self._lock:
+                counts = self._idle_counts if idle else self._counts
+                if stack not in counts and len(counts) >= self.max_stacks:
+                    stack = frames[-1] + ";[other]"
+                    self._stats["folded_samples"] += 1
+                counts[stack] = counts.get(stack, 0) + 1
+                self._stats["idle_samples" if idle else "samples"] += 1
+
+    def collapsed(self, include_idle: bool = False) -> str:
+        """Stacks in the folded format ("root;...;leaf count" per line) read by flamegraph.pl and speedscope."""
+        with self._lock:
+            counts = dict(self._counts)
+            if include_idle:
+                for stack, count in self._idle_counts.items():
+                    counts[stack] = counts.get(stack, 0) + count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda item: -item[1]))
+
+    def top_functions(self, limit: int = 30) -> List[Dict[str, Any]]:
+        """Functions by samples spent in them (self) and under them (total), busy threads only."""
+        with self._lock:
+            counts = dict(self._counts)
+            total_samples = self._stats["samples"]
+        self_samples: Dict[str, int] = {}
+        total: Dict[str, int] = {}
+        for stack, count in counts.items():
+            frames = stack.split(";")[1:] # Without the thread root
+            if not frames:
+                continue
+            self_samples[frames[-1]] = self_samples.get(frames[-1], 0) + count
+            for function in set(frames):
+                total[function] = total.get(function, 0) + count
+        ranked = sorted(total, key=lambda function: (-self_samples.get(function, 0), -total[function]))[:limit]
+        return [
+            {
+                "function": function,
+                "self_samples": self_samples.get(function, 0),
+                "total_samples": total[function],
+                "self_percent": round(100.0 * self_samples.get(function, 0) / total_samples, 2) if total_samples else 0.0,
+                "total_percent": round(100.0 * total[function] / total_samples, 2) if total_samples else 0.0
+            }
+            for function in ranked
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats, distinct_stacks=len(self._counts), running=self.running)
+        elapsed = (time.time() - stats["since"]) if stats["ticks"] else 0.0
+        stats["interval_ms"] = round(self.interval * 1000, 3)
+        stats["overhead_ratio"] = round(stats["busy_seconds"] / elapsed, 5) if elapsed else 0.0
+        return stats
+
+request_profiler = RequestProfiler(PROFILE_SAMPLE_RATE, PROFILE_MIN_INTERVAL_SECONDS, PROFILE_BUFFER_SIZE)
+stack_sampler = StackSampler(SAMPLER_INTERVAL_MS, SAMPLER_MAX_OVERHEAD, SAMPLER_MAX_STACKS)
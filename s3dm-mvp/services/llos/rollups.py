@@ -0,0 +1,163 @@
+# services/llos/rollups.py
+from typing import List, Optional, Dict, Any, Iterable
+from pymongo import UpdateOne
+import time
+import os
+
+# --- Rollup Configuration ---
+# Operational counters are kept in llos_rollups, one document per hour bucket plus one running-total
+# document, and updated with $inc on the ticket write path. Dashboards read one document per hour
+# instead of scanning tickets. Per bucket:
+#   tickets_created, by_issue_type.<type>, by_severity.<severity>, by_city.<city>  (tickets created in the hour)
+#   by_status.<status>                  (tickets that entered the status in the hour)
+#   unassigned_by_capability.<cap>      (workflow steps planned without an agent in the hour)
+#   feedback.ratings, feedback.rating_sum, feedback.fraud_flags  (feedback received in the hour)
+# The totals document also keeps status_current.<status>: the number of tickets currently in each status.
+ROLLUPS_COLLECTION = "llos_rollups"
+ROLLUP_BUCKET_SECONDS = 3600
+TOTALS_ROLLUP_ID = "total"
+ROLLUP_MAX_HOURS = int(os.getenv("LLOS_ROLLUP_MAX_HOURS", str(31 * 24))) # Longest window one read may cover
+COUNTER_FIELDS = ("by_status", "by_issue_type", "by_severity", "by_city", "unassigned_by_capability", "feedback")
+
+_rollup_indexes_ready = False
+
+def _ensure_rollup_indexes(db):
+    global _rollup_indexes_ready
+    if not _rollup_indexes_ready:
+        db[ROLLUPS_COLLECTION].create_index([("granularity", 1), ("bucket_start", 1)], name="granularity_bucket_start")
+        _rollup_indexes_ready = True
+
+def rollup_bucket_start(timestamp: float) -> int:
+    return int(timestamp // ROLLUP_BUCKET_SECONDS * ROLLUP_BUCKET_SECONDS)
+
+def rollup_bucket_id(timestamp: float) -> str:
+    return f"hour:{time.strftime('%Y-%m-%dT%H', time.gmtime(timestamp))}"
+
+def _key(value: Any) -> str:
+    """Counter key for a field value ("." and "$" are not allowed in MongoDB field paths)."""
+    text = str(value).strip() if value not in (None, "") else "unknown"
+    return text.replace(".", "_").replace("$", "_") or "unknown"
+
+def ticket_city(ticket: Dict[str, Any]) -> str:
+    return (ticket.get("user_location") or "unknown").split(",")[0]
+
+def _apply(db, increments: Dict[str, int], timestamp: float, totals_only: Optional[Dict[str, int]] = None):
+    """Adds increments to the hour bucket of timestamp and to the totals document (both upserted)."""
+    now = time.time()
+    bucket_start = rollup_bucket_start(timestamp)
+    db[ROLLUPS_COLLECTION].bulk_write([
+        UpdateOne(
+            {"_id": rollup_bucket_id(timestamp)},
+            {"$inc": increments, "$set": {"updated_at": now}, "$setOnInsert": {"granularity": "hour", "bucket_start": bucket_start}},
+            upsert=True
+        ),
+        UpdateOne(
+            {"_id": TOTALS_ROLLUP_ID},
+            {"$inc": dict(increments, **(totals_only or {})), "$set": {"updated_at": now}, "$setOnInsert": {"granularity": "total"}},
+            upsert=True
+        )
+    ], ordered=False)
+
+def _safely(action: str, fn):
+    # Rollups are derived data: a failed update must never fail the ticket write it describes
+    try:
+        fn()
+    except Exception as e:
+        print(f"LLOS: Failed to update rollups ({action}): {e}")
+
+def _ticket_increments(ticket: Dict[str, Any]) -> Dict[str, int]:
+    increments = {
+        "tickets_created": 1,
+        f"by_issue_type.{_key(ticket.get('issue_type'))}": 1,
+        f"by_severity.{_key(ticket.get('severity'))}": 1,
+        f"by_city.{_key(ticket_city(ticket))}": 1,
+        f"by_status.{_key(ticket.get('status'))}": 1
+    }
+    for step in ticket.get("planned_workflow", []):
+        if step.get("status") == "unassigned":
+            field = f"unassigned_by_capability.{_key(step.get('capability'))}"
+            increments[field] = increments.get(field, 0) + 1
+    return increments
+
+def record_ticket_created(db, ticket: Dict[str, Any]):
+    """Counts a newly planned ticket (its issue type, severity, city, status and unassigned steps)."""
+    _safely("ticket created", lambda: _apply(db, _ticket_increments(ticket), time.time(), {f"status_current.{_key(ticket.get('status'))}": 1}))
+
+def record_ticket_status_change(db, previous_status: Optional[str], new_status: str):
+    """Counts a ticket entering new_status (and leaving previous_status in the current-status totals)."""
+    if previous_status == new_status:
+        return
+    totals_only = {f"status_current.{_key(new_status)}": 1}
+    if previous_status is not None:
+        totals_only[f"status_current.{_key(previous_status)}"] = -1
+    _safely("status change", lambda: _apply(db, {f"by_status.{_key(new_status)}": 1}, time.time(), totals_only))
+
+def record_feedback(db, ratings: int, rating_sum: int, fraud_flags: int):
+    """Counts received feedback: the number of ratings, their sum (for average CSAT) and fraud flags."""
+    increments = {"feedback.ratings": ratings, "feedback.rating_sum": rating_sum, "feedback.fraud_flags": fraud_flags}
+    increments = {field: value for field, value in increments.items() if value}
+    if increments:
+        _safely("feedback", lambda: _apply(db, increments, time.time()))
+
+# --- Reading Rollups ---
+def get_rollup_totals(db) -> Optional[Dict[str, Any]]:
+    """Running totals since rollups were first maintained (or last rebuilt); None if there are none yet."""
+    return db[ROLLUPS_COLLECTION].find_one({"_id": TOTALS_ROLLUP_ID}, {"_id": 0})
+
+def get_rollups(db, start: float, end: float) -> Dict[str, Any]:
+    """Hour buckets overlapping [start, end), oldest first, plus their counters summed over the window."""
+    if end <= start:
+        raise ValueError("end must be after start.")
+    if (end - start) / ROLLUP_BUCKET_SECONDS > ROLLUP_MAX_HOURS:
+        raise ValueError(f"Window too large (at most {ROLLUP_MAX_HOURS} hours).")
+    _ensure_rollup_indexes(db)
+    buckets = list(db[ROLLUPS_COLLECTION].find(
+        {"granularity": "hour", "bucket_start": {"$gte": rollup_bucket_start(start), "$lt": end}},
+        {"_id": 0}
+    ).sort("bucket_start", 1))
+    return {"start": rollup_bucket_start(start), "end": end, "buckets": buckets, "summary": sum_rollups(buckets)}
+
+def sum_rollups(buckets: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {"tickets_created": 0}
+    for bucket in buckets:
+        summary["tickets_created"] += bucket.get("tickets_created", 0)
+        for field in COUNTER_FIELDS:
+            counters = summary.setdefault(field, {})
+            for key, value in _flatten(bucket.get(field, {})):
+                counters[key] = counters.get(key, 0) + value
+    return summary
+
+def _flatten(counters: Dict[str, Any], prefix: str = ""):
+    for key, value in counters.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+def rebuild_rollups(db) -> int:
+    """
+    Recomputes all ticket rollups from the tickets collection (one scan), e.g. for tickets created before
+    rollups were maintained. Feedback counters are kept. Tickets written during the rebuild may be
+    counted twice or not at all, so run it while traffic is low. Returns the number of tickets counted.
+    """
+    rollups_collection = db[ROLLUPS_COLLECTION]
+    rollups_collection.update_many({}, {"$unset": {field: "" for field in ("tickets_created", "by_status", "by_issue_type", "by_severity", "by_city", "unassigned_by_capability", "status_current")}})
+    pending: Dict[str, Dict[str, Any]] = {}
+    counted = 0
+    for ticket in db["tickets"].find({}, {"issue_type": 1, "severity": 1, "user_location": 1, "status": 1, "planned_workflow.status": 1, "planned_workflow.capability": 1, "created_at": 1}):
+        created_at = ticket.get("created_at") or time.time()
+        increments = _ticket_increments(ticket)
+        for bucket_id, fields in ((rollup_bucket_id(created_at), increments), (TOTALS_ROLLUP_ID, dict(increments, **{f"status_current.{_key(ticket.get('status'))}": 1}))):
+            update = pending.setdefault(bucket_id, {"increments": {}, "bucket_start": rollup_bucket_start(created_at)})
+            for field, value in fields.items():
+                update["increments"][field] = update["increments"].get(field, 0) + value
+        counted += 1
+    now = time.time()
+    requests = []
+    for bucket_id, update in pending.items():
+        on_insert = {"granularity": "total"} if bucket_id == TOTALS_ROLLUP_ID else {"granularity": "hour", "bucket_start": update["bucket_start"]}
+        requests.append(UpdateOne({"_id": bucket_id}, {"$inc": update["increments"], "$set": {"updated_at": now}, "$setOnInsert": on_insert}, upsert=True))
+    for i in range(0, len(requests), 1000):
+        rollups_collection.bulk_write(requests[i:i + 1000], ordered=False)
+    print(f"LLOS: Rebuilt rollups from {counted} tickets.")
+    return counted
@@ -0,0 +1,101 @@
+# services/llos/test_llos.py
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+from services.llos.metrics import MetricsRegistry
+from services.llos.feedback import update_trust_score, rating_to_trust, TRUST_SCORE_MIN, TRUST_SCORE_MAX, DEFAULT_TRUST_SCORE
+from services.llos.rollups import _ticket_increments, sum_rollups, rollup_bucket_start, rollup_bucket_id
+
+def run_llos_tests():
+    print("--- Running LLOS Tests ---")
+    try:
+        # --- Test Prometheus Rendering ---
+        print("\n--- Testing Prometheus Rendering ---")
+        registry = MetricsRegistry()
+        latency = registry.histogram("test_latency_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+        errors = registry.counter("test_errors_total", "Test errors.", ("route",))
+        assert registry.histogram("test_latency_seconds", "Registered again.", ("route",)) is latency, "Metric family registered twice!"
+        for value in (0.05, 0.5, 0.5, 5.0):
+            latency.observe(value, "/tickets")
+        errors.inc('/a"b\\c\nd', amount=2)
+        registry.register_stats_source("contracts", lambda: {"hits": 3, "enabled": True, "mode": "strict"})
+        registry.register_stats_source("broken", lambda: 1 / 0)
+        text = registry.render()
+        print(text)
+        lines = text.splitlines()
+        assert text.endswith("\n"), "Exposition does not end with a newline!"
+        assert lines[:2] == ["# HELP test_latency_seconds Test latency.", "# TYPE test_latency_seconds histogram"], "Histogram header malformed!"
+        assert 'test_latency_seconds_bucket{route="/tickets",le="0.1"} 1' in lines, "First bucket not counted!"
+        assert 'test_latency_seconds_bucket{route="/tickets",le="1.0"} 3' in lines, "Buckets are not cumulative!"
+        assert 'test_latency_seconds_bucket{route="/tickets",le="+Inf"} 4' in lines, "+Inf bucket does not hold every observation!"
+        assert 'test_latency_seconds_sum{route="/tickets"} 6.05' in lines, "Histogram sum wrong!"
+        assert 'test_latency_seconds_count{route="/tickets"} 4' in lines, "Histogram count wrong!"
+        assert "# TYPE test_errors_total counter" in lines, "Counter type missing!"
+        assert 'test_errors_total{route="/a\\"b\\\\c\\nd"} 2' in lines, "Label value not escaped!"
+        assert "# TYPE s3dm_cache_hits gauge" in lines and 's3dm_cache_hits{cache="contracts"} 3' in lines, "Stats source not exported as a gauge!"
+        assert 's3dm_cache_enabled{cache="contracts"} 1' in lines, "Boolean stat not exported as 0/1!"
+        assert not any("s3dm_cache_mode" in line or 'cache="broken"' in line for line in lines), "Non-numeric or failed stats exported!"
+        try:
+            latency.labels("/tickets", "extra")
+            assert False, "Wrong label count accepted!"
+        except ValueError as e:
+            print(f"Rejected as expected: {e}")
+
+        # --- Test Rollup Increments ---
+        print("\n--- Testing Rollup Increments ---")
+        ticket = {
+            "issue_type": "router.fault", "severity": "high", "user_location": "Bengaluru, India", "status": "in_progress",
+            "planned_workflow": [
+                {"capability": "remote_diagnostics", "status": "assigned"},
+                {"capability": "onsite$repair", "status": "unassigned"},
+                {"capability": "onsite$repair", "status": "unassigned"},
+                {"status": "unassigned"}
+            ]
+        }
+        increments = _ticket_increments(ticket)
+        print(f"Increments: {increments}")
+        assert increments == {
+            "tickets_created": 1,
+            "by_issue_type.router_fault": 1, # "." and "$" cannot appear in a field path
+            "by_severity.high": 1,
+            "by_city.Bengaluru": 1,
+            "by_status.in_progress": 1,
+            "unassigned_by_capability.onsite_repair": 2,
+            "unassigned_by_capability.unknown": 1
+        }, "Ticket increments wrong!"
+        blank = _ticket_increments({"issue_type": "", "user_location": None})
+        assert blank["by_issue_type.unknown"] == blank["by_severity.unknown"] == blank["by_city.unknown"] == blank["by_status.unknown"] == 1, "Missing fields not counted as unknown!"
+        assert rollup_bucket_start(7199.5) == 3600 and rollup_bucket_id(3600) == "hour:1970-01-01T01", "Hour bucket wrong!"
+        summary = sum_rollups([
+            {"tickets_created": 2, "by_status": {"open": 2}, "feedback": {"ratings": 1}},
+            {"tickets_created": 1, "by_status": {"open": 1, "resolved": 1}}
+        ])
+        assert summary["tickets_created"] == 3 and summary["by_status"] == {"open": 3, "resolved": 1}, "Rollup buckets summed wrong!"
+        assert summary["feedback"] == {"ratings": 1} and summary["by_city"] == {}, "Rollup counter fields missing!"
+
+        # --- Test Trust Score EWMA ---
+        print("\n--- Testing Trust Score EWMA ---")
+        assert rating_to_trust(1) == TRUST_SCORE_MIN and rating_to_trust(5) == TRUST_SCORE_MAX, "Ratings not mapped onto the trust scale!"
+        assert update_trust_score(DEFAULT_TRUST_SCORE, {}) == DEFAULT_TRUST_SCORE, "Empty feedback moved the score!"
+        raised = update_trust_score(DEFAULT_TRUST_SCORE, {"rating": 5})
+        lowered = update_trust_score(DEFAULT_TRUST_SCORE, {"rating": 1})
+        assert DEFAULT_TRUST_SCORE < raised < TRUST_SCORE_MAX and TRUST_SCORE_MIN < lowered < DEFAULT_TRUST_SCORE, "One rating did not move the score part way!"
+        assert update_trust_score(DEFAULT_TRUST_SCORE, {"rating": 3}) < DEFAULT_TRUST_SCORE + 1, "Neutral rating moved the score too far!"
+        assert update_trust_score(DEFAULT_TRUST_SCORE, {"fraud_flag": True}) < update_trust_score(DEFAULT_TRUST_SCORE, {"rating": 1}), "Fraud flag weighs less than the worst rating!"
+        score = DEFAULT_TRUST_SCORE
+        for _ in range(500):
+            score = update_trust_score(score, {"rating": 5})
+        assert TRUST_SCORE_MAX - 0.01 < score <= TRUST_SCORE_MAX, f"Score did not converge to the maximum: {score}"
+        for _ in range(500):
+            score = update_trust_score(score, {"rating": 1, "fraud_flag": True})
+        assert TRUST_SCORE_MIN <= score < TRUST_SCORE_MIN + 0.01, f"Score did not converge to the minimum: {score}"
+        assert update_trust_score(42.0, {}) == TRUST_SCORE_MAX and update_trust_score(-3.0, {}) == TRUST_SCORE_MIN, "Out-of-range scores not clamped!"
+
+        print("\n--- LLOS Tests PASSED! ---")
+
+    except Exception as e:
+        print(f"\n--- LLOS Tests FAILED unexpectedly! ---")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    run_llos_tests()
@@ -0,0 +1,268 @@
+# services/llos/tracing.py
+from typing import List, Optional, Dict, Any, Tuple
+from collections import deque
+from contextvars import ContextVar
+from pymongo import monitoring
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+# --- Tracing Configuration ---
+# Spans are kept in memory: the current span travels in a contextvar, so it follows sync calls, asyncio
+# tasks and asyncio.to_thread alike. A trace starts at a root span (one per HTTP request); a fraction
+# LLOS_TRACE_SAMPLE_RATE of them is recorded, and finished traces go to a ring buffer of the last
+# LLOS_TRACE_BUFFER_SIZE traces (GET /llos/traces). With LLOS_TRACE_EXPORT_FILE set, each finished trace
+# is also appended to that file as one line of OTLP/JSON (an ExportTraceServiceRequest).
+TRACING_ENABLED = os.getenv("LLOS_TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_SAMPLE_RATE = float(os.getenv("LLOS_TRACE_SAMPLE_RATE", "1.0"))
+TRACE_BUFFER_SIZE = int(os.getenv("LLOS_TRACE_BUFFER_SIZE", "256"))
+TRACE_MAX_SPANS = int(os.getenv("LLOS_TRACE_MAX_SPANS", "1000")) # Per trace; further spans are counted, not kept
+TRACE_EXPORT_FILE = os.getenv("LLOS_TRACE_EXPORT_FILE", "")
+SERVICE_NAME = "s3dm-monolith"
+
+class Trace:
+    """The spans of one sampled root operation."""
+    __slots__ = ("trace_id", "spans", "dropped_spans", "root")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.dropped_spans = 0
+        self.root: Optional["Span"] = None
+
+class Span:
+    """One timed operation within a trace. Times are epoch nanoseconds."""
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any], start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        if len(trace.spans) < TRACE_MAX_SPANS:
+            trace.spans.append(self)
+        else:
+            trace.dropped_spans += 1
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": self.duration_ms,
+            "attributes": dict(self.attributes),
+            "error": self.error
+        }
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("llos_current_span", default=None)
+_recent_traces: "deque[Trace]" = deque(maxlen=TRACE_BUFFER_SIZE)
+_recent_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+class _SpanScope:
+    """Context manager that makes a span current for a block and ends it afterwards."""
+    __slots__ = ("name", "attributes", "root", "span", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], root: bool):
+        self.name = name
+        self.attributes = attributes
+        self.root = root
+        self.span: Optional[Span] = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current_span.get()
+        if self.root and parent is None:
+            if not TRACING_ENABLED or random.random() >= TRACE_SAMPLE_RATE:
+                return None
+            trace = Trace(os.urandom(16).hex())
+            self.span = trace.root = Span(trace, self.name, None, self.attributes)
+        elif parent is not None:
+            self.span = Span(parent.trace, self.name, parent.span_id, self.attributes)
+        else:
+            return None # Not inside a sampled trace
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        if span is None:
+            return False
+        span.end()
+        if exc_type is not None:
+            span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        if span.trace.root is span:
+            _finish_trace(span.trace)
+        return False
+
+def start_trace(name: str, **attributes) -> _SpanScope:
+    """Opens the root span of a new (sampled) trace; inside an existing trace it opens a child span instead."""
+    return _SpanScope(name, attributes, root=True)
+
+def span(name: str, **attributes) -> _SpanScope:
+    """Opens a child span of the current span. Outside a sampled trace this records nothing."""
+    return _SpanScope(name, attributes, root=False)
+
+def traced(name: str):
+    """Decorator running every call of a function in a span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _SpanScope(name, {}, root=False):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def set_attributes(**attributes):
+    """Adds attributes to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+# --- Recent Traces ---
+def _finish_trace(trace: Trace):
+    with _recent_lock:
+        _recent_traces.append(trace)
+    if TRACE_EXPORT_FILE:
+        try:
+            line = json.dumps(trace_to_otlp(trace), separators=(",", ":"), default=str)
+            with _export_lock, open(TRACE_EXPORT_FILE, "a") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            print(f"LLOS: Trace export failed: {e}")
+
+def _summary(trace: Trace) -> Dict[str, Any]:
+    root = trace.root
+    return {
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "start": root.start_ns / 1e9,
+        "duration_ms": root.duration_ms,
+        "span_count": len(trace.spans),
+        "error": any(s.error for s in trace.spans),
+        "attributes": dict(root.attributes)
+    }
+
+def list_recent_traces(limit: int = 50, min_duration_ms: float = 0.0, name: Optional[str] = None, errors_only: bool = False) -> List[Dict[str, Any]]:
+    """Summaries of the most recent finished traces (newest first), optionally filtered."""
+    with _recent_lock:
+        traces = list(_recent_traces)
+    summaries = []
+    for trace in reversed(traces):
+        summary = _summary(trace)
+        if summary["duration_ms"] < min_duration_ms or (name and name not in summary["name"]) or (errors_only and not summary["error"]):
+            continue
+        summaries.append(summary)
+        if len(summaries) >= limit:
+            break
+    return summaries
+
+def get_recent_trace(trace_id: str) -> Optional[Trace]:
+    with _recent_lock:
+        for trace in _recent_traces:
+            if trace.trace_id == trace_id:
+                return trace
+    return None
+
+def trace_to_tree(trace: Trace) -> Dict[str, Any]:
+    """The trace as nested spans ("children"), each with its share of the root's duration."""
+    nodes = {s.span_id: dict(s.to_dict(), children=[]) for s in trace.spans}
+    root_duration = trace.root.duration_ms or 0.0
+    for s in trace.spans:
+        node = nodes[s.span_id]
+        node["percent_of_trace"] = round(100.0 * (node["duration_ms"] or 0.0) / root_duration, 1) if root_duration else None
+        if s.parent_id in nodes:
+            nodes[s.parent_id]["children"].append(node)
+    return dict(_summary(trace), dropped_spans=trace.dropped_spans, root=nodes[trace.root.span_id])
+
+# --- OTLP/JSON Export ---
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def trace_to_otlp(trace: Trace) -> Dict[str, Any]:
+    """The trace as an OTLP/JSON ExportTraceServiceRequest, accepted by OpenTelemetry collectors (/v1/traces)."""
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 2 if s is trace.root else 1, # SERVER for the request, INTERNAL otherwise
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns if s.end_ns is not None else s.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1}
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "s3dm.llos.tracing"}, "spans": spans}]
+    }]}
+
+# --- MongoDB Command Spans ---
+class MongoCommandTracer(monitoring.CommandListener):
+    """Adds a span for each MongoDB command issued inside a sampled trace (listeners run in the calling thread)."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], Span] = {}
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        command_name = event.command_name
+        collection = event.command.get("collection") if command_name == "getMore" else event.command.get(command_name)
+        attributes = {"db.system": "mongodb", "db.name": event.database_name, "db.operation": command_name}
+        if isinstance(collection, str):
+            attributes["db.collection"] = collection
+        self._pending[(event.connection_id, event.request_id)] = Span(parent.trace, f"mongo.{command_name}", parent.span_id, attributes)
+
+    def succeeded(self, event):
+        mongo_span = self._pending.pop((event.connection_id, event.request_id), None)
+        if mongo_span is not None:
+            mongo_span.end(mongo_span.start_ns + event.duration_micros * 1000)
+
+    def failed(self, event):
+        mongo_span = self._pending.pop((event.connection_id, event.request_id), None)
+        if mongo_span is not None:
+            mongo_span.end(mongo_span.start_ns + event.duration_micros * 1000)
+            mongo_span.error = str(event.failure.get("errmsg", event.failure)) if isinstance(event.failure, dict) else str(event.failure)
+
+_mongo_tracer: Optional[MongoCommandTracer] = None
+
+def install_mongo_tracer() -> Optional[MongoCommandTracer]:
+    """Registers the command tracer globally. Must run before the services create their MongoClients."""
+    global _mongo_tracer
+    if TRACING_ENABLED and _mongo_tracer is None:
+        _mongo_tracer = MongoCommandTracer()
+        monitoring.register(_mongo_tracer)
+    return _mongo_tracer
@@ -0,0 +1,144 @@
+# services/rsps/admission.py
+from typing import Optional, Dict, Any, Deque
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import re
+import time
+import os
+
+# --- Admission Control Configuration ---
+# At most RSPS_ADMISSION_MAX_CONCURRENT ticket plannings (one Groq call plus the GARS and MongoDB work)
+# run at once per worker; the others wait in one FIFO queue per severity, and a free slot always goes to
+# the most severe waiting ticket. A ticket of a sheddable severity is rejected up front (429 with
+# Retry-After) when its expected queue wait exceeds RSPS_ADMISSION_LATENCY_BUDGET_SECONDS, and no
+# ticket waits longer than RSPS_ADMISSION_MAX_QUEUE_WAIT_SECONDS. The expected wait is estimated from
+# the tickets queued ahead and a moving average of how long a planning takes.
+SEVERITIES = ("critical", "high", "medium", "low") # Most severe first
+DEFAULT_SEVERITY = "medium"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("RSPS_ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_LATENCY_BUDGET_SECONDS = float(os.getenv("RSPS_ADMISSION_LATENCY_BUDGET_SECONDS", "10"))
+ADMISSION_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("RSPS_ADMISSION_MAX_QUEUE_WAIT_SECONDS", "30"))
+ADMISSION_SHED_SEVERITIES = frozenset(s.strip() for s in os.getenv("RSPS_ADMISSION_SHED_SEVERITIES", "medium,low").split(",") if s.strip())
+# Starting estimate of one planning's duration, until real ones are measured
+ADMISSION_INITIAL_SERVICE_SECONDS = 2.0
+ADMISSION_SERVICE_EWMA_ALPHA = 0.2
+
+class AdmissionRejected(Exception):
+    """The ticket was shed; retry_after is a hint in whole seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# --- Severity Pre-classification ---
+# Keyword rules, so a ticket can be prioritized before the LLM has classified it
+_SEVERITY_RULES = (
+    ("critical", re.compile(r"\b(fire|smoke|burning|sparks?|gas|carbon monoxide|co alarm|flood(ing|ed)?|water leak|break[- ]?in|intruder|burglar|alarm (is )?going off)\b")),
+    ("high", re.compile(r"\b(camera|cctv|security|door ?lock|smart ?lock|lock(ed)? out|won'?t lock|no heat|heating|freezing|overheat\w*|outage|offline|dead)\b")),
+    ("low", re.compile(r"\b(flicker\w*|slow|laggy|delay(ed)?|app|update|firmware|color|colour|brightness|schedule|how (do|can) i|question)\b"))
+)
+
+def normalize_severity(severity: Optional[str]) -> Optional[str]:
+    severity = (severity or "").strip().lower()
+    return severity if severity in SEVERITIES else None
+
+def preclassify_severity(user_message: str) -> str:
+    text = user_message.lower()
+    for severity, pattern in _SEVERITY_RULES:
+        if pattern.search(text):
+            return severity
+    return DEFAULT_SEVERITY
+
+class AdmissionController:
+    """Bounded concurrency with per-severity priority queues and latency-budget load shedding (one per worker)."""
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, latency_budget_seconds: float = ADMISSION_LATENCY_BUDGET_SECONDS,
+                 max_queue_wait_seconds: float = ADMISSION_MAX_QUEUE_WAIT_SECONDS, shed_severities=ADMISSION_SHED_SEVERITIES):
+        self.max_concurrent = max(1, max_concurrent)
+        self.latency_budget_seconds = latency_budget_seconds
+        self.max_queue_wait_seconds = max_queue_wait_seconds
+        self.shed_severities = frozenset(shed_severities)
+        self._active = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {severity: deque() for severity in SEVERITIES}
+        self._service_seconds = ADMISSION_INITIAL_SERVICE_SECONDS
+        self._stats = {severity: {"admitted": 0, "shed": 0, "timed_out": 0, "wait_seconds": 0.0} for severity in SEVERITIES}
+
+    def _queued_ahead(self, severity: str) -> int:
+        """Waiting tickets that would be admitted before a new ticket of this severity."""
+        ahead = 0
+        for queued_severity in SEVERITIES:
+            ahead += sum(1 for future in self._queues[queued_severity] if not future.done())
+            if queued_severity == severity:
+                return ahead
+        return ahead
+
+    def estimated_wait(self, severity: str) -> float:
+        if self._active < self.max_concurrent and self._queued_ahead(severity) == 0:
+            return 0.0
+        return (self._queued_ahead(severity) + 1) * self._service_seconds / self.max_concurrent
+
+    @asynccontextmanager
+    async def slot(self, severity: Optional[str]):
+        """Holds one planning slot for the body of the with block. Raises AdmissionRejected."""
+        severity = normalize_severity(severity) or DEFAULT_SEVERITY
+        stats = self._stats[severity]
+        queued_at = time.monotonic()
+        if self._active < self.max_concurrent and self._queued_ahead(severity) == 0:
+            self._active += 1
+        else:
+            expected_wait = self.estimated_wait(severity)
+            if severity in self.shed_severities and expected_wait > self.latency_budget_seconds:
+                stats["shed"] += 1
+                raise AdmissionRejected(f"Ticket intake is overloaded (expected wait {expected_wait:.0f}s); retry later.", math.ceil(expected_wait))
+            await self._wait_for_slot(severity, stats)
+        stats["admitted"] += 1
+        stats["wait_seconds"] += time.monotonic() - queued_at
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_seconds += ADMISSION_SERVICE_EWMA_ALPHA * (elapsed - self._service_seconds)
+            self._release()
+
+    async def _wait_for_slot(self, severity: str, stats: Dict[str, Any]):
+        future = asyncio.get_running_loop().create_future()
+        self._queues[severity].append(future)
+        try:
+            await asyncio.wait_for(future, self.max_queue_wait_seconds)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self._release() # The slot was handed over just as the wait timed out
+            stats["timed_out"] += 1
+            raise AdmissionRejected(f"Ticket waited {self.max_queue_wait_seconds:g}s for planning capacity; retry later.", math.ceil(self.estimated_wait(severity)) or 1)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release() # The slot was handed over just as the request went away
+            raise
+        finally:
+            if future in self._queues[severity]:
+                self._queues[severity].remove(future)
+
+    def _release(self):
+        # Hand the slot straight to the most severe waiting ticket, so newcomers cannot overtake it
+        for severity in SEVERITIES:
+            queue = self._queues[severity]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Flat numeric fields, so they can be exported as gauges."""
+        stats = {"active": self._active, "max_concurrent": self.max_concurrent, "service_seconds": round(self._service_seconds, 3)}
+        for severity in SEVERITIES:
+            stats[f"queued_{severity}"] = sum(1 for future in self._queues[severity] if not future.done())
+            for field, value in self._stats[severity].items():
+                stats[f"{field}_{severity}"] = round(value, 3) if isinstance(value, float) else value
+        return stats
+
+ticket_admission = AdmissionController()
@@ -0,0 +1,187 @@
+# services/rsps/events.py
+from typing import List, Optional, Dict, Any, Set, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import threading
+import os
+from services.cluster.invalidation import invalidation_bus
+
+# --- Ticket Event Streaming Configuration ---
+# Clients follow one ticket or one user's tickets over a server-sent event stream instead of polling
+# the tickets collection. Every saved ticket change (planning, step events, timeouts) is published
+# once to this worker's TicketEventHub, which fans it out to the matching streams, and to the other
+# workers over the invalidation bus (their hubs fan it out the same way). An event is a snapshot of
+# the ticket's progress, so a stream only needs the latest one per ticket: each connection keeps at
+# most RSPS_STREAM_MAX_PENDING tickets with undelivered changes, newer changes replace older ones,
+# and a connection that falls further behind is told to resync (re-read its tickets) instead of
+# buffering without bound. Snapshots carry the ticket's workflow_revision, and changes can arrive out
+# of order (from other workers, or racing a stream's initial read), so a snapshot older than the one
+# pending or the last one delivered for its ticket is dropped.
+STREAM_MAX_PENDING = int(os.getenv("RSPS_STREAM_MAX_PENDING", "100"))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("RSPS_STREAM_MAX_SUBSCRIBERS", "1000"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("RSPS_STREAM_HEARTBEAT_SECONDS", "15"))
+TICKET_EVENT_TOPIC = "rsps.ticket"
+
+class StreamLimitReached(Exception):
+    """This worker already serves RSPS_STREAM_MAX_SUBSCRIBERS streams."""
+
+def ticket_event(ticket: Dict[str, Any]) -> Dict[str, Any]:
+    """The progress snapshot streamed for a ticket (a saved ticket, with "id" or "_id")."""
+    return {
+        "ticket_id": str(ticket.get("id") or ticket.get("_id")),
+        "user_id": ticket.get("user_id"),
+        "status": ticket.get("status"),
+        "workflow_revision": ticket.get("workflow_revision", 0),
+        "current_step_index": ticket.get("current_step_index", 0),
+        "estimated_completion_at": ticket.get("estimated_completion_at"),
+        "resolved_at": ticket.get("resolved_at"),
+        "updated_at": ticket.get("updated_at"),
+        "steps": [
+            {field: step.get(field) for field in ("step_id", "task_name", "status", "assigned_agent_id", "assigned_agent_name", "deadline_at")}
+            for step in ticket.get("planned_workflow", [])
+        ]
+    }
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+class TicketSubscription:
+    """One stream's pending changes, latest per ticket. Changes arrive from any thread; read on the event loop."""
+
+    def __init__(self, ticket_id: Optional[str], user_id: Optional[str], max_pending: int = STREAM_MAX_PENDING):
+        self.ticket_id = ticket_id
+        self.user_id = user_id
+        self.max_pending = max(1, max_pending)
+        self._loop = asyncio.get_running_loop()
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._delivered_revisions: Dict[str, int] = {} # Per ticket
+        self._resync = False
+        self._wakeup = asyncio.Event()
+        self.delivered = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.resyncs = 0
+
+    def offer(self, event: Dict[str, Any]):
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, event)
+        except RuntimeError:
+            pass # The loop is closed: the stream is gone
+
+    def _is_stale(self, event: Dict[str, Any]) -> bool:
+        revision = event.get("workflow_revision")
+        delivered = self._delivered_revisions.get(event["ticket_id"])
+        return revision is not None and delivered is not None and revision <= delivered
+
+    def mark_delivered(self, event: Dict[str, Any]):
+        """Records a snapshot sent outside the queue (the stream's initial read), so older changes are not sent after it."""
+        if event.get("workflow_revision") is not None:
+            self._delivered_revisions[event["ticket_id"]] = max(event["workflow_revision"], self._delivered_revisions.get(event["ticket_id"], -1))
+
+    def _enqueue(self, event: Dict[str, Any]):
+        ticket_id = event["ticket_id"]
+        pending = self._pending.get(ticket_id)
+        if self._is_stale(event) or (pending is not None and (pending.get("workflow_revision") or 0) > (event.get("workflow_revision") or 0)):
+            self.stale += 1 # Arrived after a newer snapshot of the same ticket
+            return
+        if pending is not None:
+            self._pending[ticket_id] = event # Only the latest snapshot matters
+            self.coalesced += 1
+        elif len(self._pending) >= self.max_pending:
+            self._pending.clear()
+            self._resync = True
+            self.resyncs += 1
+        elif not self._resync:
+            self._pending[ticket_id] = event
+        self._wakeup.set()
+
+    async def next_events(self, timeout: float) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """The pending (event name, data) pairs, oldest first; None if nothing arrived within timeout."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._wakeup.clear()
+        if self._resync:
+            self._resync = False
+            return [("resync", {"reason": "stream fell behind; re-read the tickets"})]
+        events = [("ticket", event) for event in self._pending.values() if not self._is_stale(event)]
+        self.stale += len(self._pending) - len(events)
+        self._pending.clear()
+        for _, event in events:
+            self.mark_delivered(event)
+        self.delivered += len(events)
+        return events
+
+class TicketEventHub:
+    """Fans ticket changes out to this worker's streams, by ticket id and by user id."""
+
+    def __init__(self, max_subscribers: int = STREAM_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._by_ticket: Dict[str, Set[TicketSubscription]] = {}
+        self._by_user: Dict[str, Set[TicketSubscription]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "received": 0, "dispatched": 0, "rejected_subscribers": 0}
+        self._closed = {"delivered": 0, "coalesced": 0, "stale": 0, "resyncs": 0}
+
+    def subscribe(self, ticket_id: Optional[str] = None, user_id: Optional[str] = None) -> TicketSubscription:
+        """Follows one ticket or all of one user's tickets (call from the event loop). Raises StreamLimitReached."""
+        if (ticket_id is None) == (user_id is None):
+            raise ValueError("Subscribe to either a ticket_id or a user_id.")
+        subscription = TicketSubscription(ticket_id, user_id)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self._stats["rejected_subscribers"] += 1
+                raise StreamLimitReached(f"This worker already serves {self.max_subscribers} ticket streams; retry later.")
+            index, key = (self._by_ticket, ticket_id) if ticket_id is not None else (self._by_user, user_id)
+            index.setdefault(key, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: TicketSubscription):
+        with self._lock:
+            index, key = (self._by_ticket, subscription.ticket_id) if subscription.ticket_id is not None else (self._by_user, subscription.user_id)
+            subscribers = index.get(key)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del index[key]
+            self._count -= 1
+            for field in self._closed:
+                self._closed[field] += getattr(subscription, field)
+
+    def publish(self, ticket: Dict[str, Any]):
+        """Streams a saved ticket change here and on the other workers. Never raises into the write."""
+        try:
+            event = ticket_event(ticket)
+            self._stats["published"] += 1
+            self.dispatch(event)
+            invalidation_bus.publish(TICKET_EVENT_TOPIC, **event)
+        except Exception as e:
+            print(f"RSPS: Failed to publish ticket event: {e}")
+
+    def _on_remote_event(self, event: Dict[str, Any]):
+        self._stats["received"] += 1
+        self.dispatch(event)
+
+    def dispatch(self, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._by_ticket.get(event["ticket_id"], ()))
+            if event.get("user_id") is not None:
+                subscribers.extend(self._by_user.get(event["user_id"], ()))
+        for subscription in subscribers:
+            subscription.offer(event)
+        self._stats["dispatched"] += len(subscribers)
+
+    def stats(self) -> Dict[str, Any]:
+        """Flat numeric fields, so they can be exported as gauges."""
+        with self._lock:
+            open_subscriptions = [subscription for subscribers in (*self._by_ticket.values(), *self._by_user.values()) for subscription in subscribers]
+            totals = {field: value + sum(getattr(subscription, field) for subscription in open_subscriptions) for field, value in self._closed.items()}
+            return dict(self._stats, **totals, subscribers=self._count, max_subscribers=self.max_subscribers)
+
+ticket_events = TicketEventHub()
+invalidation_bus.subscribe(TICKET_EVENT_TOPIC, ticket_events._on_remote_event)
@@ -0,0 +1,202 @@
+# services/rsps/idempotency.py
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import hashlib
+import json
+import time
+import os
+from services.cluster import WORKER_ID
+
+# --- Idempotency Configuration ---
+# A ticket submission runs once per idempotency key. The key is the client's Idempotency-Key header
+# (scoped to the user) or, without one, a hash of (user, message, location, time bucket), so blind
+# retries of the same complaint within RSPS_IDEMPOTENCY_BUCKET_SECONDS collapse too (a retry that
+# crosses a bucket boundary still creates a second ticket). Anonymous submissions without a header
+# are not deduplicated: different customers may send the same message. Keys live in idempotency_keys, whose _id
+# is the key, so its unique index lets exactly one request claim a key. Retries of a running request
+# wait for its result (in process through a shared future, from other workers by polling); retries of
+# a finished one get the stored response. Failed or cancelled runs release the key so the next retry
+# runs again.
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("RSPS_IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_BUCKET_SECONDS = int(os.getenv("RSPS_IDEMPOTENCY_BUCKET_SECONDS", "300"))
+# A pending key not finished after this long belongs to a worker that died; the next retry takes it over
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = float(os.getenv("RSPS_IDEMPOTENCY_PENDING_TIMEOUT_SECONDS", "120"))
+# How long a retry waits for a request running on another worker before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("RSPS_IDEMPOTENCY_WAIT_SECONDS", "60"))
+IDEMPOTENCY_POLL_SECONDS = 0.25
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+class IdempotencyPending(Exception):
+    """The request holding the key is still running on another worker."""
+
+def _sha256(*parts: Optional[str]) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+def request_fingerprint(user_message: str, user_location: str) -> str:
+    return _sha256(user_message.strip(), user_location.strip())
+
+def idempotency_key_for(user_id: Optional[str], header_key: Optional[str], user_message: str, user_location: str, now: Optional[float] = None) -> Optional[str]:
+    """
+    The header key scoped to the user, or the content-hash fallback for a known user; None (no deduplication)
+    for an anonymous request without a header key. Raises ValueError for an invalid header key.
+    """
+    if header_key is not None:
+        header_key = header_key.strip()
+        if not header_key or len(header_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValueError(f"{IDEMPOTENCY_HEADER} must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+        return f"key:{_sha256(user_id, header_key)}"
+    if user_id is None:
+        return None
+    bucket = int((now if now is not None else time.time()) // IDEMPOTENCY_BUCKET_SECONDS)
+    return f"content:{_sha256(user_id, user_message.strip().lower(), user_location.strip().lower(), str(bucket))}"
+
+class IdempotencyStore:
+    """The idempotency_keys collection: claim a key, then complete or release it."""
+
+    def __init__(self, db_provider: Callable[[], Any], owner: str = WORKER_ID):
+        self.db_provider = db_provider
+        self.owner = owner
+        self._indexes_ready = False
+
+    def _collection(self):
+        collection = self.db_provider()[IDEMPOTENCY_COLLECTION]
+        if not self._indexes_ready:
+            collection.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS, name="created_at_ttl")
+            self._indexes_ready = True
+        return collection
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        (True, None) if this request now holds the key and must run; otherwise (False, record) with the
+        pending or completed record of the request that holds it. Raises IdempotencyConflict.
+        """
+        collection = self._collection()
+        now = time.time()
+        try:
+            collection.insert_one({"_id": key, "state": "pending", "fingerprint": fingerprint, "owner": self.owner, "started_at": now, "created_at": datetime.now(timezone.utc)})
+            return True, None
+        except DuplicateKeyError:
+            pass
+        record = collection.find_one({"_id": key})
+        if record is None:
+            return self.claim(key, fingerprint) # Released (or expired) in between
+        if record["fingerprint"] != fingerprint:
+            raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was already used for a different request.")
+        if record["state"] == "pending" and record["started_at"] < now - IDEMPOTENCY_PENDING_TIMEOUT_SECONDS:
+            # Take over from a dead worker; the started_at condition lets only one retry do so
+            taken = collection.find_one_and_update(
+                {"_id": key, "state": "pending", "started_at": record["started_at"]},
+                {"$set": {"owner": self.owner, "started_at": now}}
+            )
+            if taken is not None:
+                print(f"RSPS: Took over idempotency key {key} from {record['owner']}.")
+                return True, None
+            record = collection.find_one({"_id": key}) or record
+        return False, record
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._collection().find_one({"_id": key})
+
+    def complete(self, key: str, response: Dict[str, Any]):
+        self._collection().update_one({"_id": key, "owner": self.owner}, {"$set": {"state": "completed", "response": response, "completed_at": time.time()}})
+
+    def release(self, key: str):
+        self._collection().delete_one({"_id": key, "owner": self.owner, "state": "pending"})
+
+class IdempotentRunner:
+    """Runs a submission (a coroutine function) at most once per key across retries, workers included."""
+
+    def __init__(self, store: IdempotencyStore):
+        self.store = store
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._stats = {"executed": 0, "replayed": 0, "attached": 0, "conflicts": 0, "failed": 0, "unkeyed": 0}
+
+    async def run(self, key: Optional[str], fingerprint: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """(response, replayed): replayed is True when the response comes from an earlier request with the key. No key: just runs fn."""
+        if key is None:
+            self._stats["unkeyed"] += 1
+            return await fn(), False
+        while key in self._inflight:
+            inflight_fingerprint, inflight_future = self._inflight[key]
+            if inflight_fingerprint != fingerprint:
+                self._stats["conflicts"] += 1
+                raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was already used for a different request.")
+            # A retry of a request this worker is running: share its outcome
+            self._stats["attached"] += 1
+            try:
+                response, _ = await asyncio.shield(inflight_future)
+                return response, True
+            except asyncio.CancelledError:
+                if not inflight_future.cancelled():
+                    raise # This retry itself was cancelled
+                # The original request was cancelled and released the key: run (or attach) again
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            outcome = await self._run_claimed(key, fingerprint, fn)
+            future.set_result(outcome)
+            return outcome
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # Retrieved here: no warning when nobody attached
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _run_claimed(self, key: str, fingerprint: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            try:
+                claimed, record = await asyncio.to_thread(self.store.claim, key, fingerprint)
+            except IdempotencyConflict:
+                self._stats["conflicts"] += 1
+                raise
+            if claimed:
+                break
+            if record["state"] == "completed":
+                self._stats["replayed"] += 1
+                return record["response"], True
+            # Running on another worker: wait for it to complete, or to release the key after a failure
+            self._stats["attached"] += 1
+            while time.monotonic() < deadline:
+                await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+                record = await asyncio.to_thread(self.store.get, key)
+                if record is None or record["state"] == "completed":
+                    break
+            else:
+                raise IdempotencyPending("A request with this key is still being processed.")
+            if record is not None:
+                self._stats["replayed"] += 1
+                return record["response"], True
+        try:
+            response = await fn()
+        except asyncio.CancelledError:
+            # The client disconnected or the server is stopping: free the key (even if cancelled again) so a retry runs
+            await asyncio.shield(asyncio.to_thread(self.store.release, key))
+            raise
+        except Exception:
+            self._stats["failed"] += 1
+            await asyncio.to_thread(self.store.release, key)
+            raise
+        await asyncio.to_thread(self.store.complete, key, response)
+        self._stats["executed"] += 1
+        return response, False
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, inflight=len(self._inflight))
+
+def _rsps_db():
+    from services.rsps.main import get_mongo_db_connection
+    return get_mongo_db_connection()
+
+ticket_submissions = IdempotentRunner(IdempotencyStore(_rsps_db))
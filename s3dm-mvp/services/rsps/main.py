@@ -4,16 +4,18 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
 from services.issue_mapping_agent.map_issue import map_issue
 from services.gars.gars_core import query_agents
+from services.llos.tracing import traced, set_attributes
+from services.llos.rollups import record_ticket_created
+from services.rsps.workflows import workflow_templates, estimate_completion, start_ready_steps
+from services.rsps.runtime import step_timers
+from services.rsps.events import ticket_events
 from typing import List, Optional, Dict, Any
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from bson import ObjectId
-from dotenv import load_dotenv
 import os
 import time
-
-# Load environment variables from .env file
-load_dotenv()
+import threading
 
 # --- MongoDB Setup ---
 MONGO_URI = os.getenv("MONGO_URI")
@@ -21,17 +23,21 @@ if not MONGO_URI:
     raise ValueError("MONGO_URI environment variable not set. Please create a .env file in services/rsps.")
 
 client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
 
 def get_mongo_db_connection():
     global client
     if client is None:
-        try:
-            client = MongoClient(MONGO_URI)
-            client.admin.command('ping')
-            print("RSPS Core: MongoDB connection successful!")
-        except ConnectionFailure as e:
-            print(f"RSPS Core: MongoDB connection failed: {e}")
-            raise
+        with _client_lock:
+            if client is None:
+                try:
+                    new_client = MongoClient(MONGO_URI)
+                    new_client.admin.command('ping')
+                    client = new_client
+                    print("RSPS Core: MongoDB connection successful!")
+                except ConnectionFailure as e:
+                    print(f"RSPS Core: MongoDB connection failed: {e}")
+                    raise
 
     db_name = "s3dm_db"
     return client[db_name]
@@ -42,38 +48,11 @@ def close_mongo_db_connection():
         client.close()
         print("RSPS Core: MongoDB connection closed.")
 
-# --- Workflow Templates ---
-WORKFLOW_TEMPLATES = {
-    "lighting_fault": [
-        {"task_name": "Remote Diagnostics", "capability": "remote_diagnostics", "description": "Perform initial remote diagnostics of the smart light."},
-        {"task_name": "Physical Repair", "capability": "smart_lighting_repair", "description": "Dispatch technician for physical repair."},
-        {"task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test."}
-    ],
-    "temperature_control_issue": [
-        {"task_name": "Remote Diagnostics", "capability": "remote_diagnostics", "description": "Perform initial remote diagnostics of the thermostat."},
-        {"task_name": "HVAC Repair", "capability": "hvac_repair", "description": "Dispatch HVAC specialist for repair."},
-        {"task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test."}
-    ],
-    "security_camera_fault": [
-        {"task_name": "Remote Diagnostics", "capability": "remote_diagnostics", "description": "Perform initial remote diagnostics of the security camera."},
-        {"task_name": "Network Diagnostics", "capability": "network_diagnostics", "description": "Check network connectivity for camera."},
-        {"task_name": "Physical Repair", "capability": "security_system_repair", "description": "Dispatch technician for physical repair if needed."},
-        {"task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test."}
-    ],
-    "general_device_fault": [
-        {"task_name": "Initial Assessment", "capability": "general_diagnostics", "description": "Perform general remote diagnostics."},
-        {"task_name": "General Repair", "capability": "general_diagnostics", "description": "Dispatch general technician for repair."},
-        {"task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test."}
-    ],
-    "unclassified_issue": [
-        {"task_name": "Initial Assessment", "capability": "general_diagnostics", "description": "Perform initial assessment for unclassified issue."},
-        {"task_name": "Manual Review", "capability": "manual_review", "description": "Escalate for manual review by human agent."}
-    ]
-}
-
 # --- Data Models ---
-def create_ticket_data_doc(original_user_message, issue_type, device_type, severity, user_location, status="Received"):
+def create_ticket_data_doc(original_user_message, issue_type, device_type, severity, user_location, status="Received", user_id=None):
+    created_at = time.time()
     return {
+        "user_id": user_id,
         "original_user_message": original_user_message,
         "issue_type": issue_type,
         "device_type": device_type,
@@ -82,11 +61,16 @@ def create_ticket_data_doc(original_user_message, issue_type, device_type, sever
         "status": status,
         "planned_workflow": [],
         "current_step_index": 0,
-        "created_at": time.time()
+        "workflow_revision": 0,
+        "created_at": created_at,
+        "updated_at": created_at
     }
 
-def create_workflow_step_data(task_name, capability, description, status="pending", assigned_agent_id=None, assigned_agent_name=None, start_time=None, end_time=None):
+def create_workflow_step_data(task_name, capability, description, status="pending", assigned_agent_id=None, assigned_agent_name=None, start_time=None, end_time=None, step_id=None, depends_on=None, estimated_minutes=None):
     return {
+        "step_id": step_id,
+        "depends_on": depends_on or [],
+        "estimated_minutes": estimated_minutes,
         "task_name": task_name,
         "capability": capability,
         "description": description,
@@ -98,7 +82,8 @@ def create_workflow_step_data(task_name, capability, description, status="pendin
     }
 
 # --- Core RSPS Logic ---
-def plan_and_submit_ticket(user_message: str, user_location: str) -> Dict[str, Any]:
+@traced("rsps.plan_and_submit_ticket")
+def plan_and_submit_ticket(user_message: str, user_location: str, user_id: Optional[str] = None) -> Dict[str, Any]:
     db = get_mongo_db_connection()
     tickets_collection = db["tickets"]
 
@@ -112,21 +97,24 @@ def plan_and_submit_ticket(user_message: str, user_location: str) -> Dict[str, A
             mapped_data['device_type'],
             mapped_data['severity'],
             user_location,
-            status="Processing"
+            status="Processing",
+            user_id=user_id
         )
         result = tickets_collection.insert_one(new_ticket_doc)
         ticket_id_str = str(result.inserted_id)
+        set_attributes(ticket_id=ticket_id_str, issue_type=mapped_data['issue_type'], severity=mapped_data['severity'])
         new_ticket_doc["_id"] = result.inserted_id
 
-        workflow_template = WORKFLOW_TEMPLATES.get(mapped_data["issue_type"], WORKFLOW_TEMPLATES["general_device_fault"])
+        workflow_template = workflow_templates.get(db, mapped_data["issue_type"])
         planned_workflow_steps = []
         all_agents_found = True
 
         city, country = (user_location.split(',') + [None]*2)[:2]
         city, country = city.strip(), country.strip() if country else None
 
-        for task in workflow_template:
+        for task in workflow_template["steps"]:
             required_capability = task["capability"]
+            step_fields = {"step_id": task["step_id"], "depends_on": task.get("depends_on", []), "estimated_minutes": task.get("estimated_minutes")}
             try:
                 agents = query_agents(required_capability, country, city)
             except Exception as e:
@@ -135,17 +123,32 @@ def plan_and_submit_ticket(user_message: str, user_location: str) -> Dict[str, A
 
             if agents:
                 agent = agents[0]
-                planned_workflow_steps.append(create_workflow_step_data(task["task_name"], required_capability, task["description"], assigned_agent_id=agent["id"], assigned_agent_name=agent["name"]))
+                planned_workflow_steps.append(create_workflow_step_data(task["task_name"], required_capability, task["description"], assigned_agent_id=agent["id"], assigned_agent_name=agent["name"], **step_fields))
             else:
                 all_agents_found = False
-                planned_workflow_steps.append(create_workflow_step_data(task["task_name"], required_capability, task["description"], status="unassigned"))
+                planned_workflow_steps.append(create_workflow_step_data(task["task_name"], required_capability, task["description"], status="unassigned", **step_fields))
 
         ticket_status = "Workflow Planned" if all_agents_found else "Workflow Partially Planned (Missing Agents)"
-        tickets_collection.update_one({"_id": ObjectId(ticket_id_str)}, {"$set": {"planned_workflow": planned_workflow_steps, "status": ticket_status}})
+        # Steps without dependencies start right away, in parallel; the rest start as their dependencies complete
+        now = time.time()
+        start_ready_steps(planned_workflow_steps, now)
+        estimated_completion_at, critical_path = estimate_completion(planned_workflow_steps, now)
+        tickets_collection.update_one({"_id": ObjectId(ticket_id_str)}, {"$set": {
+            "planned_workflow": planned_workflow_steps,
+            "status": ticket_status,
+            "template_version": workflow_template.get("version"),
+            "critical_path": critical_path,
+            "estimated_completion_at": estimated_completion_at,
+            "updated_at": now
+        }, "$inc": {"workflow_revision": 1}}) # A new revision, so streams opened on the received ticket see the plan
+        set_attributes(status=ticket_status)
 
         updated_ticket = tickets_collection.find_one({"_id": ObjectId(ticket_id_str)})
         if updated_ticket:
+            record_ticket_created(db, updated_ticket)
             updated_ticket["id"] = str(updated_ticket.pop("_id"))
+            step_timers.sync_ticket(updated_ticket) # Deadlines of the steps started above
+            ticket_events.publish(updated_ticket)
         return updated_ticket
 
     except Exception as e:
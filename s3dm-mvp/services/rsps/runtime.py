@@ -0,0 +1,197 @@
+# services/rsps/runtime.py
+from typing import List, Optional, Dict, Any, Callable, Tuple
+import heapq
+import threading
+import time
+import os
+from services.gars.gars_core import query_agents
+from services.rsps.workflows import update_workflow, step_deadline
+
+# --- Workflow Runtime Configuration ---
+# Agents report progress on their steps as events (started, completed, failed). A completed step starts
+# the steps it unblocks (services.rsps.workflows). Every running step has a deadline_at; the deadlines
+# are kept in an in-memory min-heap served by one timer thread, so scheduling costs O(log n) and the
+# tickets collection is never polled. When a step fails or misses its deadline it is reassigned to
+# another agent with the capability, at most RSPS_STEP_MAX_REASSIGNMENTS times; after that (or when no
+# other agent is available) the step and its ticket are escalated for manual handling.
+# Timers are per worker: each worker schedules the steps it starts, and the leader reloads the deadlines
+# of all running steps at startup and whenever a worker takes the leadership over. A timer only acts if
+# the step still has the deadline it was set for, so a stale or duplicate timer is harmless.
+STEP_TIMEOUTS_ENABLED = os.getenv("RSPS_STEP_TIMEOUTS_ENABLED", "true").lower() == "true"
+STEP_MAX_REASSIGNMENTS = int(os.getenv("RSPS_STEP_MAX_REASSIGNMENTS", "2"))
+STEP_EVENTS = ("started", "completed", "failed")
+
+class DeadlineTimers:
+    """Min-heap of (deadline, ticket_id, step_id); stale entries are skipped when they reach the top."""
+
+    def __init__(self, on_expired: Callable[[str, str, float], None]):
+        self.on_expired = on_expired
+        self._heap: List[Tuple[float, str, str]] = []
+        self._scheduled: Dict[Tuple[str, str], float] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._stats = {"fired": 0, "handler_errors": 0}
+
+    def schedule(self, ticket_id: str, step_id: str, deadline: float):
+        with self._condition:
+            if not self._running or self._scheduled.get((ticket_id, step_id)) == deadline:
+                return # Not started (timeouts disabled, or a script) or already scheduled
+            self._scheduled[(ticket_id, step_id)] = deadline
+            heapq.heappush(self._heap, (deadline, ticket_id, step_id))
+            if len(self._heap) > 2 * len(self._scheduled) + 1024:
+                # Mostly cancelled entries: rebuild from the live ones
+                self._heap = [(d, t, s) for (t, s), d in self._scheduled.items()]
+                heapq.heapify(self._heap)
+            if self._heap[0][0] == deadline:
+                self._condition.notify() # New earliest deadline: re-arm the wait
+
+    def cancel(self, ticket_id: str, step_id: str):
+        with self._condition:
+            self._scheduled.pop((ticket_id, step_id), None)
+
+    def sync_ticket(self, ticket: Dict[str, Any]):
+        """Schedules the deadlines of a ticket's running steps and cancels those of its other steps."""
+        for step in ticket.get("planned_workflow", []):
+            if not step.get("step_id"):
+                continue
+            if step.get("status") == "in_progress" and step.get("deadline_at"):
+                self.schedule(ticket["id"], step["step_id"], step["deadline_at"])
+            else:
+                self.cancel(ticket["id"], step["step_id"])
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="rsps-step-timers", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def _next_due(self) -> Optional[Tuple[str, str, float]]:
+        """Waits for the earliest live deadline to pass; None once stopped."""
+        with self._condition:
+            while self._running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                deadline, ticket_id, step_id = self._heap[0]
+                if self._scheduled.get((ticket_id, step_id)) != deadline:
+                    heapq.heappop(self._heap) # Cancelled or rescheduled
+                    continue
+                delay = deadline - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                del self._scheduled[(ticket_id, step_id)]
+                return ticket_id, step_id, deadline
+        return None
+
+    def _run(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            self._stats["fired"] += 1
+            try:
+                self.on_expired(*due)
+            except Exception as e:
+                self._stats["handler_errors"] += 1
+                print(f"RSPS: Step timeout handling failed for ticket {due[0]} step {due[1]}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            next_deadline = self._heap[0][0] if self._heap else None
+            return dict(self._stats, scheduled=len(self._scheduled), heap_entries=len(self._heap), running=self._running, next_deadline=next_deadline)
+
+# --- Step Events ---
+def _ticket_region(ticket: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    city, country = ((ticket.get("user_location") or "").split(",") + [None] * 2)[:2]
+    return (city.strip() or None), (country.strip() if country else None)
+
+def _reassign_or_escalate(ticket: Dict[str, Any], step: Dict[str, Any], now: float, reason: str):
+    """Hands a failed or overdue step to another capable agent, or escalates it."""
+    tried = set(step.get("attempted_agent_ids") or []) | {step.get("assigned_agent_id")}
+    candidates = []
+    if step.get("reassignments", 0) < STEP_MAX_REASSIGNMENTS:
+        city, country = _ticket_region(ticket)
+        try:
+            candidates = [agent for agent in query_agents(step["capability"], country, city) if agent["id"] not in tried]
+        except Exception as e:
+            print(f"RSPS: GARS query error while reassigning step '{step['step_id']}': {e}")
+    step["attempted_agent_ids"] = sorted(agent_id for agent_id in tried if agent_id)
+    if candidates:
+        step.update(assigned_agent_id=candidates[0]["id"], assigned_agent_name=candidates[0]["name"], start_time=now, acknowledged_at=None, deadline_at=step_deadline(step, now), reassignments=step.get("reassignments", 0) + 1, last_failure=reason)
+        print(f"RSPS: Reassigned step '{step['step_id']}' of ticket {ticket['_id']} to {candidates[0]['name']} ({reason}).")
+    else:
+        step.update(status="escalated", deadline_at=None, escalated_at=now, last_failure=reason)
+        print(f"RSPS: Escalated step '{step['step_id']}' of ticket {ticket['_id']} ({reason}).")
+
+def apply_step_event(db, ticket_id: str, step_id: str, event: str, agent_id: Optional[str] = None, details: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Applies an agent's step event and returns the updated ticket. Repeating an event for a step that
+    has already moved on (a redelivery) changes nothing. Raises ValueError.
+    """
+    if event not in STEP_EVENTS:
+        raise ValueError(f"Unknown step event '{event}'. Expected one of {', '.join(STEP_EVENTS)}.")
+
+    def change(ticket: Dict[str, Any], now: float):
+        step = next((step for step in ticket["planned_workflow"] if step["step_id"] == step_id), None)
+        if step is None:
+            raise ValueError(f"Ticket '{ticket_id}' has no step '{step_id}'.")
+        if agent_id is not None and agent_id != step.get("assigned_agent_id"):
+            if agent_id in (step.get("attempted_agent_ids") or []):
+                return False # Late report from an agent the step was taken away from
+            raise ValueError(f"Step '{step_id}' is not assigned to agent '{agent_id}'.")
+        if step["status"] in ("completed", "escalated"):
+            return False
+        if step["status"] != "in_progress":
+            raise ValueError(f"Step '{step_id}' is {step['status']}, not in_progress.")
+        if event == "started":
+            if step.get("acknowledged_at"):
+                return False
+            step["acknowledged_at"] = now
+        elif event == "completed":
+            step.update(status="completed", end_time=now, deadline_at=None)
+        else:
+            _reassign_or_escalate(ticket, step, now, f"failed: {details}" if details else "failed")
+
+    ticket = update_workflow(db, ticket_id, change)
+    step_timers.sync_ticket(ticket)
+    return ticket
+
+def handle_step_timeout(db, ticket_id: str, step_id: str, deadline: float) -> Dict[str, Any]:
+    """Reassigns or escalates a step that is still running past the given deadline."""
+    def change(ticket: Dict[str, Any], now: float):
+        step = next((step for step in ticket["planned_workflow"] if step["step_id"] == step_id), None)
+        if step is None or step["status"] != "in_progress" or step.get("deadline_at") != deadline:
+            return False # Completed, reassigned or rescheduled in the meantime
+        _reassign_or_escalate(ticket, step, now, "deadline missed")
+
+    ticket = update_workflow(db, ticket_id, change)
+    step_timers.sync_ticket(ticket)
+    return ticket
+
+def load_step_deadlines(db) -> int:
+    """Schedules the deadlines of all running steps (on the leader, when it starts leading); returns how many."""
+    tickets_collection = db["tickets"]
+    tickets_collection.create_index("planned_workflow.status", name="planned_workflow_status")
+    loaded = 0
+    for ticket in tickets_collection.find({"planned_workflow.status": "in_progress"}, {"planned_workflow.step_id": 1, "planned_workflow.status": 1, "planned_workflow.deadline_at": 1}):
+        ticket["id"] = str(ticket.pop("_id"))
+        step_timers.sync_ticket(ticket)
+        loaded += sum(1 for step in ticket["planned_workflow"] if step.get("status") == "in_progress" and step.get("deadline_at"))
+    print(f"RSPS: Scheduled {loaded} step deadlines.")
+    return loaded
+
+def _rsps_db():
+    from services.rsps.main import get_mongo_db_connection
+    return get_mongo_db_connection()
+
+step_timers = DeadlineTimers(lambda ticket_id, step_id, deadline: handle_step_timeout(_rsps_db(), ticket_id, step_id, deadline))
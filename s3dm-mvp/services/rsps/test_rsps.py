@@ -0,0 +1,389 @@
+# services/rsps/test_rsps.py
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+import asyncio
+import threading
+import time
+from services.rsps.idempotency import IdempotentRunner, idempotency_key_for
+from services.rsps.workflows import topological_order, validate_template, estimate_completion, start_ready_steps
+from services.rsps.runtime import DeadlineTimers
+from services.rsps.tickets import list_tickets, encode_ticket_cursor, decode_ticket_cursor, TICKET_PAGE_MAX_LIMIT
+from services.rsps.main import get_mongo_db_connection
+from services.rsps.events import TicketEventHub, StreamLimitReached, ticket_event
+from services.rsps.admission import AdmissionController, AdmissionRejected, preclassify_severity, normalize_severity
+from pymongo.errors import ConnectionFailure
+from bson import ObjectId
+
+class InMemoryIdempotencyStore:
+    """The IdempotencyStore interface over a dict, for exercising IdempotentRunner without MongoDB."""
+
+    def __init__(self):
+        self.records = {}
+
+    def claim(self, key, fingerprint):
+        if key in self.records:
+            return False, self.records[key]
+        self.records[key] = {"state": "pending", "fingerprint": fingerprint}
+        return True, None
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def complete(self, key, response):
+        self.records[key].update(state="completed", response=response)
+
+    def release(self, key):
+        if self.records.get(key, {}).get("state") == "pending":
+            del self.records[key]
+
+def run_rsps_tests():
+    print("--- Running RSPS Tests ---")
+    try:
+        # --- Test Idempotency Keys ---
+        print("\n--- Testing Idempotency Keys ---")
+        message, location = "My camera is offline", "Bengaluru, India"
+        assert idempotency_key_for(None, None, message, location) is None, "Anonymous requests share a content key!"
+        assert idempotency_key_for("user-1", None, message, location, now=1000) == idempotency_key_for("user-1", None, message.upper() + " ", location, now=1001), "Blind retry got a new key!"
+        assert idempotency_key_for("user-1", None, message, location) != idempotency_key_for("user-2", None, message, location), "Content key not scoped to the user!"
+        assert idempotency_key_for(None, "abc", message, location).startswith("key:"), "Header key ignored for an anonymous request!"
+        try:
+            idempotency_key_for("user-1", " ", message, location)
+            assert False, "Blank Idempotency-Key accepted!"
+        except ValueError as e:
+            print(f"Rejected as expected: {e}")
+
+        async def idempotent_runs():
+            store = InMemoryIdempotencyStore()
+            runner = IdempotentRunner(store)
+            calls = []
+
+            async def submit():
+                calls.append(1)
+                return {"id": f"ticket-{len(calls)}"}
+
+            assert await runner.run(None, "fp", submit) == ({"id": "ticket-1"}, False)
+            assert await runner.run(None, "fp", submit) == ({"id": "ticket-2"}, False), "Unkeyed requests were deduplicated!"
+            assert await runner.run("k1", "fp", submit) == ({"id": "ticket-3"}, False)
+            assert await runner.run("k1", "fp", submit) == ({"id": "ticket-3"}, True), "Retry was not replayed!"
+
+            started = asyncio.Event()
+
+            async def hanging_submit():
+                started.set()
+                await asyncio.sleep(60)
+
+            task = asyncio.create_task(runner.run("k2", "fp", hanging_submit))
+            await started.wait()
+            task.cancel()
+            try:
+                await task
+                assert False, "Cancelled submission completed!"
+            except asyncio.CancelledError:
+                pass
+            assert "k2" not in store.records, "Cancelled submission kept its idempotency key!"
+            assert await runner.run("k2", "fp", submit) == ({"id": "ticket-4"}, False), "Retry after a cancellation was not run!"
+
+            started.clear()
+            task = asyncio.create_task(runner.run("k3", "fp", hanging_submit))
+            await started.wait()
+            retry = asyncio.create_task(runner.run("k3", "fp", submit))
+            await asyncio.sleep(0) # The retry attaches to the running request
+            task.cancel()
+            assert await retry == ({"id": "ticket-5"}, False), "Attached retry did not run after the original was cancelled!"
+            assert task.cancelled(), "Cancelled submission completed!"
+            assert await runner.run("k3", "fp", submit) == ({"id": "ticket-5"}, True), "Retry of the attached run was not replayed!"
+            return runner.stats()
+
+        stats = asyncio.run(idempotent_runs())
+        print(f"Runner Stats: {stats}")
+        assert stats["unkeyed"] == 2 and stats["executed"] == 3 and stats["replayed"] == 2 and stats["attached"] == 1, "Runner stats wrong!"
+
+        # --- Test Admission Control ---
+        print("\n--- Testing Admission Control ---")
+        assert preclassify_severity("I smell smoke near the thermostat") == "critical", "Smoke not classified as critical!"
+        assert preclassify_severity("The camera went offline") == "high", "Offline camera not classified as high!"
+        assert preclassify_severity("How do I change the light schedule?") == "low", "Question not classified as low!"
+        assert preclassify_severity("Something is odd") == "medium", "Unmatched message not given the default severity!"
+        assert normalize_severity(" HIGH ") == "high" and normalize_severity("urgent") is None, "Severity not normalized!"
+
+        async def admission_runs():
+            controller = AdmissionController(max_concurrent=1, latency_budget_seconds=100, max_queue_wait_seconds=5, shed_severities={"low"})
+            order = []
+            release_first = asyncio.Event()
+
+            async def plan(name, severity, hold=None):
+                async with controller.slot(severity):
+                    order.append(name)
+                    if hold is not None:
+                        await hold.wait()
+
+            first = asyncio.create_task(plan("first", "medium", release_first))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(plan(name, severity)) for name, severity in (("low", "low"), ("medium", "medium"), ("critical", "critical"))]
+            await asyncio.sleep(0)
+            queued = controller.stats()
+            assert queued["active"] == 1 and queued["queued_low"] == queued["queued_medium"] == queued["queued_critical"] == 1, "Tickets not queued by severity!"
+            # A newcomer must not overtake the queue while the slot is being handed over
+            release_first.set()
+            late = asyncio.create_task(plan("late", "high"))
+            await asyncio.gather(first, late, *waiters)
+            assert order == ["first", "critical", "late", "medium", "low"], f"Slots not handed to the most severe ticket first: {order}"
+            assert controller.stats()["active"] == 0, "Slot leaked after the queue drained!"
+
+            # Shedding: only sheddable severities are rejected when the expected wait exceeds the budget
+            controller.latency_budget_seconds = 0
+            release_first.clear()
+            holder = asyncio.create_task(plan("holder", "critical", release_first))
+            await asyncio.sleep(0)
+            try:
+                await plan("shed", "low")
+                assert False, "Low-severity ticket over the latency budget was admitted!"
+            except AdmissionRejected as e:
+                assert e.retry_after >= 1, "Shed ticket has no Retry-After hint!"
+                print(f"Shed as expected: {e} (retry after {e.retry_after}s)")
+            kept = asyncio.create_task(plan("kept", "high"))
+
+            # A waiter that gives up (client went away) leaves no slot or queue entry behind
+            gone = asyncio.create_task(plan("gone", "medium"))
+            await asyncio.sleep(0)
+            gone.cancel()
+            await asyncio.gather(gone, return_exceptions=True)
+            release_first.set()
+            await asyncio.gather(holder, kept)
+            assert "kept" in order and "gone" not in order, "Unsheddable ticket not queued, or cancelled ticket ran!"
+
+            # Queue wait limit
+            controller.max_queue_wait_seconds = 0.05
+            release_first.clear()
+            holder = asyncio.create_task(plan("holder", "critical", release_first))
+            await asyncio.sleep(0)
+            try:
+                await plan("timed_out", "critical")
+                assert False, "Ticket waited past the queue wait limit!"
+            except AdmissionRejected as e:
+                print(f"Timed out as expected: {e}")
+            release_first.set()
+            await holder
+            return controller.stats()
+
+        stats = asyncio.run(admission_runs())
+        print(f"Admission Stats: {stats}")
+        assert stats["active"] == 0 and stats["queued_medium"] == 0, "Admission state not back to idle!"
+        assert stats["shed_low"] == 1 and stats["timed_out_critical"] == 1, "Admission stats wrong!"
+
+        # --- Test Workflow Graphs ---
+        print("\n--- Testing Workflow Graphs ---")
+        def step(step_id, depends_on=(), minutes=10, **fields):
+            return dict({"step_id": step_id, "task_name": step_id, "capability": step_id, "depends_on": list(depends_on), "estimated_minutes": minutes, "status": "pending"}, **fields)
+
+        diamond = [step("diagnose"), step("order_part", ["diagnose"], 60), step("remote_fix", ["diagnose"], 5), step("repair", ["order_part", "remote_fix"], 30), step("verify", ["repair"], 5)]
+        assert [s["step_id"] for s in topological_order(list(reversed(diamond)))] == ["diagnose", "remote_fix", "order_part", "repair", "verify"], "Steps not ordered after their dependencies!"
+        assert [s["step_id"] for s in validate_template(diamond)] == ["diagnose", "order_part", "remote_fix", "repair", "verify"], "Independent steps not kept in template order!"
+        for check, broken, expected in (
+            (topological_order, [step("a", ["b"]), step("b", ["a"]), step("c")], "cycle: a, b"),
+            (topological_order, [step("a", ["a"])], "cycle: a"),
+            (topological_order, [step("a", ["missing"])], "unknown step 'missing'"),
+            (validate_template, [step("a", ["missing"])], "unknown step 'missing'"),
+            (validate_template, [step("a"), step("a")], "Duplicate step_id"),
+            (validate_template, [], "at least one step")
+        ):
+            try:
+                check(broken)
+                assert False, f"{check.__name__} accepted a broken workflow ({expected})!"
+            except ValueError as e:
+                assert expected in str(e), f"Unexpected error for a broken workflow: {e}"
+        print("Cycles, unknown dependencies and duplicate steps rejected as expected.")
+
+        now = 1_000_000.0
+        eta, path = estimate_completion(diamond, now)
+        assert eta == now + (10 + 60 + 30 + 5) * 60 and path == ["diagnose", "order_part", "repair", "verify"], f"Critical path wrong: {path}, {eta - now}s"
+        progressed = [
+            step("diagnose", status="completed", end_time=now - 600),
+            step("order_part", ["diagnose"], 60, status="in_progress", start_time=now - 3000),
+            step("remote_fix", ["diagnose"], 120, status="in_progress", start_time=now - 600),
+            step("repair", ["order_part", "remote_fix"], 30), step("verify", ["repair"], 5)
+        ]
+        eta, path = estimate_completion(progressed, now)
+        assert eta == now + (120 - 10 + 30 + 5) * 60 and path == ["diagnose", "remote_fix", "repair", "verify"], f"Critical path did not follow the running steps: {path}"
+        progressed[1]["start_time"] = now - 7200 # Overdue: finishes no earlier than now
+        progressed[2]["start_time"] = now - 7200
+        assert estimate_completion(progressed, now)[0] == now + (30 + 5) * 60, "Overdue steps estimated to finish in the past!"
+
+        started = start_ready_steps(progressed, now)
+        assert started == [], "Step started before its dependencies completed!"
+        progressed[1]["status"] = progressed[2]["status"] = "completed"
+        assert start_ready_steps(progressed, now) == ["repair"] and progressed[3]["status"] == "in_progress" and progressed[3]["start_time"] == now, "Ready step not started!"
+
+        # --- Test Step Deadline Timers ---
+        print("\n--- Testing Step Deadline Timers ---")
+        fired = []
+        all_fired = threading.Event()
+
+        def on_expired(ticket_id, step_id, deadline):
+            fired.append((ticket_id, step_id, deadline))
+            if step_id == "boom":
+                raise RuntimeError("handler failure")
+            if step_id == "late":
+                all_fired.set()
+
+        timers = DeadlineTimers(on_expired)
+        timers.schedule("T0", "s1", time.time())
+        assert timers.stats()["scheduled"] == 0, "Timer scheduled before the timer thread started!"
+        timers.start()
+        try:
+            base = time.time()
+            timers.schedule("T1", "late", base + 0.3)
+            timers.schedule("T1", "early", base + 0.1) # Earlier than the armed wait: must re-arm it
+            timers.schedule("T1", "early", base + 0.1) # Duplicate: ignored
+            timers.schedule("T2", "moved", base + 0.05)
+            timers.schedule("T2", "moved", base + 0.2) # Rescheduled: the first deadline is stale
+            timers.schedule("T3", "cancelled", base + 0.05)
+            timers.cancel("T3", "cancelled")
+            timers.schedule("T4", "boom", base + 0.15)
+            timers.sync_ticket({"id": "T5", "planned_workflow": [
+                {"step_id": "running", "status": "in_progress", "deadline_at": base + 0.25},
+                {"step_id": "done", "status": "completed", "deadline_at": base + 0.01}
+            ]})
+            assert timers.stats()["scheduled"] == 5, f"Scheduled deadlines wrong: {timers.stats()}"
+            assert all_fired.wait(5), "Deadlines did not fire!"
+            print(f"Fired: {[(ticket_id, step_id) for ticket_id, step_id, _ in fired]}")
+            assert [(ticket_id, step_id) for ticket_id, step_id, _ in fired] == [("T1", "early"), ("T4", "boom"), ("T2", "moved"), ("T5", "running"), ("T1", "late")], "Deadlines fired out of order, twice, or after being cancelled!"
+            assert fired[2][2] == base + 0.2, "Rescheduled step fired with its stale deadline!"
+            assert all(time.time() >= deadline for _, _, deadline in fired), "Deadline fired early!"
+            timers.sync_ticket({"id": "T6", "planned_workflow": [{"step_id": "a", "status": "in_progress", "deadline_at": time.time() + 60}]})
+            timers.sync_ticket({"id": "T6", "planned_workflow": [{"step_id": "a", "status": "completed", "deadline_at": None}]})
+            stats = timers.stats()
+            print(f"Timer Stats: {stats}")
+            assert stats["fired"] == 5 and stats["handler_errors"] == 1 and stats["scheduled"] == 0, "Timer stats wrong, or completed step still scheduled!"
+        finally:
+            timers.stop()
+        timers._thread.join(timeout=2)
+        assert not timers._thread.is_alive(), "Timer thread did not stop!"
+
+        # --- Test Ticket Pages ---
+        print("\n--- Testing Ticket Pages ---")
+        ticket_id = ObjectId()
+        created_at = 1700000000.123456789 # Must survive the cursor's text form exactly
+        assert decode_ticket_cursor(encode_ticket_cursor({"created_at": created_at, "_id": ticket_id})) == (created_at, ticket_id), "Cursor round trip lost precision!"
+        for cursor in ("", "abc", "1700000000.5", f"x:{ticket_id}", "1700000000.5:not-an-id"):
+            try:
+                decode_ticket_cursor(cursor)
+                assert False, f"Malformed cursor '{cursor}' accepted!"
+            except ValueError:
+                pass
+
+        # A scratch database next to the service's, so the real tickets are never touched
+        db = get_mongo_db_connection().client["s3dm_rsps_test"]
+        try:
+            db["tickets"].delete_many({})
+            tickets = []
+            for i in range(11):
+                # Bursts of tickets share a created_at, so paging must break ties on _id
+                tickets.append({"_id": ObjectId(), "user_id": "user-a" if i % 4 else "user-b", "status": "Resolved" if i % 3 == 0 else "Workflow In Progress",
+                                "created_at": 1000.0 + i // 3, "original_user_message": f"Issue {i}", "planned_workflow": [{"step_id": "s"}]})
+            db["tickets"].insert_many([dict(ticket) for ticket in tickets])
+            newest_first = sorted(tickets, key=lambda ticket: (ticket["created_at"], ticket["_id"]), reverse=True)
+
+            def all_pages(**filters):
+                seen, cursor, pages = [], None, 0
+                while True:
+                    page = list_tickets(db, limit=2, cursor=cursor, **filters)
+                    seen.extend(ticket["id"] for ticket in page["tickets"])
+                    pages += 1
+                    cursor = page["next_cursor"]
+                    if cursor is None:
+                        return seen, pages
+                    assert pages < 20, "Ticket paging does not terminate!"
+
+            seen, pages = all_pages()
+            assert seen == [str(ticket["_id"]) for ticket in newest_first], "Pages skipped, repeated or misordered tickets sharing a created_at!"
+            assert pages == 6, f"Expected 6 pages of at most 2 tickets, got {pages}!"
+            seen, _ = all_pages(user_id="user-a", status="Workflow In Progress")
+            assert seen == [str(t["_id"]) for t in newest_first if t["user_id"] == "user-a" and t["status"] == "Workflow In Progress"], "User and status filters wrong!"
+            seen, _ = all_pages(created_after=1001.0, created_before=1003.0)
+            assert seen == [str(t["_id"]) for t in newest_first if 1001.0 <= t["created_at"] < 1003.0], "created_at bounds wrong!"
+            page = list_tickets(db, user_id="user-b", limit=TICKET_PAGE_MAX_LIMIT)
+            assert page["next_cursor"] is None and len(page["tickets"]) == 3, "Last page has a next cursor!"
+            assert "planned_workflow" not in page["tickets"][0] and "_id" not in page["tickets"][0], "Page returned more than the ticket summary!"
+            assert list_tickets(db, user_id="nobody")["tickets"] == [], "Unknown user sees tickets!"
+            for limit in (0, TICKET_PAGE_MAX_LIMIT + 1):
+                try:
+                    list_tickets(db, limit=limit)
+                    assert False, f"limit {limit} accepted!"
+                except ValueError as e:
+                    print(f"Rejected as expected: {e}")
+        finally:
+            db.client.drop_database("s3dm_rsps_test")
+
+        # --- Test Ticket Event Streams ---
+        print("\n--- Testing Ticket Event Streams ---")
+        def snapshot(ticket_id, revision, user_id="user-a"):
+            return ticket_event({"id": ticket_id, "user_id": user_id, "status": f"rev {revision}", "workflow_revision": revision,
+                                 "planned_workflow": [{"step_id": "s", "status": "in_progress", "internal": "not streamed"}]})
+
+        async def stream_runs():
+            hub = TicketEventHub(max_subscribers=2)
+            by_user = hub.subscribe(user_id="user-a")
+            by_ticket = hub.subscribe(ticket_id="T1")
+            try:
+                hub.subscribe(ticket_id="T2")
+                assert False, "Subscriber cap not enforced!"
+            except StreamLimitReached as e:
+                print(f"Rejected as expected: {e}")
+            try:
+                hub.subscribe(ticket_id="T1", user_id="user-a")
+                assert False, "Subscription to both a ticket and a user accepted!"
+            except ValueError:
+                pass
+
+            # Coalescing: only the newest pending snapshot per ticket is delivered, out-of-order ones are dropped
+            by_ticket.mark_delivered(snapshot("T1", 1)) # The stream's initial read
+            for ticket_id, revision in (("T1", 1), ("T1", 3), ("T2", 1), ("T1", 2), ("T3", 1)):
+                hub.dispatch(snapshot(ticket_id, revision))
+            hub.dispatch(snapshot("T4", 1, user_id="user-b")) # Another user's ticket
+            await asyncio.sleep(0)
+            events = await by_user.next_events(1)
+            assert [(data["ticket_id"], data["workflow_revision"]) for _, data in events] == [("T1", 3), ("T2", 1), ("T3", 1)], f"User stream events wrong: {events}"
+            assert events[0][1]["steps"] == [{"step_id": "s", "task_name": None, "status": "in_progress", "assigned_agent_id": None, "assigned_agent_name": None, "deadline_at": None}], "Snapshot leaks step fields!"
+            events = await by_ticket.next_events(1)
+            assert [data["workflow_revision"] for _, data in events] == [3], f"Ticket stream events wrong: {events}"
+            hub.dispatch(snapshot("T1", 2)) # Older than the snapshot already delivered
+            hub.dispatch(snapshot("T1", 3)) # Redelivered (e.g. over the bus)
+            await asyncio.sleep(0)
+            assert await by_ticket.next_events(0.05) is None, "Stale snapshot delivered after a newer one!"
+            assert await by_ticket.next_events(0.05) is None, "Stream woke up without events!"
+
+            # Resync: a stream too far behind drops its backlog and is told to re-read
+            by_user.max_pending = 2
+            for ticket_id in ("T5", "T6", "T7", "T8"):
+                hub.dispatch(snapshot(ticket_id, 1))
+            await asyncio.sleep(0)
+            assert await by_user.next_events(1) == [("resync", {"reason": "stream fell behind; re-read the tickets"})], "Stream that fell behind was not told to resync!"
+            hub.dispatch(snapshot("T9", 1))
+            await asyncio.sleep(0)
+            assert [data["ticket_id"] for _, data in await by_user.next_events(1)] == ["T9"], "Stream did not recover after a resync!"
+
+            hub.unsubscribe(by_ticket)
+            hub.unsubscribe(by_ticket) # Twice is harmless
+            third = hub.subscribe(ticket_id="T2") # The freed place can be taken
+            hub.unsubscribe(third)
+            hub.unsubscribe(by_user)
+            return hub.stats()
+
+        stats = asyncio.run(stream_runs())
+        print(f"Stream Stats: {stats}")
+        assert stats["subscribers"] == 0 and stats["rejected_subscribers"] == 1, "Subscriber accounting wrong!"
+        assert stats["coalesced"] == 1 and stats["stale"] == 7 and stats["resyncs"] == 1 and stats["delivered"] == 5, "Stream stats wrong!"
+
+        print("\n--- RSPS Tests PASSED! ---")
+
+    except ConnectionFailure:
+        print("\n--- RSPS Tests FAILED! (MongoDB connection issue) ---")
+        print("Please ensure your MongoDB Atlas cluster is running and accessible, and your MONGO_URI in .env is correct.")
+    except Exception as e:
+        print(f"\n--- RSPS Tests FAILED unexpectedly! ---")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    run_rsps_tests()
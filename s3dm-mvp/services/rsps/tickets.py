@@ -0,0 +1,88 @@
+# services/rsps/tickets.py
+from typing import Optional, Dict, Any
+from bson import ObjectId
+import os
+
+# --- Ticket Reads ---
+# Ticket lists are newest first and paged by keyset on (created_at, _id), so a page costs the same
+# however deep into a user's (or an operator's) history it is. Every filter combination is served by
+# one compound index ending in (created_at, _id): per user, per status, or all tickets; a user's
+# tickets filtered by status use the per-user index. List pages return only the summary fields; the
+# full ticket (planned workflow included) comes from the detail lookup by _id.
+TICKET_PAGE_DEFAULT_LIMIT = 20
+TICKET_PAGE_MAX_LIMIT = int(os.getenv("RSPS_TICKET_PAGE_MAX_LIMIT", "100"))
+TICKET_SUMMARY_FIELDS = {
+    "user_id": 1, "original_user_message": 1, "issue_type": 1, "device_type": 1, "severity": 1,
+    "user_location": 1, "status": 1, "current_step_index": 1, "created_at": 1, "updated_at": 1,
+    "estimated_completion_at": 1, "resolved_at": 1
+}
+
+_ticket_indexes_ready = False
+
+def _ensure_ticket_indexes(tickets_collection):
+    global _ticket_indexes_ready
+    if not _ticket_indexes_ready:
+        tickets_collection.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)], name="user_created")
+        tickets_collection.create_index([("status", 1), ("created_at", -1), ("_id", -1)], name="status_created")
+        tickets_collection.create_index([("created_at", -1), ("_id", -1)], name="created")
+        _ticket_indexes_ready = True
+
+def encode_ticket_cursor(ticket: Dict[str, Any]) -> str:
+    return f"{ticket['created_at']!r}:{ticket['_id']}"
+
+def decode_ticket_cursor(cursor: str) -> tuple:
+    """Parses a cursor from encode_ticket_cursor into (created_at, _id). Raises ValueError if malformed."""
+    created_at, _, ticket_id = cursor.partition(":")
+    try:
+        created_at = float(created_at)
+    except ValueError:
+        created_at = None
+    if created_at is None or not ObjectId.is_valid(ticket_id):
+        raise ValueError(f"Invalid ticket cursor '{cursor}'.")
+    return created_at, ObjectId(ticket_id)
+
+def list_tickets(db, user_id: Optional[str] = None, status: Optional[str] = None, created_after: Optional[float] = None,
+                 created_before: Optional[float] = None, limit: int = TICKET_PAGE_DEFAULT_LIMIT, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns one page of ticket summaries, newest first: {"tickets": [...], "next_cursor": str or None}.
+    created_after/created_before bound created_at (inclusive/exclusive). Raises ValueError.
+    """
+    if not 1 <= limit <= TICKET_PAGE_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {TICKET_PAGE_MAX_LIMIT}.")
+    tickets_collection = db["tickets"]
+    _ensure_ticket_indexes(tickets_collection)
+
+    query_filter: Dict[str, Any] = {}
+    if user_id is not None:
+        query_filter["user_id"] = user_id
+    if status is not None:
+        query_filter["status"] = status
+    created_range: Dict[str, Any] = {}
+    if created_after is not None:
+        created_range["$gte"] = created_after
+    if created_before is not None:
+        created_range["$lt"] = created_before
+    if created_range:
+        query_filter["created_at"] = created_range
+    if cursor:
+        created_at, ticket_id = decode_ticket_cursor(cursor)
+        keyset = {"$or": [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "_id": {"$lt": ticket_id}}]}
+        query_filter = {"$and": [query_filter, keyset]} if query_filter else keyset
+
+    tickets = list(tickets_collection.find(query_filter, TICKET_SUMMARY_FIELDS).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1))
+    next_cursor = encode_ticket_cursor(tickets[limit - 1]) if len(tickets) > limit else None
+    page = []
+    for ticket in tickets[:limit]:
+        ticket["id"] = str(ticket.pop("_id"))
+        page.append(ticket)
+    return {"tickets": page, "next_cursor": next_cursor}
+
+def get_ticket(db, ticket_id: str) -> Dict[str, Any]:
+    """Returns the full ticket. Raises ValueError."""
+    if not ObjectId.is_valid(ticket_id):
+        raise ValueError(f"Invalid ticket id '{ticket_id}'.")
+    ticket = db["tickets"].find_one({"_id": ObjectId(ticket_id)})
+    if ticket is None:
+        raise ValueError(f"Ticket '{ticket_id}' not found.")
+    ticket["id"] = str(ticket.pop("_id"))
+    return ticket
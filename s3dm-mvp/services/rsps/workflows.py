@@ -0,0 +1,268 @@
+# services/rsps/workflows.py
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import ReturnDocument
+import threading
+import time
+import os
+from services.llos.rollups import record_ticket_status_change
+from services.cluster.invalidation import invalidation_bus
+from services.rsps.events import ticket_events
+
+# --- Workflow Templates ---
+# A template is a DAG of steps: each step has a step_id, the capability it needs, an estimated duration
+# and depends_on, the step_ids that must be completed before it can start. Steps without a path between
+# them run in parallel. Templates live in workflow_templates ({_id: issue_type, steps, version}); the
+# defaults below are inserted for any issue type that has no stored template yet.
+WORKFLOW_TEMPLATES_COLLECTION = "workflow_templates"
+DEFAULT_TEMPLATE_ISSUE_TYPE = "general_device_fault"
+
+DEFAULT_WORKFLOW_TEMPLATES = {
+    "lighting_fault": [
+        {"step_id": "remote_diagnostics", "task_name": "Remote Diagnostics", "capability": "remote_diagnostics", "description": "Perform initial remote diagnostics of the smart light.", "estimated_minutes": 30, "depends_on": []},
+        {"step_id": "physical_repair", "task_name": "Physical Repair", "capability": "smart_lighting_repair", "description": "Dispatch technician for physical repair.", "estimated_minutes": 120, "depends_on": ["remote_diagnostics"]},
+        {"step_id": "verify_fix", "task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test.", "estimated_minutes": 30, "depends_on": ["physical_repair"]}
+    ],
+    "temperature_control_issue": [
+        {"step_id": "remote_diagnostics", "task_name": "Remote Diagnostics", "capability": "remote_diagnostics", "description": "Perform initial remote diagnostics of the thermostat.", "estimated_minutes": 30, "depends_on": []},
+        {"step_id": "hvac_repair", "task_name": "HVAC Repair", "capability": "hvac_repair", "description": "Dispatch HVAC specialist for repair.", "estimated_minutes": 240, "depends_on": ["remote_diagnostics"]},
+        {"step_id": "verify_fix", "task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test.", "estimated_minutes": 30, "depends_on": ["hvac_repair"]}
+    ],
+    "security_camera_fault": [
+        {"step_id": "remote_diagnostics", "task_name": "Remote Diagnostics", "capability": "remote_diagnostics", "description": "Perform initial remote diagnostics of the security camera.", "estimated_minutes": 30, "depends_on": []},
+        {"step_id": "network_diagnostics", "task_name": "Network Diagnostics", "capability": "network_diagnostics", "description": "Check network connectivity for camera.", "estimated_minutes": 45, "depends_on": []},
+        {"step_id": "physical_repair", "task_name": "Physical Repair", "capability": "security_system_repair", "description": "Dispatch technician for physical repair if needed.", "estimated_minutes": 120, "depends_on": ["remote_diagnostics", "network_diagnostics"]},
+        {"step_id": "verify_fix", "task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test.", "estimated_minutes": 30, "depends_on": ["physical_repair"]}
+    ],
+    "general_device_fault": [
+        {"step_id": "initial_assessment", "task_name": "Initial Assessment", "capability": "general_diagnostics", "description": "Perform general remote diagnostics.", "estimated_minutes": 30, "depends_on": []},
+        {"step_id": "general_repair", "task_name": "General Repair", "capability": "general_diagnostics", "description": "Dispatch general technician for repair.", "estimated_minutes": 120, "depends_on": ["initial_assessment"]},
+        {"step_id": "verify_fix", "task_name": "Verify Fix", "capability": "verify_fix", "description": "Verify the fix with customer or automated test.", "estimated_minutes": 30, "depends_on": ["general_repair"]}
+    ],
+    "unclassified_issue": [
+        {"step_id": "initial_assessment", "task_name": "Initial Assessment", "capability": "general_diagnostics", "description": "Perform initial assessment for unclassified issue.", "estimated_minutes": 30, "depends_on": []},
+        {"step_id": "manual_review", "task_name": "Manual Review", "capability": "manual_review", "description": "Escalate for manual review by human agent.", "estimated_minutes": 60, "depends_on": ["initial_assessment"]}
+    ]
+}
+
+def topological_order(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Steps ordered so each comes after all of its dependencies (template order among independent steps). Raises ValueError."""
+    by_id = {step["step_id"]: step for step in steps}
+    for step in steps:
+        for dependency in step.get("depends_on", []):
+            if dependency not in by_id:
+                raise ValueError(f"Step '{step['step_id']}' depends on unknown step '{dependency}'.")
+    remaining = {step["step_id"]: len(set(step.get("depends_on", []))) for step in steps}
+    dependents: Dict[str, List[str]] = {step_id: [] for step_id in by_id}
+    for step in steps:
+        for dependency in set(step.get("depends_on", [])):
+            dependents[dependency].append(step["step_id"])
+    ordered = []
+    ready = [step["step_id"] for step in steps if remaining[step["step_id"]] == 0]
+    while ready:
+        step_id = ready.pop(0)
+        ordered.append(by_id[step_id])
+        for dependent in dependents[step_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+        ready.sort(key=lambda s: steps.index(by_id[s]))
+    if len(ordered) != len(steps):
+        cyclic = sorted(step_id for step_id, count in remaining.items() if count > 0)
+        raise ValueError(f"Workflow steps depend on each other in a cycle: {', '.join(cyclic)}.")
+    return ordered
+
+def validate_template(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Checks a template's steps and returns them in topological order. Raises ValueError."""
+    if not steps:
+        raise ValueError("A workflow template needs at least one step.")
+    step_ids = set()
+    for step in steps:
+        for field in ("step_id", "task_name", "capability"):
+            if not step.get(field):
+                raise ValueError(f"Every workflow step needs a {field}.")
+        if step["step_id"] in step_ids:
+            raise ValueError(f"Duplicate step_id '{step['step_id']}'.")
+        step_ids.add(step["step_id"])
+        if float(step.get("estimated_minutes") or 0) < 0:
+            raise ValueError(f"Step '{step['step_id']}' has a negative estimated_minutes.")
+    for step in steps:
+        for dependency in step.get("depends_on", []):
+            if dependency not in step_ids:
+                raise ValueError(f"Step '{step['step_id']}' depends on unknown step '{dependency}'.")
+    return topological_order(steps)
+
+# --- Critical Path and ETA ---
+def estimate_completion(workflow: List[Dict[str, Any]], now: float) -> Tuple[float, List[str]]:
+    """
+    (estimated completion time, critical path step_ids) of a planned workflow. Completed steps count
+    with their end_time, running steps as finishing no earlier than now, and pending steps start when
+    their last dependency is estimated to finish (or now, whichever is later).
+    """
+    finish: Dict[str, float] = {}
+    critical_parent: Dict[str, Optional[str]] = {}
+    for step in topological_order(workflow):
+        dependencies = step.get("depends_on", [])
+        parent = max(dependencies, key=lambda d: finish[d]) if dependencies else None
+        duration = float(step.get("estimated_minutes") or 0) * 60
+        if step.get("status") == "completed":
+            finish[step["step_id"]] = step.get("end_time") or now
+        elif step.get("status") == "in_progress" and step.get("start_time"):
+            finish[step["step_id"]] = max(step["start_time"] + duration, now)
+        else:
+            finish[step["step_id"]] = max(finish[parent] if parent else now, now) + duration
+        critical_parent[step["step_id"]] = parent
+    last = max(finish, key=lambda step_id: finish[step_id])
+    path = [last]
+    while critical_parent[path[-1]] is not None:
+        path.append(critical_parent[path[-1]])
+    return finish[last], path[::-1]
+
+# --- Template Store ---
+class WorkflowTemplateStore:
+    """Workflow templates from MongoDB, cached per worker until changed here or on another worker."""
+
+    def __init__(self):
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._seeded = False
+        self._lock = threading.Lock()
+
+    def _ensure_defaults(self, db):
+        if self._seeded:
+            return
+        now = datetime.now(timezone.utc)
+        for issue_type, steps in DEFAULT_WORKFLOW_TEMPLATES.items():
+            db[WORKFLOW_TEMPLATES_COLLECTION].update_one(
+                {"_id": issue_type},
+                {"$setOnInsert": {"steps": validate_template(steps), "version": 1, "updated_at": now}},
+                upsert=True
+            )
+        self._seeded = True
+
+    def get(self, db, issue_type: str) -> Dict[str, Any]:
+        """The template for issue_type, falling back to the general device fault template."""
+        with self._lock:
+            template = self._templates.get(issue_type) or self._templates.get(DEFAULT_TEMPLATE_ISSUE_TYPE)
+        if template is not None:
+            return template
+        self._ensure_defaults(db)
+        documents = {doc["_id"]: doc for doc in db[WORKFLOW_TEMPLATES_COLLECTION].find({})}
+        with self._lock:
+            self._templates = documents
+            return documents.get(issue_type) or documents[DEFAULT_TEMPLATE_ISSUE_TYPE]
+
+    def list(self, db) -> List[Dict[str, Any]]:
+        self._ensure_defaults(db)
+        return list(db[WORKFLOW_TEMPLATES_COLLECTION].find({}).sort("_id", 1))
+
+    def put(self, db, issue_type: str, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Creates or replaces the template of issue_type (bumping its version). Raises ValueError."""
+        ordered = validate_template(steps)
+        self._ensure_defaults(db)
+        template = db[WORKFLOW_TEMPLATES_COLLECTION].find_one_and_update(
+            {"_id": issue_type},
+            {"$set": {"steps": ordered, "updated_at": datetime.now(timezone.utc)}, "$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.invalidate()
+        invalidation_bus.publish("rsps.workflow_template", issue_type=issue_type)
+        return template
+
+    def invalidate(self, payload: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._templates = {}
+
+workflow_templates = WorkflowTemplateStore()
+invalidation_bus.subscribe("rsps.workflow_template", workflow_templates.invalidate)
+
+# --- Workflow Executor ---
+# Planned steps are stored in topological order. A step starts (pending -> in_progress) as soon as all of
+# its dependencies are completed, so independent steps run concurrently; unassigned steps never start and
+# hold back their dependents. current_step_index counts the leading completed steps. Every change is
+# saved with a condition on the ticket's workflow_revision, so concurrent updates never overwrite each
+# other: the loser re-reads the ticket and applies its change again.
+WORKFLOW_UPDATE_RETRIES = 5
+TICKET_STATUS_IN_PROGRESS = "Workflow In Progress"
+TICKET_STATUS_RESOLVED = "Resolved"
+TICKET_STATUS_ESCALATED = "Escalated"
+# A started step is due after RSPS_STEP_DEADLINE_FACTOR times its estimate (see services.rsps.runtime)
+STEP_DEADLINE_FACTOR = float(os.getenv("RSPS_STEP_DEADLINE_FACTOR", "2.0"))
+STEP_DEFAULT_ESTIMATED_MINUTES = 60
+
+def step_deadline(step: Dict[str, Any], start: float) -> float:
+    return start + float(step.get("estimated_minutes") or STEP_DEFAULT_ESTIMATED_MINUTES) * 60 * STEP_DEADLINE_FACTOR
+
+def start_ready_steps(workflow: List[Dict[str, Any]], now: float) -> List[str]:
+    """Starts every pending step whose dependencies are all completed; returns their step_ids."""
+    completed = {step["step_id"] for step in workflow if step["status"] == "completed"}
+    started = []
+    for step in workflow:
+        if step["status"] == "pending" and all(dependency in completed for dependency in step.get("depends_on", [])):
+            step["status"] = "in_progress"
+            step["start_time"] = now
+            step["deadline_at"] = step_deadline(step, now)
+            started.append(step["step_id"])
+    return started
+
+def leading_completed_steps(workflow: List[Dict[str, Any]]) -> int:
+    count = 0
+    for step in workflow:
+        if step["status"] != "completed":
+            break
+        count += 1
+    return count
+
+def _workflow_status(workflow: List[Dict[str, Any]], current_status: str) -> str:
+    if any(step["status"] == "escalated" for step in workflow):
+        return TICKET_STATUS_ESCALATED
+    if all(step["status"] == "completed" for step in workflow):
+        return TICKET_STATUS_RESOLVED
+    if any(step["status"] in ("in_progress", "completed") for step in workflow):
+        return TICKET_STATUS_IN_PROGRESS
+    return current_status
+
+def update_workflow(db, ticket_id: str, change) -> Dict[str, Any]:
+    """
+    Applies change(ticket, now) to a ticket's planned_workflow (in place), then starts newly ready steps
+    and refreshes progress, status and ETA, saving conditionally on workflow_revision. A change that
+    returns False leaves the ticket as it is (nothing is written). Raises ValueError.
+    """
+    if not ObjectId.is_valid(ticket_id):
+        raise ValueError(f"Invalid ticket id '{ticket_id}'.")
+    tickets_collection = db["tickets"]
+    for _ in range(WORKFLOW_UPDATE_RETRIES):
+        ticket = tickets_collection.find_one({"_id": ObjectId(ticket_id)})
+        if ticket is None:
+            raise ValueError(f"Ticket '{ticket_id}' not found.")
+        workflow = ticket.get("planned_workflow", [])
+        if not all(step.get("step_id") for step in workflow):
+            raise ValueError(f"Ticket '{ticket_id}' was planned before workflow templates had step ids.")
+        now = time.time()
+        if change(ticket, now) is False:
+            ticket["id"] = str(ticket.pop("_id"))
+            return ticket
+        start_ready_steps(workflow, now)
+        previous_status = ticket.get("status")
+        new_status = _workflow_status(workflow, previous_status)
+        estimated_completion_at, path = estimate_completion(workflow, now)
+        updates = {
+            "planned_workflow": workflow,
+            "current_step_index": leading_completed_steps(workflow),
+            "status": new_status,
+            "estimated_completion_at": estimated_completion_at,
+            "critical_path": path,
+            "updated_at": now
+        }
+        if new_status == TICKET_STATUS_RESOLVED and previous_status != TICKET_STATUS_RESOLVED:
+            updates["resolved_at"] = now
+        revision = ticket.get("workflow_revision", 0)
+        result = tickets_collection.update_one({"_id": ticket["_id"], "workflow_revision": revision}, {"$set": dict(updates, workflow_revision=revision + 1)})
+        if result.modified_count == 1:
+            record_ticket_status_change(db, previous_status, new_status)
+            ticket.update(updates, workflow_revision=revision + 1)
+            ticket["id"] = str(ticket.pop("_id"))
+            ticket_events.publish(ticket)
+            return ticket
+    raise RuntimeError(f"Ticket '{ticket_id}' is being updated concurrently; try again.")
@@ -1,18 +1,23 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { getMyTickets } from '../services/api'; // Conceptual API service
+import { getMyTickets, getCurrentUserId } from '../services/api'; // Conceptual API service
 import LoadingSpinner from '../components/LoadingSpinner';
 
 function MyTicketsPage() {
   const [tickets, setTickets] = useState([]);
-  const [loading, setLoading] = useState(true);
+  const [hasReported] = useState(() => Boolean(getCurrentUserId()));
+  const [loading, setLoading] = useState(hasReported);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
+    if (!hasReported) return; // Nothing to list: tickets are only ever fetched for the customer id this browser reported under
     const fetchTickets = async () => {
       try {
-        const data = await getMyTickets(); // API call to fetch customer's tickets
-        setTickets(data);
+        const data = await getMyTickets(); // API call to fetch customer's tickets (first page)
+        setTickets(data.tickets);
+        setNextCursor(data.nextCursor);
       } catch (err) {
         setError('Failed to load tickets.');
         console.error('Error fetching tickets:', err);
@@ -21,8 +26,30 @@ function MyTicketsPage() {
       }
     };
     fetchTickets();
-  }, []);
+  }, [hasReported]);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await getMyTickets({ cursor: nextCursor });
+      setTickets(previous => [...previous, ...data.tickets]);
+      setNextCursor(data.nextCursor);
+    } catch (err) {
+      setError('Failed to load tickets.');
+      console.error('Error fetching tickets:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  if (!hasReported) {
+    return (
+      <div style={{ maxWidth: '800px', margin: '0 auto', padding: '20px' }}>
+        <h2>My Reported Issues</h2>
+        <p>You haven't reported any issues from this browser yet. <Link to="/report-issue">Report a new one</Link>!</p>
+      </div>
+    );
+  }
   if (loading) return <LoadingSpinner />;
   if (error) return <p style={{ color: 'red' }}>{error}</p>;
 
@@ -45,6 +72,11 @@ function MyTicketsPage() {
           ))}
         </ul>
       )}
+      {nextCursor && (
+        <button onClick={loadMore} disabled={loadingMore} style={{ padding: '8px 12px', borderRadius: '4px', border: '1px solid #007bff', background: 'white', color: '#007bff', cursor: 'pointer' }}>
+          {loadingMore ? 'Loading...' : 'Load older tickets'}
+        </button>
+      )}
     </div>
   );
 }
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getTicketDetails } from '../services/api'; // Conceptual API service
+import { getTicketDetails, subscribeToTicket, isSameOrNewerRevision } from '../services/api'; // Conceptual API service
 import LoadingSpinner from '../components/LoadingSpinner';
 
 function TicketDetailPage() {
@@ -13,7 +13,7 @@ function TicketDetailPage() {
     const fetchTicket = async () => {
       try {
         const data = await getTicketDetails(ticketId); // API call to fetch specific ticket details
-        setTicket(data);
+        setTicket(previous => (isSameOrNewerRevision(previous, data) ? data : previous));
       } catch (err) {
         setError('Failed to load ticket details.');
         console.error('Error fetching ticket details:', err);
@@ -22,6 +22,13 @@ function TicketDetailPage() {
       }
     };
     fetchTicket();
+    // Status changes are pushed by the server while the page is open
+    const unsubscribe = subscribeToTicket(
+      ticketId,
+      update => setTicket(previous => (previous && isSameOrNewerRevision(previous, update) ? { ...previous, ...update } : previous)),
+      fetchTicket
+    );
+    return unsubscribe;
   }, [ticketId]);
 
   if (loading) return <LoadingSpinner />;
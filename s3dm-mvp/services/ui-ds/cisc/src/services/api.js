@@ -4,6 +4,7 @@
 const API_BASE_URL = 'http://localhost:8000/submit/tickets'; // Replace with your actual backend URL
 
 export const reportNewIssue = async (issueData) => {
+  issueData = { ...issueData, user_id: getOrCreateUserId() };
   console.log('Reporting issue to backend:', issueData);
   // Example dummy response
   return new Promise(resolve => setTimeout(() => resolve({
@@ -24,93 +25,97 @@ export const reportNewIssue = async (issueData) => {
   
 };
 
-export const getMyTickets = async () => {
+// Ticket timestamps are Unix seconds; the pages expect ISO strings
+const toIsoString = (seconds) => (seconds ? new Date(seconds * 1000).toISOString() : undefined);
+
+// The customer's id, kept in this browser from their first reported issue on (null before that). Tickets are
+// submitted and listed under it, so My Tickets shows what was reported from this browser.
+export const getCurrentUserId = () => localStorage.getItem('userId');
+
+const getOrCreateUserId = () => {
+  let userId = getCurrentUserId();
+  if (!userId) {
+    userId = crypto.randomUUID();
+    localStorage.setItem('userId', userId);
+  }
+  return userId;
+};
+
+const toTicketSummary = (ticket) => ({
+  ...ticket,
+  id: ticket._id,
+  revision: ticket.workflow_revision,
+  user_message: ticket.original_user_message,
+  location: ticket.user_location,
+  reportedAt: toIsoString(ticket.created_at),
+  lastUpdate: toIsoString(ticket.updated_at || ticket.created_at),
+  resolvedAt: toIsoString(ticket.resolved_at),
+});
+
+// One page of the customer's tickets, newest first. Pass nextCursor back to get the next (older) page;
+// it is null on the last page. Throws when no issue was reported from this browser yet: the endpoint
+// requires a user_id (only operators with the admin token may list every customer's tickets).
+export const getMyTickets = async ({ cursor = null, status = null, limit = 20 } = {}) => {
+  const userId = getCurrentUserId();
+  if (!userId) {
+    throw new Error('No tickets reported from this browser');
+  }
+  const params = new URLSearchParams({ limit: String(limit), user_id: userId });
+  if (status) params.set('status', status);
+  if (cursor) params.set('cursor', cursor);
   console.log('Fetching my tickets...');
-  // Example dummy response
-  return new Promise(resolve => setTimeout(() => resolve([
-    {
-      id: 'TKT-123456',
-      user_message: "My smart light keeps flickering and won't turn off.",
-      device_type: "smart_light",
-      issue_type: "functionality",
-      location: "living_room",
-      brand: "Philips",
-      status: "In Progress",
-      lastUpdate: new Date().toISOString(),
-      fellowshipAssembledAt: new Date(Date.now() - 3600000).toISOString(), // 1 hour ago
-      reportedAt: new Date(Date.now() - 7200000).toISOString(), // 2 hours ago
-    },
-    {
-      id: 'TKT-789012',
-      user_message: "The Nest thermostat in my hall is showing error E73 after a power cut.",
-      device_type: "thermostat",
-      issue_type: "connectivity",
-      location: "hallway",
-      brand: "Nest",
-      status: "Diagnosis In Progress",
-      lastUpdate: new Date().toISOString(),
-      reportedAt: new Date(Date.now() - 86400000).toISOString(), // 1 day ago
-      fellowshipAssembledAt: new Date(Date.now() - 80000000).toISOString(),
-      diagnosisStartedAt: new Date(Date.now() - 70000000).toISOString(),
-    },
-    {
-      id: 'TKT-345678',
-      user_message: "My Ring doorbell camera stopped recording motion events last week.",
-      device_type: "camera",
-      issue_type: "security",
-      location: "outdoor",
-      brand: "Ring",
-      status: "Resolved",
-      lastUpdate: new Date().toISOString(),
-      reportedAt: new Date(Date.now() - (7 * 86400000)).toISOString(), // 7 days ago
-      fellowshipAssembledAt: new Date(Date.now() - (6 * 86400000)).toISOString(),
-      diagnosisStartedAt: new Date(Date.now() - (5 * 86400000)).toISOString(),
-      partsOrderedAt: new Date(Date.now() - (3 * 86400000)).toISOString(),
-      repairScheduledAt: new Date(Date.now() - (2 * 86400000)).toISOString(),
-      resolvedAt: new Date(Date.now() - 86400000).toISOString(), // 1 day ago
-    }
-  ]), 1500));
-  /*
-  const response = await fetch(`${API_BASE_URL}/tickets`);
+  const response = await fetch(`/tickets?${params}`);
   if (!response.ok) {
     throw new Error(`HTTP error! status: ${response.status}`);
   }
-  return response.json();
-  */
+  const page = await response.json();
+  return { tickets: page.tickets.map(toTicketSummary), nextCursor: page.next_cursor };
 };
 
 export const getTicketDetails = async (ticketId) => {
   console.log(`Fetching details for ticket: ${ticketId}`);
-  // Example dummy response - you'd replace with actual backend data
-  const dummyTickets = await getMyTickets(); // Re-use dummy tickets
-  const ticket = dummyTickets.find(t => t.id === ticketId);
-  return new Promise((resolve, reject) => setTimeout(() => {
-    if (ticket) {
-      resolve({
-        ...ticket,
-        severity: ticket.id === 'TKT-123456' ? 'high' : 'medium',
-        last_working_time: ticket.id === 'TKT-123456' ? 'just_now' : (ticket.id === 'TKT-789012' ? 'hours_ago' : 'weeks_ago'),
-        user_action_taken: ticket.id === 'TKT-123456' ? 'none' : 'power_cycle, app_reinstall',
-        error_code: ticket.id === 'TKT-789012' ? 'E73' : null,
-        firmware_version: ticket.id === 'TKT-789012' ? '3.5.1' : null,
-        involvedAgents: [
-          { companyName: 'SmartHome Corp.', role: 'Manufacturer', country: 'Germany' },
-          { companyName: 'CompFix Solutions', role: 'Repair Franchise', country: 'India' },
-          ...(ticket.id === 'TKT-789012' ? [{ companyName: 'PowerConnect Logistics', role: 'Logistics Partner', country: 'Brazil' }] : []),
-          ...(ticket.id === 'TKT-345678' ? [{ companyName: 'SecureLens Inc.', role: 'Component Vendor', country: 'Japan' }] : []),
-        ]
-      });
-    } else {
-      reject(new Error('Ticket not found'));
-    }
-  }, 800));
-  /*
-  const response = await fetch(`${API_BASE_URL}/tickets/${ticketId}`);
+  const response = await fetch(`/tickets/${encodeURIComponent(ticketId)}`);
   if (!response.ok) {
-    throw new Error(`HTTP error! status: ${response.status}`);
+    throw new Error(response.status === 404 ? 'Ticket not found' : `HTTP error! status: ${response.status}`);
   }
-  return response.json();
-  */
+  const ticket = await response.json();
+  const steps = ticket.planned_workflow || [];
+  const country = (ticket.user_location || '').split(',')[1]?.trim();
+  const agents = new Map();
+  steps.filter(step => step.assigned_agent_name).forEach(step => {
+    if (!agents.has(step.assigned_agent_id)) {
+      agents.set(step.assigned_agent_id, { companyName: step.assigned_agent_name, role: step.task_name, country });
+    }
+  });
+  const startTimes = steps.map(step => step.start_time).filter(Boolean);
+  return {
+    ...toTicketSummary(ticket),
+    fellowshipAssembledAt: toIsoString(startTimes.length ? Math.min(...startTimes) : null),
+    involvedAgents: [...agents.values()],
+  };
+};
+
+// Whether a snapshot (from getTicketDetails or a stream update) is at least as new as the one shown, by the
+// ticket's workflow revision, so a late read or update never moves the page backwards
+export const isSameOrNewerRevision = (shown, next) => !shown || shown.revision == null || next.revision == null || next.revision >= shown.revision;
+
+// Follows a ticket's status and workflow steps as the server pushes them (server-sent events), instead of
+// polling getTicketDetails. onUpdate receives the ticket's progress snapshot; on "resync" the stream fell
+// behind and the ticket should be re-read. Returns a function that closes the stream.
+export const subscribeToTicket = (ticketId, onUpdate, onResync) => {
+  const source = new EventSource(`/tickets/stream?ticket_id=${encodeURIComponent(ticketId)}`);
+  source.addEventListener('ticket', (message) => {
+    const update = JSON.parse(message.data);
+    onUpdate({
+      revision: update.workflow_revision,
+      status: update.status,
+      lastUpdate: toIsoString(update.updated_at),
+      resolvedAt: toIsoString(update.resolved_at),
+      steps: update.steps,
+    });
+  });
+  source.addEventListener('resync', () => onResync && onResync());
+  return () => source.close();
 };
 
 export const getDataAgreements = async (ticketId) => {
@@ -168,6 +173,7 @@ export async function sendChatMessage(messageText) {
     },
     body: JSON.stringify({
       user_message: messageText,
+      user_id: getOrCreateUserId(),
       device_type: 'chatbot',
       issue_type: 'general',
       location: 'chat',
@@ -0,0 +1,76 @@
+# services/warmup.py
+from typing import Optional, Dict, Any, Callable
+import asyncio
+import time
+import os
+
+# --- Startup Configuration ---
+# Every subsystem initializes itself on first use (MongoDB clients, the signing key, the LLM HTTP client).
+# S3DM_STARTUP_MODE decides what happens at startup:
+#   eager  (default) run all warmup tasks in parallel and start serving once they are done
+#   warmup start serving at once and run the warmup tasks in the background; early requests
+#          initialize whatever they need themselves
+#   lazy   run no warmup tasks (the claim window is not preloaded, so duplicate checks query MongoDB,
+#          and sample agents are not seeded); the deadlines of running workflow steps are still
+#          reloaded, in the background
+STARTUP_MODE = os.getenv("S3DM_STARTUP_MODE", "eager").lower()
+if STARTUP_MODE not in ("eager", "warmup", "lazy"):
+    raise ValueError(f"Unknown S3DM_STARTUP_MODE '{STARTUP_MODE}'. Expected eager, warmup or lazy.")
+# Seed the GARS sample agents during warmup (on the leader); turn off in production
+SEED_SAMPLE_AGENTS = os.getenv("S3DM_SEED_SAMPLE_AGENTS", "true").lower() == "true"
+
+class Warmup:
+    """Named initialization tasks, run concurrently in worker threads, with their timings for /health/startup."""
+
+    def __init__(self, mode: str = STARTUP_MODE):
+        self.mode = mode
+        self._tasks: Dict[str, Callable[[], Any]] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[[], Any]):
+        self._tasks[name] = fn
+        self._status[name] = {"state": "pending"}
+
+    async def run(self, raise_errors: bool = False):
+        """Runs all tasks concurrently; with raise_errors, re-raises the first failure once all have finished."""
+        self.started_at = time.time()
+        results = await asyncio.gather(*(self._run_task(name, fn) for name, fn in self._tasks.items()), return_exceptions=True)
+        self.finished_at = time.time()
+        failed = [name for name, task in self._status.items() if task["state"] == "failed"]
+        print(f"App: Warmup finished in {(self.finished_at - self.started_at) * 1000:.0f} ms" + (f" ({', '.join(failed)} failed)." if failed else "."))
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors and raise_errors:
+            raise errors[0]
+
+    async def _run_task(self, name: str, fn: Callable[[], Any]):
+        task = self._status[name]
+        task["state"] = "running"
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(fn)
+            task["state"] = "done"
+        except Exception as e:
+            task["state"] = "failed"
+            task["error"] = str(e)
+            print(f"App: Warmup task {name} failed: {e}")
+            raise
+        finally:
+            task["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    def start_background(self) -> asyncio.Task:
+        return asyncio.create_task(self.run())
+
+    def status(self) -> Dict[str, Any]:
+        states = [task["state"] for task in self._status.values()]
+        return {
+            "mode": self.mode,
+            "ready": self.mode == "lazy" or (self.finished_at is not None and "failed" not in states),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_ms": round((self.finished_at - self.started_at) * 1000, 1) if self.finished_at else None,
+            "tasks": {name: dict(task) for name, task in self._status.items()}
+        }
+
+warmup = Warmup()
@@ -0,0 +1,205 @@
+# services/ztdigs/canonical.py
+from typing import Any, Callable, Dict
+from datetime import datetime, timezone
+from bson import ObjectId
+import hashlib
+import operator
+import struct
+import os
+
+try:
+    import cbor2 # Optional C-accelerated backend (pip install cbor2)
+except ImportError:
+    cbor2 = None
+
+# --- Canonical Encoding ---
+# Documents are hashed over deterministic CBOR (RFC 8949 "core deterministic encoding"): shortest
+# integer/length heads, floats in their shortest lossless width, map keys sorted by encoded bytes
+# (length first, as in RFC 7049 canonical CBOR). Every value is type-tagged by its CBOR major type,
+# so "1", 1, 1.0 and True all hash differently, and ObjectIds are tagged (CBOR tag 27, "typed object")
+# instead of colliding with their hex strings.
+#
+# Supported types: None, bool, int, float, str, bytes, dict, list/tuple, ObjectId and datetime
+# (tag 1, epoch seconds; naive datetimes are taken as UTC, as pymongo returns them). The pure-Python
+# encoder raises TypeError for anything else. cbor2 also encodes some other stdlib types (sets,
+# Decimal, UUID, ...); those never occur in stored documents and must not be hashed.
+#
+# ZTDIGS_CANONICAL_BACKEND: "python" (default) or "cbor2" (C extension, optional). Both produce identical
+# bytes for the supported types; see benchmarks/bench_canonical.py to compare them on a given machine.
+CANONICAL_BACKEND = os.getenv("ZTDIGS_CANONICAL_BACKEND", "python").lower()
+
+OBJECT_ID_TAG = 27 # "Serialised language-independent object": [type name, constructor argument]
+_FLUSH_BYTES = 64 * 1024 # The pure-Python encoder hands its output to the sink in chunks of about this size
+_KEY_CACHE_SIZE = 4096
+
+def _head(major_type: int, value: int) -> bytes:
+    """Encodes a CBOR initial byte plus argument in its shortest form."""
+    major = major_type << 5
+    if value < 24:
+        return bytes((major | value,))
+    if value <= 0xff:
+        return bytes((major | 24, value))
+    if value <= 0xffff:
+        return bytes((major | 25,)) + value.to_bytes(2, "big")
+    if value <= 0xffffffff:
+        return bytes((major | 26,)) + value.to_bytes(4, "big")
+    return bytes((major | 27,)) + value.to_bytes(8, "big")
+
+# Precomputed heads for small arguments, which cover nearly all lengths and integers in practice
+_SMALL_HEADS = [[_head(major_type, value) for value in range(256)] for major_type in range(8)]
+_OBJECT_ID_PREFIX = _head(6, OBJECT_ID_TAG) + _head(4, 2) + _head(3, 8) + b"ObjectId" + _head(2, 12)
+_EPOCH_DATETIME_TAG = _head(6, 1)
+_pack_half = struct.Struct(">e")
+_pack_single = struct.Struct(">f")
+_pack_double = struct.Struct(">d")
+_encoded_keys: Dict[str, bytes] = {} # Encoded form of common string map keys
+_first = operator.itemgetter(0)
+
+def _encode_float(value: float) -> bytes:
+    """Shortest of half/single/double precision that represents value exactly."""
+    if value != value:
+        return b"\xf9\x7e\x00" # Canonical NaN
+    try:
+        single = _pack_single.pack(value)
+    except OverflowError:
+        return b"\xfb" + _pack_double.pack(value)
+    if _pack_single.unpack(single)[0] != value:
+        return b"\xfb" + _pack_double.pack(value)
+    try:
+        half = _pack_half.pack(value)
+        if _pack_half.unpack(half)[0] == value:
+            return b"\xf9" + half
+    except OverflowError:
+        pass
+    return b"\xfa" + single
+
+def _encode_str_key(key: str) -> bytes:
+    encoded = _encoded_keys.get(key)
+    if encoded is None:
+        raw = key.encode('utf-8')
+        encoded = (_SMALL_HEADS[3][len(raw)] if len(raw) < 256 else _head(3, len(raw))) + raw
+        if len(_encoded_keys) < _KEY_CACHE_SIZE:
+            _encoded_keys[key] = encoded
+    return encoded
+
+def _encode_into(value: Any, out: bytearray, sink: Callable[[bytes], Any]):
+    """Appends the canonical encoding of value to out, handing full chunks to sink as it goes."""
+    value_type = type(value)
+    if value_type is str:
+        raw = value.encode('utf-8')
+        out += _SMALL_HEADS[3][len(raw)] if len(raw) < 256 else _head(3, len(raw))
+        out += raw
+    elif value_type is int:
+        if 0 <= value < 256:
+            out += _SMALL_HEADS[0][value]
+        elif -256 <= value < 0:
+            out += _SMALL_HEADS[1][-1 - value]
+        else:
+            major_type, magnitude = (0, value) if value >= 0 else (1, -1 - value)
+            if magnitude <= 0xffffffffffffffff:
+                out += _head(major_type, magnitude)
+            else:
+                # Bignum (tag 2 positive, tag 3 negative) over the minimal big-endian magnitude
+                magnitude_bytes = magnitude.to_bytes((magnitude.bit_length() + 7) // 8, "big")
+                out += _head(6, 2 + major_type) + _head(2, len(magnitude_bytes)) + magnitude_bytes
+    elif value_type is float:
+        out += _encode_float(value)
+    elif value_type is dict:
+        out += _SMALL_HEADS[5][len(value)] if len(value) < 256 else _head(5, len(value))
+        try:
+            # All-string keys: bytewise order of the encoded keys already is length-first order
+            items = sorted([(_encoded_keys[key], item) for key, item in value.items()], key=_first)
+        except (KeyError, TypeError):
+            items = [(_encode_str_key(key) if type(key) is str else encode_canonical(key), item) for key, item in value.items()]
+            items.sort(key=lambda pair: (len(pair[0]), pair[0]))
+        for encoded_key, item in items:
+            out += encoded_key
+            # Common scalars are encoded inline; the recursive call dominates otherwise
+            item_type = type(item)
+            if item_type is float:
+                out += _encode_float(item)
+            elif item_type is str and len(item) < 24 and item.isascii():
+                out += _SMALL_HEADS[3][len(item)]
+                out += item.encode('ascii')
+            else:
+                _encode_into(item, out, sink)
+        if len(out) >= _FLUSH_BYTES:
+            sink(bytes(out))
+            out.clear()
+    elif value_type is list or value_type is tuple:
+        out += _SMALL_HEADS[4][len(value)] if len(value) < 256 else _head(4, len(value))
+        for item in value:
+            item_type = type(item)
+            if item_type is float:
+                out += _encode_float(item)
+            elif item_type is str and len(item) < 24 and item.isascii():
+                out += _SMALL_HEADS[3][len(item)]
+                out += item.encode('ascii')
+            else:
+                _encode_into(item, out, sink)
+            if len(out) >= _FLUSH_BYTES:
+                sink(bytes(out))
+                out.clear()
+    elif value is None:
+        out += b"\xf6"
+    elif value_type is bool:
+        out += b"\xf5" if value else b"\xf4"
+    elif value_type is bytes or value_type is bytearray:
+        out += _head(2, len(value))
+        out += value
+    elif value_type is ObjectId:
+        out += _OBJECT_ID_PREFIX
+        out += value.binary
+    elif isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        timestamp = value.timestamp()
+        out += _EPOCH_DATETIME_TAG
+        _encode_into(timestamp if value.microsecond else int(timestamp), out, sink)
+    else:
+        # Subclasses (e.g. bson Int64, OrderedDict) encode as their base type
+        for base in (bool, int, float, str, bytes, dict, list, tuple):
+            if isinstance(value, base):
+                return _encode_into(base(value), out, sink)
+        raise TypeError(f"Cannot canonically encode value of type {value_type.__name__}.")
+
+# --- cbor2 Backend ---
+def _cbor2_default(encoder, value):
+    if isinstance(value, ObjectId):
+        encoder.encode(cbor2.CBORTag(OBJECT_ID_TAG, ["ObjectId", value.binary]))
+    else:
+        raise TypeError(f"Cannot canonically encode value of type {type(value).__name__}.")
+
+def _cbor2_dumps(value: Any) -> bytes:
+    # Only native encoders plus a default hook: per-type "encoders" overrides take a much slower path in cbor2.
+    try:
+        return cbor2.dumps(value, canonical=True, datetime_as_timestamp=True, timezone=timezone.utc, default=_cbor2_default)
+    except cbor2.CBOREncodeError as e:
+        raise TypeError(str(e)) from e
+
+if CANONICAL_BACKEND not in ("python", "cbor2"):
+    raise ValueError(f"Unknown ZTDIGS_CANONICAL_BACKEND '{CANONICAL_BACKEND}'. Expected python or cbor2.")
+if CANONICAL_BACKEND == "cbor2" and cbor2 is None:
+    raise ValueError("ZTDIGS_CANONICAL_BACKEND=cbor2 requires the cbor2 package.")
+
+# --- Public API ---
+def encode_canonical(value: Any) -> bytes:
+    """Returns the canonical (deterministic CBOR) encoding of value, using the pure-Python encoder."""
+    out = bytearray()
+    chunks = []
+    _encode_into(value, out, chunks.append)
+    chunks.append(bytes(out))
+    return b"".join(chunks)
+
+def canonical_sha256(value: Any, backend: str = None) -> str:
+    """
+    SHA-256 (hex) over the canonical encoding of value. The pure-Python backend streams the encoding
+    into the hash in bounded chunks; cbor2 encodes the whole document in C and is hashed in one update.
+    """
+    if (backend or CANONICAL_BACKEND) == "cbor2":
+        return hashlib.sha256(_cbor2_dumps(value)).hexdigest()
+    hasher = hashlib.sha256()
+    out = bytearray()
+    _encode_into(value, out, hasher.update)
+    hasher.update(out)
+    return hasher.hexdigest()
@@ -0,0 +1,138 @@
+# services/ztdigs/claim_window.py
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+from collections import OrderedDict
+import bisect
+import hashlib
+import math
+import threading
+import time
+import os
+
+# --- Claim Window Configuration ---
+# Event timestamps for the tracked event types are kept in memory for up to CLAIM_WINDOW_MAX_SECONDS,
+# so duplicate checks for any window up to that size are answered without querying provenance_log.
+CLAIM_WINDOW_MAX_SECONDS = float(os.getenv("ZTDIGS_CLAIM_WINDOW_MAX_SECONDS", str(7 * 86400)))
+CLAIM_WINDOW_MAX_KEYS = int(os.getenv("ZTDIGS_CLAIM_WINDOW_MAX_KEYS", "200000"))
+CLAIM_EVENT_TYPES = [t.strip() for t in os.getenv("ZTDIGS_CLAIM_EVENT_TYPES", "invoice_issued,task_completed").split(",") if t.strip()]
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives, tunable false-positive rate)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class ClaimWindow:
+    """
+    Sliding-window event counters keyed by (ticket_id, event_type), fed by the provenance append path.
+
+    Each key holds its event timestamps (ascending) from the last max_window_seconds, so a count for
+    any window up to that size is a binary search over a handful of timestamps. Keys are LRU-bounded;
+    when a key with live events is evicted it is added to a Bloom filter, and only keys that may have
+    been evicted need a database fallback — every other key is "definitely no prior claim".
+    An evicted key only matters while its events are in the window, so the Bloom filter is rotated every
+    max_window_seconds: keys go into the current generation and lookups check it and the previous one.
+    Its false-positive rate therefore reflects one or two windows of evictions, not the process lifetime.
+
+    Counts only cover events appended by this process (plus the startup bootstrap).
+    """
+
+    def __init__(self, max_window_seconds: float, max_keys: int, event_types: Iterable[str]):
+        self.max_window_seconds = max_window_seconds
+        self.max_keys = max_keys
+        self.event_types = frozenset(event_types)
+        self.bootstrapped = False
+        self._events: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._evicted = BloomFilter(max_keys)
+        self._evicted_previous: Optional[BloomFilter] = None
+        self._evicted_since = time.time()
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def record(self, ticket_id: str, event_type: str, timestamp: float, skip_known: bool = False):
+        """Adds one event to the window (ignored for untracked event types)."""
+        if event_type not in self.event_types:
+            return
+        key = (ticket_id, event_type)
+        with self._lock:
+            timestamps = self._events.get(key)
+            if timestamps is None:
+                timestamps = self._events[key] = []
+            self._events.move_to_end(key)
+            position = bisect.bisect_left(timestamps, timestamp)
+            if skip_known and position < len(timestamps) and timestamps[position] == timestamp:
+                return # Already recorded by the append path
+            timestamps.insert(position, timestamp)
+            self._prune(key, timestamps, time.time())
+            while len(self._events) > self.max_keys:
+                evicted_key, evicted_timestamps = self._events.popitem(last=False)
+                if evicted_timestamps and evicted_timestamps[-1] > time.time() - self.max_window_seconds:
+                    self._rotate_evicted(time.time())
+                    self._evicted.add(f"{evicted_key[0]}\x00{evicted_key[1]}")
+                    self._evictions += 1
+
+    def count(self, ticket_id: str, event_type: str, window_seconds: float, now: Optional[float] = None) -> Optional[int]:
+        """
+        Returns the number of events for the key in the last window_seconds, or None when the window
+        cannot answer exactly (not bootstrapped, untracked type, window too large, or key possibly evicted).
+        """
+        if not self.bootstrapped or event_type not in self.event_types or window_seconds > self.max_window_seconds:
+            return None
+        now = now if now is not None else time.time()
+        key = (ticket_id, event_type)
+        with self._lock:
+            timestamps = self._events.get(key)
+            if timestamps is None:
+                # Never seen, or aged out entirely: zero — unless it may have been evicted with live events
+                self._rotate_evicted(now)
+                evicted_key = f"{ticket_id}\x00{event_type}"
+                may_be_evicted = evicted_key in self._evicted or (self._evicted_previous is not None and evicted_key in self._evicted_previous)
+                return None if may_be_evicted else 0
+            self._prune(key, timestamps, now)
+            return len(timestamps) - bisect.bisect_right(timestamps, now - window_seconds)
+
+    def bootstrap(self, events: Iterable[Dict[str, Any]]):
+        """Loads recent events ({ticket_id, event_type, timestamp}) and starts answering from memory."""
+        # Events appended while the bootstrap query runs may already be recorded; don't count them twice.
+        for event in events:
+            self.record(event["ticket_id"], event["event_type"], event["timestamp"], skip_known=True)
+        self.bootstrapped = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"keys": len(self._events), "max_keys": self.max_keys, "bootstrapped": self.bootstrapped, "evictions_this_generation": self._evictions}
+
+    def _rotate_evicted(self, now: float):
+        """Starts a new Bloom filter generation once the current one is max_window_seconds old (lock held)."""
+        if now - self._evicted_since < self.max_window_seconds:
+            return
+        # Keys added to the current generation had live events at most max_window_seconds ago when it
+        # started; after one more window in the previous generation, all of those events have aged out.
+        expired_generation = now - self._evicted_since >= 2 * self.max_window_seconds
+        self._evicted_previous = None if expired_generation else self._evicted
+        self._evicted = BloomFilter(self.max_keys)
+        self._evicted_since = now
+        self._evictions = 0
+
+    def _prune(self, key: Tuple[str, str], timestamps: List[float], now: float):
+        cutoff = bisect.bisect_right(timestamps, now - self.max_window_seconds)
+        if cutoff:
+            del timestamps[:cutoff]
+        if not timestamps:
+            del self._events[key]
+
+claim_window = ClaimWindow(CLAIM_WINDOW_MAX_SECONDS, CLAIM_WINDOW_MAX_KEYS, CLAIM_EVENT_TYPES)
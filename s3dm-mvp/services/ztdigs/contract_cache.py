@@ -0,0 +1,128 @@
+# services/ztdigs/contract_cache.py
+from typing import Optional, Dict, Any, Tuple
+from collections import OrderedDict
+import threading
+import time
+import os
+
+# --- Cache Configuration ---
+# Contracts are immutable apart from expiry, so they can be cached for a long time; each entry's
+# TTL is still capped at the contract's own expiry_timestamp. Unknown ids are cached only briefly.
+# Once a contract expires its entry becomes a small tombstone (id and expiry only), kept for
+# CONTRACT_CACHE_TOMBSTONE_TTL_SECONDS, so events citing it are rejected without a database read.
+CONTRACT_CACHE_SIZE = int(os.getenv("ZTDIGS_CONTRACT_CACHE_SIZE", "10000"))
+CONTRACT_CACHE_TTL_SECONDS = float(os.getenv("ZTDIGS_CONTRACT_CACHE_TTL_SECONDS", "600"))
+CONTRACT_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("ZTDIGS_CONTRACT_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+CONTRACT_CACHE_TOMBSTONE_TTL_SECONDS = float(os.getenv("ZTDIGS_CONTRACT_CACHE_TOMBSTONE_TTL_SECONDS", "86400"))
+
+class CachedContract:
+    """A contract as served from the cache (its compiled policy is cached separately, by policy_hash)."""
+    __slots__ = ("contract", "tombstone")
+
+    def __init__(self, contract: Dict[str, Any], tombstone: bool = False):
+        self.contract = contract
+        self.tombstone = tombstone # Expired contract: only "id" and "expiry_timestamp" are kept
+
+    @classmethod
+    def expired(cls, contract_id: str, expiry_timestamp: float) -> "CachedContract":
+        return cls({"id": contract_id, "expiry_timestamp": expiry_timestamp}, tombstone=True)
+
+class ContractCache:
+    """Thread-safe LRU cache of contracts keyed by contract id, with per-entry expiry, negative entries and tombstones."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float, tombstone_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.tombstone_ttl_seconds = tombstone_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Optional[CachedContract], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "tombstone_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, contract_id: str) -> Tuple[bool, Optional[CachedContract]]:
+        """Returns (found, cached_contract); found with None means the id is known not to exist."""
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(contract_id)
+            if item is None:
+                self._stats["misses"] += 1
+                return False, None
+            cached, expires_at = item
+            if now >= expires_at:
+                self._stats["expirations"] += 1
+                if cached and not cached.tombstone and now >= cached.contract.get("expiry_timestamp", 0):
+                    # The contract itself expired: keep answering from memory, as a tombstone
+                    cached = CachedContract.expired(contract_id, cached.contract.get("expiry_timestamp", 0))
+                    self._entries[contract_id] = (cached, now + self.tombstone_ttl_seconds)
+                else:
+                    del self._entries[contract_id]
+                    self._stats["misses"] += 1
+                    return False, None
+            self._entries.move_to_end(contract_id)
+            self._stats["tombstone_hits" if cached and cached.tombstone else "hits" if cached else "negative_hits"] += 1
+            return True, cached
+
+    def put(self, contract_id: str, contract: Dict[str, Any]) -> CachedContract:
+        """Caches a contract until min(now + TTL, its expiry_timestamp); an already expired one as a tombstone."""
+        if time.time() >= contract.get("expiry_timestamp", 0):
+            return self.put_expired(contract_id, contract.get("expiry_timestamp", 0))
+        cached = CachedContract(contract)
+        expires_at = min(time.time() + self.ttl_seconds, contract.get("expiry_timestamp", 0))
+        self._store(contract_id, cached, expires_at)
+        return cached
+
+    def put_expired(self, contract_id: str, expiry_timestamp: float) -> CachedContract:
+        """Remembers that a contract has expired (e.g. after the sweeper removed it from the database)."""
+        cached = CachedContract.expired(contract_id, expiry_timestamp)
+        self._store(contract_id, cached, time.time() + self.tombstone_ttl_seconds)
+        return cached
+
+    def put_missing(self, contract_id: str):
+        """Remembers briefly that a contract id does not exist."""
+        self._store(contract_id, None, time.time() + self.negative_ttl_seconds)
+
+    def invalidate(self, contract_id: str):
+        with self._lock:
+            self._entries.pop(contract_id, None)
+
+    def evict_expired(self) -> int:
+        """Drops entries past their TTL and shrinks expired contracts to tombstones. Returns the number of entries affected."""
+        now = time.time()
+        affected = 0
+        with self._lock:
+            for contract_id, (cached, expires_at) in list(self._entries.items()):
+                if now < expires_at:
+                    continue
+                affected += 1
+                self._stats["expirations"] += 1
+                if cached and not cached.tombstone and now >= cached.contract.get("expiry_timestamp", 0):
+                    self._entries[contract_id] = (CachedContract.expired(contract_id, cached.contract.get("expiry_timestamp", 0)), now + self.tombstone_ttl_seconds)
+                else:
+                    del self._entries[contract_id]
+        return affected
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        answered = stats["hits"] + stats["negative_hits"] + stats["tombstone_hits"]
+        lookups = answered + stats["misses"]
+        stats["max_size"] = self.max_entries
+        stats["hit_ratio"] = round(answered / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _store(self, contract_id: str, cached: Optional[CachedContract], expires_at: float):
+        if expires_at <= time.time():
+            return # Already expired; nothing worth caching
+        with self._lock:
+            self._entries[contract_id] = (cached, expires_at)
+            self._entries.move_to_end(contract_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+contract_cache = ContractCache(CONTRACT_CACHE_SIZE, CONTRACT_CACHE_TTL_SECONDS, CONTRACT_CACHE_NEGATIVE_TTL_SECONDS, CONTRACT_CACHE_TOMBSTONE_TTL_SECONDS)
@@ -1,19 +1,30 @@
 # services/ztdigs/ztdigs_core.py
 from typing import List, Optional, Dict, Any
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, BulkWriteError
+from pymongo import UpdateOne, ReplaceOne
 from bson import ObjectId
-from dotenv import load_dotenv
+from datetime import datetime, timezone
 import os
 import hashlib # For data hashing
-from Crypto.PublicKey import RSA # From pycryptodome
-from Crypto.Signature import pkcs1_15
-from Crypto.Hash import SHA256
 import time # For timestamps
 import json # For consistent hashing of dicts
-
-# Load environment variables from .env file
-load_dotenv()
+import threading
+import heapq
+import itertools
+import uuid
+from collections import OrderedDict
+from services.ztdigs.signers import get_active_signer, get_verification_signer
+from services.ztdigs.contract_cache import contract_cache, CachedContract
+from services.ztdigs.claim_window import claim_window
+from services.ztdigs.policy import policy_cache, AgentRegionCache, AGENT_REGIONS_TTL_SECONDS
+from services.gars.gars_core import get_agent_compliant_regions
+from services.cluster.invalidation import invalidation_bus
+from services.llos.metrics import stage_timer
+from services.llos.tracing import traced
+from services.ztdigs.canonical import canonical_sha256
+from services.ztdigs.merkle import merkle_leaf_hash, merkle_root, build_merkle_tree, merkle_inclusion_proof, verify_inclusion_proof
+from services.ztdigs.segments import write_segment, SegmentReader
 
 # --- MongoDB Setup ---
 MONGO_URI = os.getenv("MONGO_URI")
@@ -22,18 +33,87 @@ if not MONGO_URI:
     raise ValueError("MONGO_URI environment variable not set. Please create a .env file in services/ztdigs.")
 
 client: Optional[MongoClient] = None
+_client_lock = threading.Lock() # Warmup tasks connect from parallel threads
+
+# --- Signing Configuration ---
+# "entry": every provenance entry carries its own signature (default).
+# "merkle": entries are grouped into blocks and only each block's Merkle root is signed.
+SIGNING_MODE = os.getenv("ZTDIGS_SIGNING_MODE", "entry").lower()
+MERKLE_BLOCK_SIZE = int(os.getenv("ZTDIGS_MERKLE_BLOCK_SIZE", "256"))
+MERKLE_SEAL_INTERVAL_SECONDS = float(os.getenv("ZTDIGS_MERKLE_SEAL_INTERVAL_SECONDS", "5"))
+# Merkle-mode entries still unsealed this long after they were logged fail verification: they carry no
+# signature, and a sealed entry can only look unsealed if someone cleared its block reference.
+MERKLE_UNSEALED_GRACE_SECONDS = float(os.getenv("ZTDIGS_MERKLE_UNSEALED_GRACE_SECONDS", str(max(60.0, 4 * MERKLE_SEAL_INTERVAL_SECONDS))))
+
+# --- Hash Scheme ---
+# "cbor-sha256": SHA-256 over the canonical type-tagged encoding in services.ztdigs.canonical (default).
+# "json-sha256": SHA-256 over sorted-keys JSON. Contracts and entries record the scheme they were hashed
+# with; those without a hash_scheme field predate it and are verified with the JSON scheme.
+HASH_SCHEME_CBOR = "cbor-sha256"
+HASH_SCHEME_JSON = "json-sha256"
+HASH_SCHEME = os.getenv("ZTDIGS_HASH_SCHEME", HASH_SCHEME_CBOR).lower()
+if HASH_SCHEME not in (HASH_SCHEME_CBOR, HASH_SCHEME_JSON):
+    raise ValueError(f"Unknown ZTDIGS_HASH_SCHEME '{HASH_SCHEME}'. Expected {HASH_SCHEME_CBOR} or {HASH_SCHEME_JSON}.")
+
+# --- Chain Configuration ---
+# "global": one hash chain for all events (default).
+# "ticket": an independent chain per ticket_id.
+# "partition": ZTDIGS_CHAIN_PARTITIONS chains, chosen by a hash of ticket_id.
+# Each chain has its own head and sequence; a periodic anchor signs a Merkle root over all chain heads.
+CHAIN_MODE = os.getenv("ZTDIGS_CHAIN_MODE", "global").lower()
+CHAIN_PARTITIONS = int(os.getenv("ZTDIGS_CHAIN_PARTITIONS", "64"))
+CHAIN_ANCHOR_INTERVAL_SECONDS = float(os.getenv("ZTDIGS_CHAIN_ANCHOR_INTERVAL_SECONDS", "300"))
+GLOBAL_CHAIN_ID = "global"
+# Chain order: entries logged before chains existed (no chain_id/sequence) sort first, by timestamp.
+CHAIN_ORDER = [("chain_id", 1), ("sequence", 1), ("timestamp", 1)]
+
+# --- Duplicate Claim Guard ---
+# Events of these types are checked for duplicates inline, before they are appended.
+# "warn" flags the entry (duplicate_claim_suspected) and logs a warning; "strict" rejects it.
+GUARDED_CLAIM_EVENT_TYPES = [t.strip() for t in os.getenv("ZTDIGS_GUARDED_CLAIM_EVENT_TYPES", "invoice_issued").split(",") if t.strip()]
+DUPLICATE_CLAIM_MODE = os.getenv("ZTDIGS_DUPLICATE_CLAIM_MODE", "warn").lower()
+DUPLICATE_CLAIM_WINDOW_SECONDS = float(os.getenv("ZTDIGS_DUPLICATE_CLAIM_WINDOW_SECONDS", "86400"))
+# Maximum number of events accepted by one bulk log request
+LOG_BATCH_MAX_EVENTS = int(os.getenv("ZTDIGS_LOG_BATCH_MAX", "1000"))
+
+# --- Cold Archive Configuration ---
+# Chained entries older than ZTDIGS_ARCHIVE_MIN_AGE_SECONDS (and never older than the duplicate-claim
+# window) are moved out of provenance_log into immutable segment files under ZTDIGS_ARCHIVE_DIR.
+# Chain heads, unsealed Merkle entries and pre-chain legacy entries always stay in MongoDB.
+# ZTDIGS_ARCHIVE_INTERVAL_SECONDS > 0 runs archiving periodically from the API process (0 disables it).
+ARCHIVE_DIR = os.getenv("ZTDIGS_ARCHIVE_DIR", "provenance_archive")
+ARCHIVE_MIN_AGE_SECONDS = float(os.getenv("ZTDIGS_ARCHIVE_MIN_AGE_SECONDS", str(30 * 86400)))
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("ZTDIGS_ARCHIVE_SEGMENT_SIZE", "10000"))
+ARCHIVE_BLOCK_SIZE = int(os.getenv("ZTDIGS_ARCHIVE_BLOCK_SIZE", "256"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ZTDIGS_ARCHIVE_INTERVAL_SECONDS", "0"))
+
+# --- Contract Expiry Configuration ---
+# Expired contracts are copied to data_contracts_expired (the audit history) and then deleted by a
+# sweeper, run every ZTDIGS_CONTRACT_SWEEP_INTERVAL_SECONDS from the API process (0 disables it).
+# Each contract also carries an expires_at date with a TTL index, so MongoDB removes it itself
+# ZTDIGS_CONTRACT_EXPIRY_GRACE_SECONDS after expiry should the sweeper not have run by then.
+CONTRACT_SWEEP_INTERVAL_SECONDS = float(os.getenv("ZTDIGS_CONTRACT_SWEEP_INTERVAL_SECONDS", "300"))
+CONTRACT_SWEEP_BATCH_SIZE = int(os.getenv("ZTDIGS_CONTRACT_SWEEP_BATCH", "500"))
+CONTRACT_EXPIRY_GRACE_SECONDS = float(os.getenv("ZTDIGS_CONTRACT_EXPIRY_GRACE_SECONDS", str(7 * 86400)))
+EXPIRED_CONTRACTS_COLLECTION = "data_contracts_expired"
+
+# GARS compliant_regions of agents, as needed by jurisdiction rules
+agent_regions = AgentRegionCache(get_agent_compliant_regions, AGENT_REGIONS_TTL_SECONDS)
 
 def get_mongo_db_connection():
     """Returns the MongoDB database instance."""
     global client
     if client is None:
-        try:
-            client = MongoClient(MONGO_URI)
-            client.admin.command('ping')
-            print("ZTDIGS Core: MongoDB connection successful!")
-        except ConnectionFailure as e:
-            print(f"ZTDIGS Core: MongoDB connection failed: {e}")
-            raise ConnectionFailure(f"Database connection error: {e}")
+        with _client_lock:
+            if client is None:
+                try:
+                    new_client = MongoClient(MONGO_URI)
+                    new_client.admin.command('ping')
+                    client = new_client
+                    print("ZTDIGS Core: MongoDB connection successful!")
+                except ConnectionFailure as e:
+                    print(f"ZTDIGS Core: MongoDB connection failed: {e}")
+                    raise ConnectionFailure(f"Database connection error: {e}")
     
     db_name_from_uri = MONGO_URI.split('/')[-1].split('?')[0] if '/' in MONGO_URI else ""
     db_name = db_name_from_uri if db_name_from_uri and not db_name_from_uri.startswith('?') else "s3dm_db"
@@ -46,46 +126,130 @@ def close_mongo_db_connection():
         client.close()
         print("ZTDIGS Core: MongoDB connection closed.")
 
-# --- Cryptographic Helpers (Dummy for MVP) ---
+# --- Cryptographic Helpers ---
 # In a real system, private keys would be securely managed by each agent.
-# Here, we generate a single dummy key pair for demonstration.
-# DO NOT USE IN PRODUCTION.
-try:
-    _key = RSA.generate(2048)
-    _private_key_obj = _key
-    _public_key_obj = _key.publickey()
-    print("ZTDIGS Core: Dummy RSA key pair generated.")
-except Exception as e:
-    print(f"ZTDIGS Core: Warning: Could not generate dummy RSA key: {e}. Signatures will be placeholders.")
-    _private_key_obj = None
-    _public_key_obj = None
-
-def calculate_data_hash(data: Dict[str, Any]) -> str:
-    """Calculates SHA256 hash of a dictionary (ensuring consistent serialization)."""
-    # Sort keys to ensure consistent JSON serialization for hashing
+# Here, a single service key signs all entries. It is loaded (or generated) lazily by
+# services.ztdigs.signers, and each signed entry records the key_id used for it.
+
+def calculate_data_hash(data: Dict[str, Any], hash_scheme: Optional[str] = None) -> str:
+    """Calculates SHA256 hash of a dictionary (ensuring consistent serialization) with the given or configured scheme."""
+    if (hash_scheme or HASH_SCHEME) == HASH_SCHEME_CBOR:
+        return canonical_sha256(data)
+    # Legacy scheme: sort keys to ensure consistent JSON serialization for hashing
     json_string = json.dumps(data, sort_keys=True, default=str) # default=str handles ObjectId
     return hashlib.sha256(json_string.encode('utf-8')).hexdigest()
 
+def get_signing_key_id() -> str:
+    """Returns the key id of the active signer (stored on entries so verification picks the right key)."""
+    return get_active_signer().key_id
+
 def generate_signature(data_to_sign_str: str) -> str:
-    """Generates a dummy RSA signature for the given data string."""
-    if _private_key_obj:
-        h = SHA256.new(data_to_sign_str.encode('utf-8'))
-        signer = pkcs1_15.new(_private_key_obj)
-        signature = signer.sign(h)
-        return signature.hex() # Return hex string of the signature
-    return "DUMMY_SIGNATURE_PLACEHOLDER"
-
-def verify_signature(data_to_verify_str: str, signature_hex: str) -> bool:
-    """Verifies a dummy RSA signature for the given data string."""
-    if _public_key_obj and signature_hex != "DUMMY_SIGNATURE_PLACEHOLDER":
-        h = SHA256.new(data_to_verify_str.encode('utf-8'))
-        verifier = pkcs1_15.new(_public_key_obj)
-        try:
-            verifier.verify(h, bytes.fromhex(signature_hex))
-            return True
-        except (ValueError, TypeError):
+    """Generates a signature (hex) for the given data string with the active signer."""
+    with stage_timer("sign"):
+        return get_active_signer().sign(data_to_sign_str)
+
+def verify_signature(data_to_verify_str: str, signature_hex: str, key_id: Optional[str] = None) -> bool:
+    """Verifies a signature for the given data string with the key identified by key_id (default key if None)."""
+    # Placeholder signatures written by the MVP demo (when no key was loaded) are not signatures: they fail
+    signer = get_verification_signer(key_id)
+    if not signer or not signature_hex:
+        return False
+    with stage_timer("verify"):
+        return signer.verify(data_to_verify_str, signature_hex)
+
+def build_signature_payload(entry: Dict[str, Any]) -> str:
+    """Builds the string that is signed for a provenance entry (agent_id is part of the signed data)."""
+    payload = f"{entry.get('ticket_id')}-{entry.get('agent_id')}-{entry.get('event_type')}-{entry.get('timestamp')}-{entry.get('data_hash')}-{entry.get('contract_id', '')}-{entry.get('previous_log_hash')}"
+    if entry.get("sequence") is not None:
+        # Chain position is signed too, so entries cannot be moved between chains or reordered
+        payload += f"-{entry.get('chain_id')}-{entry.get('sequence')}"
+    return payload
+
+# Fields assigned after an entry is appended; they are not part of the chained content.
+_UNCHAINED_FIELDS = ("_id", "block_index", "leaf_index")
+
+def calculate_entry_hash(entry: Dict[str, Any]) -> str:
+    """Calculates the chaining hash of a stored provenance entry (the value the next entry links to)."""
+    # Create a hashable representation of the document
+    temp_doc = entry.copy()
+    for field in _UNCHAINED_FIELDS:
+        temp_doc.pop(field, None) # Remove _id and post-append metadata for consistent hashing
+    hash_scheme = entry.get("hash_scheme", HASH_SCHEME_JSON)
+    if hash_scheme == HASH_SCHEME_CBOR:
+        return calculate_data_hash(temp_doc, hash_scheme)
+    # Ensure ObjectId within payload is converted to string for consistent hash
+    if 'data_payload' in temp_doc and isinstance(temp_doc['data_payload'], dict):
+        if '_id' in temp_doc['data_payload'] and isinstance(temp_doc['data_payload']['_id'], ObjectId):
+            temp_doc['data_payload'] = dict(temp_doc['data_payload'])
+            temp_doc['data_payload']['_id'] = str(temp_doc['data_payload']['_id'])
+    return calculate_data_hash(temp_doc, hash_scheme)
+
+def build_block_signature_payload(block: Dict[str, Any]) -> str:
+    """Builds the string that is signed for a Merkle block of provenance entries."""
+    return f"merkle-block-{block.get('block_index')}-{block.get('leaf_count')}-{block.get('root')}"
+
+def load_merkle_blocks(db, entries: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Loads the Merkle blocks covering the given entries, by block_index: the blocks they reference and the
+    blocks listing them in entry_ids (which also finds sealed entries whose block reference is missing).
+    """
+    merkle_ids = [entry["_id"] for entry in entries if entry.get("signing_mode") == "merkle"]
+    if not merkle_ids:
+        return {}
+    block_indexes = list({entry["block_index"] for entry in entries if entry.get("block_index") is not None})
+    blocks = {}
+    for start in range(0, len(merkle_ids), MERKLE_BLOCK_SIZE * 16):
+        block_filter = {"entry_ids": {"$in": merkle_ids[start:start + MERKLE_BLOCK_SIZE * 16]}}
+        if start == 0 and block_indexes:
+            block_filter = {"$or": [block_filter, {"block_index": {"$in": block_indexes}}]}
+        for block in db["provenance_blocks"].find(block_filter):
+            blocks[block["block_index"]] = block
+    return blocks
+
+def merkle_block_members(blocks: Dict[int, Dict[str, Any]]) -> Dict[str, tuple]:
+    """Maps each entry id listed by the blocks to its (block_index, leaf_index)."""
+    return {str(entry_id): (block_index, leaf_index) for block_index, block in blocks.items() for leaf_index, entry_id in enumerate(block.get("entry_ids", []))}
+
+def is_unsealed_merkle_entry(entry: Dict[str, Any], members: Dict[str, tuple]) -> bool:
+    """True for a Merkle-mode entry that no block covers yet."""
+    return entry.get("signing_mode") == "merkle" and entry.get("block_index") is None and str(entry.get("_id")) not in members
+
+def verify_entry_signature(entry: Dict[str, Any], blocks: Dict[int, Dict[str, Any]], verified_blocks: Optional[set] = None, members: Optional[Dict[str, tuple]] = None) -> bool:
+    """
+    Verifies an entry's authenticity: its own signature, or for Merkle-batched entries, membership in a
+    block whose signed root covers it and whose entry_ids list it at the same leaf. An entry no block
+    covers yet passes only within MERKLE_UNSEALED_GRACE_SECONDS of being logged.
+    blocks and members come from load_merkle_blocks and merkle_block_members (members is derived from
+    blocks when omitted); verified_blocks caches block indexes whose root and signature already checked out.
+    """
+    payload = build_signature_payload(entry)
+    if entry.get("signing_mode") != "merkle":
+        return verify_signature(payload, entry.get("signature", ""), entry.get("key_id"))
+    if members is None:
+        members = merkle_block_members(blocks)
+    entry_id = str(entry.get("_id"))
+    block_index, leaf_index = entry.get("block_index"), entry.get("leaf_index")
+    if block_index is None:
+        if entry_id not in members:
+            return time.time() - (entry.get("timestamp") or 0) < MERKLE_UNSEALED_GRACE_SECONDS
+        block_index, leaf_index = members[entry_id] # Sealed, but the seal stopped before marking the entry
+    elif members.get(entry_id, (block_index, leaf_index)) != (block_index, leaf_index):
+        return False # The entry claims a different block or leaf than the block that lists it
+    block = blocks.get(block_index)
+    if not block:
+        return False
+    entry_ids = block.get("entry_ids", [])
+    if leaf_index is None or not 0 <= leaf_index < len(entry_ids) or str(entry_ids[leaf_index]) != entry_id:
+        return False
+    if verified_blocks is None or block_index not in verified_blocks:
+        leaf_hashes = block.get("leaf_hashes", [])
+        if not leaf_hashes or merkle_root(leaf_hashes) != block.get("root"):
+            return False
+        if not verify_signature(build_block_signature_payload(block), block.get("signature", ""), block.get("key_id")):
             return False
-    return True # If no key or placeholder signature, always "verify" as true for MVP demo
+        if verified_blocks is not None:
+            verified_blocks.add(block_index)
+    return leaf_index < len(block["leaf_hashes"]) and block["leaf_hashes"][leaf_index] == merkle_leaf_hash(payload)
 
 
 # --- Data Contract Functions ---
@@ -105,34 +269,114 @@ def create_data_contract_doc(
         "purpose": purpose,
         "expiry_timestamp": expiry_timestamp,
         "jurisdiction_rules_applied": jurisdiction_rules_applied,
-        "created_at": time.time()
+        "created_at": time.time(),
+        "hash_scheme": HASH_SCHEME
     }
     contract_data["policy_hash"] = calculate_data_hash(contract_data) # Hash of the contract itself
     return contract_data
 
+_contract_indexes_ready = False
+_contract_sweep_lock = threading.Lock()
+
+def _ensure_contract_indexes(db):
+    global _contract_indexes_ready
+    if not _contract_indexes_ready:
+        db["data_contracts"].create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+        db["data_contracts"].create_index("expiry_timestamp", name="expiry_timestamp")
+        db[EXPIRED_CONTRACTS_COLLECTION].create_index("ticket_id", name="ticket_id")
+        _contract_indexes_ready = True
+
+@traced("ztdigs.generate_and_store_contract")
 def generate_and_store_contract(contract_data: Dict[str, Any]) -> Dict[str, Any]:
     """Generates a new data contract and stores it in MongoDB."""
     db = get_mongo_db_connection()
     contracts_collection = db["data_contracts"]
-    
+    _ensure_contract_indexes(db)
+
+    # TTL backstop; set after policy_hash is computed, so it is not part of the hashed contract
+    contract_data = dict(contract_data)
+    contract_data["expires_at"] = datetime.fromtimestamp(contract_data["expiry_timestamp"] + CONTRACT_EXPIRY_GRACE_SECONDS, tz=timezone.utc)
     result = contracts_collection.insert_one(contract_data)
     new_contract_doc = contracts_collection.find_one({"_id": result.inserted_id})
     if new_contract_doc:
         new_contract_doc["id"] = str(new_contract_doc.pop("_id"))
+        contract_cache.put(new_contract_doc["id"], dict(new_contract_doc)) # Warm the cache for upcoming events
+        invalidation_bus.publish("ztdigs.contract", contract_id=new_contract_doc["id"]) # Drop any cached miss elsewhere
         return new_contract_doc
     else:
         raise RuntimeError("Failed to retrieve newly generated contract.")
 
-def get_data_contract(contract_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieves a data contract by its ID."""
+def get_cached_contract(contract_id: str) -> Optional[CachedContract]:
+    """Retrieves a data contract through the in-process contract cache (None if it does not exist)."""
+    if not ObjectId.is_valid(contract_id):
+        return None
+    found, cached = contract_cache.get(contract_id)
+    if found:
+        return cached
     db = get_mongo_db_connection()
     contracts_collection = db["data_contracts"]
     contract_doc = contracts_collection.find_one({"_id": ObjectId(contract_id)})
-    if contract_doc:
-        contract_doc["id"] = str(contract_doc.pop("_id"))
-        return contract_doc
+    if not contract_doc:
+        # Swept contracts are remembered as expired rather than unknown
+        expired_doc = db[EXPIRED_CONTRACTS_COLLECTION].find_one({"_id": ObjectId(contract_id)}, {"expiry_timestamp": 1})
+        if expired_doc:
+            return contract_cache.put_expired(contract_id, expired_doc.get("expiry_timestamp", 0))
+        contract_cache.put_missing(contract_id)
+        return None
+    contract_doc["id"] = str(contract_doc.pop("_id"))
+    return contract_cache.put(contract_id, contract_doc)
+
+def get_data_contract(contract_id: str) -> Optional[Dict[str, Any]]:
+    """Retrieves a data contract by its ID, including expired ones (from data_contracts_expired once swept)."""
+    cached = get_cached_contract(contract_id)
+    if cached is None:
+        return None
+    if not cached.tombstone:
+        return dict(cached.contract) # Copy, so callers cannot alter the cached contract
+    # A tombstone only keeps the expiry, so read the full contract: not yet swept, or archived
+    db = get_mongo_db_connection()
+    for collection_name in ("data_contracts", EXPIRED_CONTRACTS_COLLECTION):
+        contract_doc = db[collection_name].find_one({"_id": ObjectId(contract_id)})
+        if contract_doc:
+            contract_doc["id"] = str(contract_doc.pop("_id"))
+            return contract_doc
     return None
 
+def sweep_expired_contracts() -> Dict[str, int]:
+    """
+    Moves expired contracts from data_contracts to data_contracts_expired (with an archived_at time),
+    in batches of CONTRACT_SWEEP_BATCH_SIZE, and leaves tombstones for them in the contract cache.
+    Each batch is copied before it is deleted, so an interrupted sweep only repeats the copy.
+    Also evicts expired entries from the contract cache. Returns the counts.
+    """
+    if not _contract_sweep_lock.acquire(blocking=False):
+        return {"archived": 0, "cache_evicted": 0} # A sweep is already running
+    try:
+        db = get_mongo_db_connection()
+        contracts_collection = db["data_contracts"]
+        expired_collection = db[EXPIRED_CONTRACTS_COLLECTION]
+        _ensure_contract_indexes(db)
+        now = time.time()
+        archived = 0
+        while True:
+            expired = list(contracts_collection.find({"expiry_timestamp": {"$lt": now}}).limit(CONTRACT_SWEEP_BATCH_SIZE))
+            if not expired:
+                break
+            archived_at = time.time()
+            expired_collection.bulk_write([ReplaceOne({"_id": doc["_id"]}, dict(doc, archived_at=archived_at), upsert=True) for doc in expired], ordered=False)
+            contracts_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in expired]}})
+            for doc in expired:
+                contract_cache.put_expired(str(doc["_id"]), doc.get("expiry_timestamp", 0))
+            archived += len(expired)
+            if len(expired) < CONTRACT_SWEEP_BATCH_SIZE:
+                break
+        cache_evicted = contract_cache.evict_expired()
+        if archived:
+            print(f"ZTDIGS: Archived {archived} expired contract(s) to {EXPIRED_CONTRACTS_COLLECTION}.")
+        return {"archived": archived, "cache_evicted": cache_evicted}
+    finally:
+        _contract_sweep_lock.release()
+
 # --- Provenance Log Functions ---
 def create_provenance_log_entry_data(
     ticket_id: str,
@@ -153,10 +397,53 @@ def create_provenance_log_entry_data(
         "details": details,
         "data_payload": data_payload, # Store original payload (can be redacted later)
         "data_hash": data_hash,
+        "hash_scheme": HASH_SCHEME,
         "timestamp": event_timestamp,
         "contract_id": contract_id
     }
 
+def enforce_data_contract(log_data: Dict[str, Any], cached_contract: Optional[CachedContract]):
+    """
+    Enforces an event's data contract through its compiled policy (see services.ztdigs.policy).
+    Raises ValueError if the event violates the contract (policy violations only in strict mode).
+    """
+    if not cached_contract:
+        raise ValueError(f"ZTDIGS: Contract {log_data['contract_id']} not found for event {log_data['event_type']}")
+    if cached_contract.tombstone:
+        raise ValueError(f"ZTDIGS: Contract {cached_contract.contract['id']} has expired for event {log_data['event_type']}")
+    policy_cache.get(cached_contract.contract).evaluate(log_data, agent_regions)
+
+def guard_duplicate_claim(log_data: Dict[str, Any], unrecorded_claims: int = 0):
+    """
+    Anti-fraud guardrail for claim events (answered from the in-memory claim window). unrecorded_claims
+    counts earlier claims not yet appended (e.g. earlier events of the same batch).
+    """
+    if log_data["event_type"] not in GUARDED_CLAIM_EVENT_TYPES:
+        return
+    prior_claims = count_recent_claims(log_data["ticket_id"], log_data["event_type"], DUPLICATE_CLAIM_WINDOW_SECONDS) + unrecorded_claims
+    if prior_claims > 0:
+        if DUPLICATE_CLAIM_MODE == "strict":
+            raise ValueError(f"ZTDIGS: Duplicate '{log_data['event_type']}' claim for ticket {log_data['ticket_id']} ({prior_claims} within the last {DUPLICATE_CLAIM_WINDOW_SECONDS:.0f} seconds).")
+        print(f"ZTDIGS: Warning: Possible duplicate '{log_data['event_type']}' claim for ticket {log_data['ticket_id']} ({prior_claims} prior).")
+        log_data["duplicate_claim_suspected"] = True
+
+def _prepare_chained_entry(log_data: Dict[str, Any], chain_id: str, head_entry: Optional[Dict[str, Any]]):
+    """Links log_data to the chain head, assigns its sequence and signs it (or leaves it for a Merkle block)."""
+    log_data.pop("_id", None)
+    log_data["chain_id"] = chain_id
+    log_data["sequence"] = (head_entry.get("sequence") or 0) + 1 if head_entry else 1
+    log_data["previous_log_hash"] = calculate_entry_hash(head_entry) if head_entry else None
+    if SIGNING_MODE == "merkle":
+        # Signed later as part of a Merkle block (see seal_pending_merkle_block)
+        log_data["signing_mode"] = "merkle"
+        log_data["signature"] = None
+        log_data["block_index"] = None
+    else:
+        # Generate signature for the event, ensuring agent_id is part of signed data
+        log_data["key_id"] = get_signing_key_id()
+        log_data["signature"] = generate_signature(build_signature_payload(log_data))
+
+@traced("ztdigs.log_provenance_event")
 def log_provenance_event(log_data: Dict[str, Any]) -> Dict[str, Any]:
     """Logs a new event to the immutable provenance log, with chaining and basic enforcement."""
     db = get_mongo_db_connection()
@@ -164,58 +451,32 @@ def log_provenance_event(log_data: Dict[str, Any]) -> Dict[str, Any]:
 
     # 1. Basic Contract Enforcement (simplified for MVP)
     if log_data.get("contract_id"):
-        contract = get_data_contract(log_data["contract_id"])
-        if not contract:
-            raise ValueError(f"ZTDIGS: Contract {log_data['contract_id']} not found for event {log_data['event_type']}")
-        
-        # Check contract expiry
-        if time.time() > contract.get("expiry_timestamp", 0):
-            raise ValueError(f"ZTDIGS: Contract {contract['id']} has expired for event {log_data['event_type']}")
-        
-        # Check policy hash (if provided by sender, ensures sender uses correct contract)
-        # For this simplified version, we just store the hash. Full check requires sender to send hash.
-        if log_data.get("policy_hash") and log_data["policy_hash"] != contract["policy_hash"]:
-             raise ValueError(f"ZTDIGS: Policy hash mismatch for contract {contract['id']}. Tampering detected or incorrect contract used.")
-
-        # Check data elements allowed (conceptual for MVP)
-        allowed_elements = set(contract.get("data_elements_allowed", []))
-        if log_data.get("data_payload"):
-            for key in log_data["data_payload"].keys():
-                if key not in allowed_elements and allowed_elements: # If allowed_elements is not empty, check strictness
-                    print(f"ZTDIGS: Warning: Data element '{key}' in payload not explicitly allowed by contract {contract['id']}.")
-                    # In a strict system, this would raise an error.
-
-        # Basic Jurisdiction Compliance Check (Conceptual)
-        # Example: If contract specifies "GDPR" rules apply, and data contains PII, ensure agent is EU-compliant.
-        # This requires more metadata from GARS and richer data payloads
-        if "GDPR" in contract.get("jurisdiction_rules_applied", []):
-            if "customer_name" in log_data.get("data_payload", {}) and "non_eu_agent_id" in log_data.get("agent_id", ""):
-                 print(f"ZTDIGS: Warning: PII logged for GDPR contract to potentially non-EU agent. Requires review.")
-                 # In a strict system, this would block the transaction.
-
-
-    # 2. Get the hash of the last log entry for cryptographic chaining
-    last_log_entry = provenance_collection.find_one(sort=[('_id', -1)])
-    previous_log_hash = None
-    if last_log_entry:
-        # Create a hashable representation of the previous document
-        temp_doc = last_log_entry.copy()
-        temp_doc.pop("_id", None) # Remove _id for consistent hashing
-        # Ensure ObjectId within payload is converted to string for consistent hash
-        if 'data_payload' in temp_doc and isinstance(temp_doc['data_payload'], dict):
-            if '_id' in temp_doc['data_payload'] and isinstance(temp_doc['data_payload']['_id'], ObjectId):
-                temp_doc['data_payload']['_id'] = str(temp_doc['data_payload']['_id'])
-        
-        previous_log_hash = calculate_data_hash(temp_doc)
-
-    # 3. Prepare the new log entry
-    log_data["previous_log_hash"] = previous_log_hash
-    # Generate signature for the event, ensuring agent_id is part of signed data
-    data_for_sig = f"{log_data['ticket_id']}-{log_data['agent_id']}-{log_data['event_type']}-{log_data['timestamp']}-{log_data['data_hash']}-{log_data.get('contract_id', '')}-{previous_log_hash}"
-    log_data["signature"] = generate_signature(data_for_sig)
-
-    # 4. Insert into MongoDB
-    result = provenance_collection.insert_one(log_data)
+        enforce_data_contract(log_data, get_cached_contract(log_data["contract_id"]))
+
+    # 1b. Anti-fraud guardrail for claim events
+    guard_duplicate_claim(log_data)
+
+    # 2-4. Chain to the head of this ticket's chain, sign and insert.
+    # The unique (chain_id, sequence) index makes the insert a compare-and-swap on the chain head:
+    # if another writer appended first, re-read the head and retry.
+    chain_id = chain_id_for_ticket(log_data["ticket_id"])
+    _ensure_chain_indexes(provenance_collection)
+    with _chain_lock(chain_id):
+        for attempt in range(CHAIN_APPEND_RETRIES):
+            # 2-3. Link to the chain's last entry and prepare the new log entry
+            _prepare_chained_entry(log_data, chain_id, get_chain_head(chain_id))
+
+            # 4. Insert into MongoDB
+            try:
+                result = provenance_collection.insert_one(log_data)
+                break
+            except DuplicateKeyError:
+                print(f"ZTDIGS: Chain {chain_id} advanced concurrently, retrying append (attempt {attempt + 1}).")
+        else:
+            raise RuntimeError(f"Failed to append to provenance chain {chain_id} after {CHAIN_APPEND_RETRIES} attempts.")
+    record_claims([log_data])
+    if SIGNING_MODE == "merkle":
+        _note_pending_merkle_entries(1)
     new_log_entry_doc = provenance_collection.find_one({"_id": result.inserted_id})
     if new_log_entry_doc:
         new_log_entry_doc["id"] = str(new_log_entry_doc.pop("_id")) # Rename _id to id
@@ -223,45 +484,143 @@ def log_provenance_event(log_data: Dict[str, Any]) -> Dict[str, Any]:
     else:
         raise RuntimeError("Failed to retrieve newly logged provenance entry.")
 
-def verify_provenance_chain() -> Dict[str, Any]:
-    """Verifies the integrity of the entire provenance log chain."""
+@traced("ztdigs.log_provenance_events_batch")
+def log_provenance_events_batch(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Logs an ordered list of events in one round trip. Contracts are validated once per distinct
+    contract_id, accepted events are chained and signed in memory (per chain, in batch order) and
+    persisted with a single insert_many. Returns one result per event, in order:
+    {"index", "status": "logged", "entry"}, {"index", "status": "rejected", "error"} for an event that
+    failed validation, or {"index", "status": "failed", "error"} for one that could not be written.
+    """
     db = get_mongo_db_connection()
     provenance_collection = db["provenance_log"]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(events)
+
+    # 1. Enforcement: one contract lookup per distinct contract_id, then per-event checks
+    contracts = {contract_id: get_cached_contract(contract_id) for contract_id in {e["contract_id"] for e in events if e.get("contract_id")}}
+    batch_claims: Dict[tuple, int] = {}
+    accepted = []
+    for index, log_data in enumerate(events):
+        try:
+            if log_data.get("contract_id"):
+                enforce_data_contract(log_data, contracts[log_data["contract_id"]])
+            claim_key = (log_data["ticket_id"], log_data["event_type"])
+            guard_duplicate_claim(log_data, batch_claims.get(claim_key, 0))
+            batch_claims[claim_key] = batch_claims.get(claim_key, 0) + 1
+            accepted.append(index)
+        except ValueError as e:
+            results[index] = {"index": index, "status": "rejected", "error": str(e)}
+
+    # 2-3. Chain and sign in memory, holding the lock of every chain touched by the batch
+    chain_ids = {index: chain_id_for_ticket(events[index]["ticket_id"]) for index in accepted}
+    locks = sorted({id(_chain_lock(chain_id)): _chain_lock(chain_id) for chain_id in chain_ids.values()}.items())
+    _ensure_chain_indexes(provenance_collection)
+    for _, lock in locks:
+        lock.acquire()
+    try:
+        heads = {chain_id: get_chain_head(chain_id) for chain_id in set(chain_ids.values())}
+        for index in accepted:
+            chain_id = chain_ids[index]
+            _prepare_chained_entry(events[index], chain_id, heads[chain_id])
+            heads[chain_id] = events[index]
+
+        # 4. Persist in one round trip. If another process advanced one of the chains (a duplicate
+        # (chain_id, sequence)), everything from the conflicting entry on is re-appended one by one with
+        # fresh heads. Any other write error fails the rest of the batch (it is chained on the failed entry).
+        inserted, failed_error = accepted, None
+        if accepted:
+            try:
+                provenance_collection.insert_many([events[index] for index in accepted], ordered=True)
+            except BulkWriteError as e:
+                inserted = accepted[:e.details.get("nInserted", 0)]
+                write_errors = e.details.get("writeErrors") or [{}]
+                if write_errors[0].get("code") == DUPLICATE_KEY_ERROR_CODE:
+                    print(f"ZTDIGS: Batch append conflicted with a concurrent writer; re-appending {len(accepted) - len(inserted)} events individually.")
+                else:
+                    failed_error = write_errors[0].get("errmsg") or str(e)
+                    print(f"ZTDIGS: Batch append failed after {len(inserted)} of {len(accepted)} events: {failed_error}")
+    finally:
+        for _, lock in reversed(locks):
+            lock.release()
 
-    entries = list(provenance_collection.find().sort("timestamp", 1)) # Get all, sorted chronologically
+    record_claims([events[index] for index in inserted])
+    for index in inserted:
+        log_data = events[index]
+        entry = dict(log_data)
+        entry["id"] = str(entry.pop("_id"))
+        results[index] = {"index": index, "status": "logged", "entry": entry}
+    if SIGNING_MODE == "merkle" and inserted:
+        _note_pending_merkle_entries(len(inserted))
+
+    for index in accepted[len(inserted):]:
+        if failed_error:
+            results[index] = {"index": index, "status": "failed", "error": f"Not written: {failed_error}"}
+            continue
+        try:
+            results[index] = {"index": index, "status": "logged", "entry": log_provenance_event(events[index])}
+        except ValueError as e:
+            results[index] = {"index": index, "status": "rejected", "error": str(e)}
+        except Exception as e:
+            results[index] = {"index": index, "status": "failed", "error": f"Not written: {e}"}
+    return results
+
+@traced("ztdigs.verify_provenance_chain")
+def verify_provenance_chain(chain_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Verifies the integrity of the provenance log, including archived segments: every chain, or only the
+    given chain (e.g. chain_id_for_ticket(ticket_id) to audit one ticket without touching other chains).
+    """
+    db = get_mongo_db_connection()
+
+    try:
+        entries = list(iter_provenance_entries(chain_id)) # Get all (archived and hot), in chain order
+    except ValueError as e: # Archive segment failed its integrity check
+        print(str(e))
+        return {"status": "FAILED", "reason": str(e), "passed": False}
 
     if not entries:
         return {"status": "No entries to verify.", "passed": True}
 
+    blocks = load_merkle_blocks(db, entries)
+    members = merkle_block_members(blocks)
+    verified_blocks = set()
+    if chain_id is None:
+        # Every entry a block was sealed over must still be in the log
+        entry_ids = {str(entry["_id"]) for entry in entries}
+        for entry_id, (block_index, _) in members.items():
+            if entry_id not in entry_ids:
+                print(f"ZTDIGS: Entry {entry_id} sealed in Merkle block {block_index} is missing")
+                return {"status": "FAILED", "reason": f"Entry {entry_id} sealed in Merkle block {block_index} is missing", "entry_id": entry_id, "passed": False}
+
     is_tamper_proof = True
     for i in range(len(entries)):
         current_entry = entries[i]
         current_id = str(current_entry.get("_id"))
 
-        # 1. Verify signature for current entry
-        data_to_verify_sig = f"{current_entry.get('ticket_id')}-{current_entry.get('agent_id')}-{current_entry.get('event_type')}-{current_entry.get('timestamp')}-{current_entry.get('data_hash')}-{current_entry.get('contract_id', '')}-{current_entry.get('previous_log_hash')}"
-        if not verify_signature(data_to_verify_sig, current_entry.get("signature", "")):
+        # 1. Verify signature (or Merkle block membership) for current entry
+        if not verify_entry_signature(current_entry, blocks, verified_blocks=verified_blocks, members=members):
             is_tamper_proof = False
             print(f"ZTDIGS: Signature verification FAILED for entry {current_id}")
             return {"status": "FAILED", "reason": f"Signature mismatch for entry {current_id}", "entry_id": current_id, "passed": False}
 
-        # 2. Verify chaining hash for subsequent entries
-        if i > 0:
-            previous_entry = entries[i-1]
-            # Create a hashable representation of the *previous* document
-            temp_prev_doc = previous_entry.copy()
-            temp_prev_doc.pop("_id", None) 
-            if 'data_payload' in temp_prev_doc and isinstance(temp_prev_doc['data_payload'], dict):
-                if '_id' in temp_prev_doc['data_payload'] and isinstance(temp_prev_doc['data_payload']['_id'], ObjectId):
-                    temp_prev_doc['data_payload']['_id'] = str(temp_prev_doc['data_payload']['_id'])
-            
-            recalculated_hash = calculate_data_hash(temp_prev_doc)
-
-            if recalculated_hash != current_entry.get("previous_log_hash"):
-                is_tamper_proof = False
-                print(f"ZTDIGS: Chaining hash mismatch detected at entry {current_id}")
-                return {"status": "FAILED", "reason": f"Chaining hash mismatch at entry {current_id}", "entry_id": current_id, "recalculated_hash": recalculated_hash, "expected_hash": current_entry.get("previous_log_hash"), "passed": False}
+        # 2. Verify chaining hash (and sequence) against the previous entry of the same chain
+        link_failure = check_chain_link(entries[i-1] if i > 0 else None, current_entry)
+        if link_failure:
+            is_tamper_proof = False
+            print(f"ZTDIGS: {link_failure['reason']}")
+            return link_failure
 
+    # 3. Every chain must still contain the last head anchored for it (catches a truncated tail)
+    positions = {(entry.get("chain_id"), entry.get("sequence")): entry for entry in entries if entry.get("sequence") is not None}
+    anchor_failure = verify_chain_anchors(chain_id, positions.get)
+    if anchor_failure:
+        print(f"ZTDIGS: {anchor_failure['reason']}")
+        return anchor_failure
+
+    unsealed = sum(1 for entry in entries if is_unsealed_merkle_entry(entry, members))
+    if unsealed:
+        return {"status": "PASSED", "message": f"All provenance log entries verified successfully; {unsealed} recent entries await their Merkle block.", "passed": True, "unsealed_entries": unsealed}
     return {"status": "PASSED", "message": "All provenance log entries verified successfully.", "passed": True}
 
 def check_duplicate_claim(ticket_id: str, event_type: str = "invoice_issued", time_window_seconds: int = 86400) -> Dict[str, Any]:
@@ -269,6 +628,18 @@ def check_duplicate_claim(ticket_id: str, event_type: str = "invoice_issued", ti
     Checks for duplicate claims (e.g., invoices) for a given ticket within a time window.
     This is a basic anti-fraud guardrail.
     """
+    count = count_recent_claims(ticket_id, event_type, time_window_seconds)
+    
+    if count > 1:
+        return {"is_duplicate": True, "message": f"More than one '{event_type}' event found for ticket {ticket_id} within the last {time_window_seconds} seconds.", "count": count}
+    return {"is_duplicate": False, "message": "No duplicate claims detected.", "count": count}
+
+
+def count_recent_claims(ticket_id: str, event_type: str, time_window_seconds: float) -> int:
+    """Counts events of a type for a ticket within the window: from the claim window when it can answer, else from MongoDB."""
+    count = claim_window.count(ticket_id, event_type, time_window_seconds)
+    if count is not None:
+        return count
     db = get_mongo_db_connection()
     provenance_collection = db["provenance_log"]
 
@@ -279,9 +650,658 @@ def check_duplicate_claim(ticket_id: str, event_type: str = "invoice_issued", ti
         "event_type": event_type,
         "timestamp": {"$gt": current_time - time_window_seconds} # Events within the last X seconds
     }
-    
-    count = provenance_collection.count_documents(query_filter)
-    
-    if count > 1:
-        return {"is_duplicate": True, "message": f"More than one '{event_type}' event found for ticket {ticket_id} within the last {time_window_seconds} seconds.", "count": count}
-    return {"is_duplicate": False, "message": "No duplicate claims detected.", "count": count}
\ No newline at end of file
+    return provenance_collection.count_documents(query_filter)
+
+def record_claims(entries: List[Dict[str, Any]]):
+    """Adds appended entries to the claim window, and tells the other workers about the tracked ones."""
+    claims = []
+    for entry in entries:
+        claim_window.record(entry["ticket_id"], entry["event_type"], entry["timestamp"])
+        if entry["event_type"] in claim_window.event_types:
+            claims.append({"ticket_id": entry["ticket_id"], "event_type": entry["event_type"], "timestamp": entry["timestamp"]})
+    if claims:
+        invalidation_bus.publish("ztdigs.claims", claims=claims)
+
+def bootstrap_claim_window():
+    """Loads recent claim events from the provenance log into the in-memory claim window (call on startup)."""
+    db = get_mongo_db_connection()
+    provenance_collection = db["provenance_log"]
+    recent_events = provenance_collection.find(
+        {"event_type": {"$in": list(claim_window.event_types)}, "timestamp": {"$gt": time.time() - claim_window.max_window_seconds}},
+        {"_id": 0, "ticket_id": 1, "event_type": 1, "timestamp": 1}
+    )
+    claim_window.bootstrap(recent_events)
+    print(f"ZTDIGS: Claim window bootstrapped ({claim_window.stats()['keys']} keys).")
+
+# --- Cluster Invalidations ---
+# Changes made by other workers (see services.cluster.invalidation)
+def _on_contract_invalidated(payload: Dict[str, Any]):
+    contract_cache.invalidate(payload["contract_id"])
+
+def _on_claims_recorded(payload: Dict[str, Any]):
+    for claim in payload.get("claims", []):
+        claim_window.record(claim["ticket_id"], claim["event_type"], claim["timestamp"], skip_known=True)
+
+def _on_agent_changed(payload: Dict[str, Any]):
+    agent_regions.clear()
+
+invalidation_bus.subscribe("ztdigs.contract", _on_contract_invalidated)
+invalidation_bus.subscribe("ztdigs.claims", _on_claims_recorded)
+invalidation_bus.subscribe("gars.agent", _on_agent_changed)
+
+# --- Provenance Chains ---
+CHAIN_APPEND_RETRIES = 10
+DUPLICATE_KEY_ERROR_CODE = 11000 # A concurrent append took the same (chain_id, sequence)
+# Appends to one chain are serialized in-process by a striped lock (cheap, bounded memory);
+# the unique index still arbitrates between processes.
+_chain_locks = [threading.Lock() for _ in range(256)]
+_chain_indexes_ready = False
+
+def chain_id_for_ticket(ticket_id: str) -> str:
+    """Returns the id of the chain a ticket's events are appended to under the configured chain mode."""
+    if CHAIN_MODE == "ticket":
+        return f"ticket:{ticket_id}"
+    if CHAIN_MODE == "partition":
+        partition = int(hashlib.sha256(ticket_id.encode('utf-8')).hexdigest(), 16) % CHAIN_PARTITIONS
+        return f"partition:{partition}"
+    return GLOBAL_CHAIN_ID
+
+def chain_filter(chain_id: str) -> Dict[str, Any]:
+    """Mongo filter selecting one chain's entries (the global chain includes pre-chain legacy entries)."""
+    if chain_id == GLOBAL_CHAIN_ID:
+        return {"$or": [{"chain_id": GLOBAL_CHAIN_ID}, {"chain_id": {"$exists": False}}]}
+    return {"chain_id": chain_id}
+
+def _chain_lock(chain_id: str) -> threading.Lock:
+    return _chain_locks[int(hashlib.md5(chain_id.encode('utf-8')).hexdigest(), 16) % len(_chain_locks)]
+
+def _ensure_chain_indexes(provenance_collection):
+    global _chain_indexes_ready
+    if not _chain_indexes_ready:
+        provenance_collection.create_index(
+            [("chain_id", 1), ("sequence", 1)], unique=True, name="chain_sequence_unique",
+            partialFilterExpression={"sequence": {"$exists": True}}
+        )
+        # Ticket timelines: a ticket's entries in chain order (each ticket belongs to one chain)
+        provenance_collection.create_index([("ticket_id", 1), ("sequence", 1)], name="ticket_sequence")
+        _chain_indexes_ready = True
+
+def get_chain_head(chain_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the last entry of a chain (None for an empty chain)."""
+    db = get_mongo_db_connection()
+    provenance_collection = db["provenance_log"]
+    head_entry = provenance_collection.find_one({"chain_id": chain_id}, sort=[("sequence", -1)])
+    if head_entry is None and chain_id == GLOBAL_CHAIN_ID:
+        # Continue the chain of entries logged before chain ids were recorded
+        head_entry = provenance_collection.find_one({"chain_id": {"$exists": False}}, sort=[("_id", -1)])
+    return head_entry
+
+def check_chain_link(previous_entry: Optional[Dict[str, Any]], entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Checks that entry correctly follows previous_entry (the preceding entry in CHAIN_ORDER, or None at the
+    start). Within a chain the hash link and sequence must match; a new chain must start at sequence 1.
+    Returns the failure result, or None if the link is valid.
+    """
+    entry_id = str(entry.get("_id"))
+    same_chain = previous_entry is not None and (previous_entry.get("chain_id") or GLOBAL_CHAIN_ID) == (entry.get("chain_id") or GLOBAL_CHAIN_ID)
+    sequence = entry.get("sequence")
+    if not same_chain:
+        if sequence is not None and sequence != 1:
+            return {"status": "FAILED", "reason": f"Sequence gap at entry {entry_id}: chain {entry.get('chain_id')} starts at sequence {sequence}", "entry_id": entry_id, "passed": False}
+        return None
+
+    # Recalculate the hash of the *previous* document
+    recalculated_hash = calculate_entry_hash(previous_entry)
+    if recalculated_hash != entry.get("previous_log_hash"):
+        return {"status": "FAILED", "reason": f"Chaining hash mismatch at entry {entry_id}", "entry_id": entry_id, "recalculated_hash": recalculated_hash, "expected_hash": entry.get("previous_log_hash"), "passed": False}
+    previous_sequence = previous_entry.get("sequence")
+    if sequence is not None and previous_sequence is not None and sequence != previous_sequence + 1:
+        return {"status": "FAILED", "reason": f"Sequence gap at entry {entry_id}: expected {previous_sequence + 1}, found {sequence}", "entry_id": entry_id, "passed": False}
+    return None
+
+def build_anchor_signature_payload(anchor: Dict[str, Any]) -> str:
+    """Builds the string that is signed for a global anchor over chain heads."""
+    return f"chain-anchor-{anchor.get('anchor_index')}-{anchor.get('chain_count')}-{anchor.get('root')}-{anchor.get('created_at')}"
+
+def anchor_chain_heads() -> Optional[Dict[str, Any]]:
+    """
+    Commits to the current head of every chain: signs a Merkle root over (chain_id, sequence, head hash)
+    leaves in chain_id order. Heads are stored in provenance_anchor_heads, keyed by anchor_index.
+    Returns the anchor (without heads), or None if the log is empty.
+    """
+    db = get_mongo_db_connection()
+    provenance_collection = db["provenance_log"]
+    anchors_collection = db["provenance_anchors"]
+    anchors_collection.create_index("anchor_index", unique=True)
+
+    head_entries = provenance_collection.aggregate([
+        {"$match": {"sequence": {"$exists": True}}},
+        {"$sort": {"chain_id": 1, "sequence": -1}},
+        {"$group": {"_id": "$chain_id", "head": {"$first": "$$ROOT"}}},
+        {"$sort": {"_id": 1}}
+    ], allowDiskUse=True)
+    heads = []
+    for group in head_entries:
+        head_entry = group["head"]
+        heads.append({"chain_id": group["_id"], "sequence": head_entry["sequence"], "head_hash": calculate_entry_hash(head_entry)})
+    if not heads:
+        return None
+
+    leaf_hashes = [merkle_leaf_hash(f"{head['chain_id']}-{head['sequence']}-{head['head_hash']}") for head in heads]
+    last_anchor = anchors_collection.find_one(sort=[("anchor_index", -1)])
+    anchor = {
+        "anchor_index": last_anchor["anchor_index"] + 1 if last_anchor else 0,
+        "chain_count": len(heads),
+        "root": merkle_root(leaf_hashes),
+        "created_at": time.time()
+    }
+    anchor["key_id"] = get_signing_key_id()
+    anchor["signature"] = generate_signature(build_anchor_signature_payload(anchor))
+    try:
+        anchors_collection.insert_one(anchor)
+    except DuplicateKeyError:
+        print(f"ZTDIGS: Chain anchor {anchor['anchor_index']} already written elsewhere, skipping.")
+        return None
+    db["provenance_anchor_heads"].insert_many([dict(head, anchor_index=anchor["anchor_index"], leaf_index=i) for i, head in enumerate(heads)])
+    print(f"ZTDIGS: Anchored {anchor['chain_count']} chain heads (anchor {anchor['anchor_index']}).")
+    anchor["id"] = str(anchor.pop("_id"))
+    return anchor
+
+def _anchor_is_valid(db, anchor_index: int) -> bool:
+    """Checks an anchor's signature and that its stored heads rebuild its signed root."""
+    anchor = db["provenance_anchors"].find_one({"anchor_index": anchor_index})
+    if not anchor:
+        return False
+    heads = list(db["provenance_anchor_heads"].find({"anchor_index": anchor_index}).sort("leaf_index", 1))
+    if not heads or len(heads) != anchor.get("chain_count"):
+        return False
+    leaf_hashes = [merkle_leaf_hash(f"{head['chain_id']}-{head['sequence']}-{head['head_hash']}") for head in heads]
+    if merkle_root(leaf_hashes) != anchor.get("root"):
+        return False
+    return verify_signature(build_anchor_signature_payload(anchor), anchor.get("signature", ""), anchor.get("key_id"))
+
+def verify_chain_anchors(chain_id: Optional[str] = None, find_entry=None) -> Optional[Dict[str, Any]]:
+    """
+    Checks that every chain (or the given one) still holds the most recent head anchored for it, unchanged,
+    under a validly signed anchor. With the chain's hash links verified, that covers every earlier anchored
+    head too. find_entry((chain_id, sequence)) looks entries up (default: in MongoDB and the archive).
+    Returns the failure result, or None.
+    """
+    db = get_mongo_db_connection()
+    latest_heads = db["provenance_anchor_heads"].aggregate([
+        {"$match": {"chain_id": chain_id} if chain_id else {}},
+        {"$sort": {"chain_id": 1, "sequence": -1}},
+        {"$group": {"_id": "$chain_id", "head": {"$first": "$$ROOT"}}}
+    ], allowDiskUse=True)
+    valid_anchors: Dict[int, bool] = {}
+    for group in latest_heads:
+        head = group["head"]
+        anchor_index = head["anchor_index"]
+        if anchor_index not in valid_anchors:
+            valid_anchors[anchor_index] = _anchor_is_valid(db, anchor_index)
+        if not valid_anchors[anchor_index]:
+            return {"status": "FAILED", "reason": f"Chain anchor {anchor_index} has an invalid root or signature", "anchor_index": anchor_index, "passed": False}
+        position = (head["chain_id"], head["sequence"])
+        entry = find_entry(position) if find_entry else _find_chain_entry(db, *position)
+        if entry is None:
+            return {"status": "FAILED", "reason": f"Chain {head['chain_id']} no longer contains sequence {head['sequence']} anchored by anchor {anchor_index} (truncated)", "anchor_index": anchor_index, "passed": False}
+        if calculate_entry_hash(entry) != head["head_hash"]:
+            entry_id = str(entry.get("_id"))
+            return {"status": "FAILED", "reason": f"Entry {entry_id} differs from the head anchored by anchor {anchor_index}", "entry_id": entry_id, "anchor_index": anchor_index, "passed": False}
+    return None
+
+
+# --- Merkle Block Signing ---
+# In "merkle" signing mode appends skip the private-key operation; a block of pending entries is
+# sealed by signing the Merkle root over their signature payloads once the block is full (or when
+# forced, e.g. by a periodic sealer so quiet periods don't leave entries unsigned for long).
+_pending_merkle_entries: Optional[int] = None
+
+def _note_pending_merkle_entries(count: int):
+    global _pending_merkle_entries
+    if _pending_merkle_entries is None:
+        db = get_mongo_db_connection()
+        _pending_merkle_entries = db["provenance_log"].count_documents({"signing_mode": "merkle", "block_index": None})
+    else:
+        _pending_merkle_entries += count
+    while _pending_merkle_entries is not None and _pending_merkle_entries >= MERKLE_BLOCK_SIZE:
+        if not seal_pending_merkle_block():
+            break
+
+def seal_pending_merkle_block(force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Seals the oldest pending Merkle-mode entries (up to MERKLE_BLOCK_SIZE) into a signed block.
+    Without force, only a full block is sealed. Returns the new block, or None if nothing was sealed.
+    """
+    global _pending_merkle_entries
+    db = get_mongo_db_connection()
+    provenance_collection = db["provenance_log"]
+    blocks_collection = db["provenance_blocks"]
+    blocks_collection.create_index("block_index", unique=True)
+    blocks_collection.create_index("entry_ids", name="entry_ids")
+
+    pending = list(provenance_collection.find({"signing_mode": "merkle", "block_index": None}).sort("_id", 1).limit(MERKLE_BLOCK_SIZE))
+    if pending and _mark_sealed_entries(db, pending):
+        # A previous seal stored its block but stopped before marking these entries; never seal them twice
+        pending = list(provenance_collection.find({"signing_mode": "merkle", "block_index": None}).sort("_id", 1).limit(MERKLE_BLOCK_SIZE))
+    if not pending or (len(pending) < MERKLE_BLOCK_SIZE and not force):
+        _pending_merkle_entries = len(pending)
+        return None
+
+    leaf_hashes = [merkle_leaf_hash(build_signature_payload(entry)) for entry in pending]
+    last_block = blocks_collection.find_one(sort=[("block_index", -1)])
+    block = {
+        "block_index": last_block["block_index"] + 1 if last_block else 0,
+        "leaf_count": len(leaf_hashes),
+        "root": merkle_root(leaf_hashes),
+        "leaf_hashes": leaf_hashes,
+        "entry_ids": [entry["_id"] for entry in pending],
+        "created_at": time.time()
+    }
+    block["key_id"] = get_signing_key_id()
+    block["signature"] = generate_signature(build_block_signature_payload(block))
+    # The block is stored before its entries are marked: the insert claims the block index. Should the
+    # marking below not happen, verification finds the entries through entry_ids and the next seal marks them.
+    try:
+        blocks_collection.insert_one(block)
+    except DuplicateKeyError:
+        # Another sealer claimed this block index concurrently; its block covers these entries.
+        print(f"ZTDIGS: Merkle block {block['block_index']} already sealed elsewhere, skipping.")
+        _pending_merkle_entries = None
+        return None
+
+    provenance_collection.bulk_write([
+        UpdateOne({"_id": entry["_id"], "block_index": None}, {"$set": {"block_index": block["block_index"], "leaf_index": i}})
+        for i, entry in enumerate(pending)
+    ])
+    _pending_merkle_entries = None # Recount lazily on next append
+    print(f"ZTDIGS: Sealed Merkle block {block['block_index']} over {block['leaf_count']} entries.")
+    block["id"] = str(block.pop("_id"))
+    return block
+
+def _mark_sealed_entries(db, pending: List[Dict[str, Any]]) -> int:
+    """Sets block_index/leaf_index on pending entries that a stored block already lists; returns how many."""
+    members = merkle_block_members({block["block_index"]: block for block in db["provenance_blocks"].find({"entry_ids": {"$in": [entry["_id"] for entry in pending]}})})
+    updates = [
+        UpdateOne({"_id": entry["_id"], "block_index": None}, {"$set": {"block_index": members[str(entry["_id"])][0], "leaf_index": members[str(entry["_id"])][1]}})
+        for entry in pending if str(entry["_id"]) in members
+    ]
+    if updates:
+        db["provenance_log"].bulk_write(updates)
+        print(f"ZTDIGS: Marked {len(updates)} entries of already sealed Merkle blocks.")
+    return len(updates)
+
+def get_provenance_inclusion_proof(entry_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns a Merkle inclusion proof for one provenance entry: the leaf hash, its sibling path and the
+    signed block root. Auditing a single event costs O(log n) hashes plus one signature check.
+    """
+    db = get_mongo_db_connection()
+    entry = db["provenance_log"].find_one({"_id": ObjectId(entry_id)})
+    if not entry:
+        return None
+    if entry.get("signing_mode") != "merkle":
+        raise ValueError(f"ZTDIGS: Entry {entry_id} is individually signed; no inclusion proof applies.")
+    if entry.get("block_index") is None:
+        listing_block = db["provenance_blocks"].find_one({"entry_ids": entry["_id"]}, {"block_index": 1, "entry_ids": 1})
+        if not listing_block:
+            raise ValueError(f"ZTDIGS: Entry {entry_id} has not been sealed into a Merkle block yet.")
+        entry["block_index"], entry["leaf_index"] = listing_block["block_index"], listing_block["entry_ids"].index(entry["_id"])
+
+    block = db["provenance_blocks"].find_one({"block_index": entry["block_index"]})
+    if not block:
+        raise RuntimeError(f"Merkle block {entry['block_index']} referenced by entry {entry_id} is missing.")
+
+    leaf_hash = merkle_leaf_hash(build_signature_payload(entry))
+    proof = merkle_inclusion_proof(build_merkle_tree(block["leaf_hashes"]), entry["leaf_index"])
+    verified = (
+        block["leaf_hashes"][entry["leaf_index"]] == leaf_hash
+        and verify_inclusion_proof(leaf_hash, proof, block["root"])
+        and verify_signature(build_block_signature_payload(block), block.get("signature", ""), block.get("key_id"))
+    )
+    return {
+        "entry_id": entry_id,
+        "block_index": block["block_index"],
+        "leaf_index": entry["leaf_index"],
+        "leaf_hash": leaf_hash,
+        "proof": proof,
+        "root": block["root"],
+        "leaf_count": block["leaf_count"],
+        "block_signature": block["signature"],
+        "key_id": block.get("key_id"),
+        "verified": verified
+    }
+
+
+# --- Cold Archive ---
+# Finished ranges of each chain are sealed into segment files (see services.ztdigs.segments) and removed
+# from provenance_log. provenance_segments catalogs the files (with their chains' boundary hashes and a
+# content hash); provenance_archive_watermarks records, per chain, the last archived sequence.
+# Readers merge segments and the hot collection in chain order, so callers see one continuous chain.
+_archive_lock = threading.Lock()
+_archive_indexes_ready = False
+_segment_readers: "OrderedDict[str, SegmentReader]" = OrderedDict()
+_segment_readers_lock = threading.Lock()
+SEGMENT_READER_CACHE_SIZE = 64
+
+def _ensure_archive_indexes(db):
+    global _archive_indexes_ready
+    if not _archive_indexes_ready:
+        db["provenance_segments"].create_index("segment_index", unique=True)
+        db["provenance_segments"].create_index("chains.chain_id")
+        db["provenance_segments"].create_index("ticket_ids")
+        db["provenance_archive_watermarks"].create_index("chain_id", unique=True)
+        _archive_indexes_ready = True
+
+def _chain_order_key(entry: Dict[str, Any]):
+    """Python equivalent of CHAIN_ORDER (entries without chain_id or sequence sort first, as in MongoDB)."""
+    sequence = entry.get("sequence")
+    return (entry.get("chain_id") is not None, entry.get("chain_id") or "", sequence if sequence is not None else -1, entry.get("timestamp") or 0)
+
+def _merge_chain_ordered(streams):
+    """Merges chain-ordered entry streams, dropping hot copies of entries that were already archived."""
+    last_position = None
+    for entry in heapq.merge(*streams, key=_chain_order_key):
+        position = (entry.get("chain_id"), entry.get("sequence"))
+        if position[1] is not None and position == last_position:
+            continue # Archived, but not yet removed from provenance_log (interrupted archive run)
+        last_position = position
+        yield entry
+
+def _open_segment(segment_doc: Dict[str, Any]) -> SegmentReader:
+    """Opens (memory-maps) a cataloged segment, checking it against its recorded content hash."""
+    return SegmentReader(os.path.join(ARCHIVE_DIR, segment_doc["file"]), segment_doc.get("content_sha256"))
+
+def _cached_segment_reader(segment_doc: Dict[str, Any]) -> SegmentReader:
+    """Returns a shared reader for small lookups (e.g. ticket history); segments are immutable, so readers never go stale."""
+    with _segment_readers_lock:
+        reader = _segment_readers.get(segment_doc["file"])
+        if reader is not None:
+            _segment_readers.move_to_end(segment_doc["file"])
+            return reader
+    reader = _open_segment(segment_doc)
+    with _segment_readers_lock:
+        _segment_readers[segment_doc["file"]] = reader
+        while len(_segment_readers) > SEGMENT_READER_CACHE_SIZE:
+            _segment_readers.popitem(last=False) # Evicted mmaps are closed once no longer referenced
+    return reader
+
+def iter_provenance_entries(chain_id: Optional[str] = None):
+    """
+    Yields provenance entries in chain order from the archive and provenance_log: every chain, or only
+    the given one. Raises ValueError if a segment fails its integrity check.
+    Entries archived while the iteration runs may be missed, so run verification and archiving apart.
+    """
+    db = get_mongo_db_connection()
+    segment_filter = {"chains.chain_id": chain_id} if chain_id else {}
+    readers = [_open_segment(segment_doc) for segment_doc in db["provenance_segments"].find(segment_filter).sort("segment_index", 1)]
+    try:
+        hot_entries = db["provenance_log"].find(chain_filter(chain_id) if chain_id else {}).sort(CHAIN_ORDER)
+        yield from _merge_chain_ordered([reader.iter_entries(chain_id) for reader in readers] + [hot_entries])
+    finally:
+        for reader in readers:
+            reader.close()
+
+def get_ticket_provenance_history(ticket_id: str) -> List[Dict[str, Any]]:
+    """Returns all provenance entries of one ticket in chain order, including archived ones."""
+    db = get_mongo_db_connection()
+    archived_entries = [
+        _cached_segment_reader(segment_doc).ticket_entries(ticket_id)
+        for segment_doc in db["provenance_segments"].find({"ticket_ids": ticket_id}).sort("segment_index", 1)
+    ]
+    hot_entries = db["provenance_log"].find({"ticket_id": ticket_id}).sort(CHAIN_ORDER)
+    history = []
+    for entry in _merge_chain_ordered(archived_entries + [hot_entries]):
+        entry["id"] = str(entry.pop("_id"))
+        history.append(entry)
+    return history
+
+def _archivable_range(entries: List[Dict[str, Any]], archived_through: int, head_sequence: int):
+    """Splits one chain's candidate entries into (entries to archive, stale ids already archived)."""
+    selected, stale_ids = [], []
+    expected = archived_through + 1
+    for entry in entries:
+        if entry["sequence"] <= archived_through:
+            stale_ids.append(entry["_id"])
+            continue
+        # Archive a contiguous, finished prefix only: stop at a gap (a younger entry), the head, or an unsealed entry
+        if entry["sequence"] != expected or entry["sequence"] >= head_sequence:
+            break
+        if entry.get("signing_mode") == "merkle" and entry.get("block_index") is None:
+            break
+        selected.append(entry)
+        expected += 1
+    return selected, stale_ids
+
+def _seal_archive_segment(db, groups: List[tuple]) -> Optional[Dict[str, Any]]:
+    """Writes the archivable part of the given (chain_id, entries) groups to a new segment and removes it from provenance_log."""
+    provenance_collection = db["provenance_log"]
+    segments_collection = db["provenance_segments"]
+    watermarks_collection = db["provenance_archive_watermarks"]
+
+    chain_ids = [chain_id for chain_id, _ in groups]
+    archived_through = {doc["chain_id"]: doc["archived_through"] for doc in watermarks_collection.find({"chain_id": {"$in": chain_ids}})}
+    head_sequences = {doc["_id"]: doc["head"] for doc in provenance_collection.aggregate([
+        {"$match": {"chain_id": {"$in": chain_ids}}},
+        {"$group": {"_id": "$chain_id", "head": {"$max": "$sequence"}}}
+    ])}
+    selected, stale_ids = [], []
+    for chain_id, entries in groups:
+        chain_selected, chain_stale_ids = _archivable_range(entries, archived_through.get(chain_id, 0), head_sequences.get(chain_id, 0))
+        selected.extend(chain_selected)
+        stale_ids.extend(chain_stale_ids)
+
+    segment_doc = None
+    if selected:
+        last_segment = segments_collection.find_one(sort=[("segment_index", -1)])
+        segment_index = last_segment["segment_index"] + 1 if last_segment else 0
+        file_name = f"segment-{segment_index:08d}-{uuid.uuid4().hex[:8]}.zseg" # Unique, so a losing concurrent writer cannot clobber the winner's file
+        path = os.path.join(ARCHIVE_DIR, file_name)
+        metadata = write_segment(path, selected, ARCHIVE_BLOCK_SIZE, calculate_entry_hash)
+        segment_doc = {
+            "segment_index": segment_index,
+            "file": file_name,
+            "entry_count": metadata["entry_count"],
+            "chains": [
+                {key: chain[key] for key in ("chain_id", "first_sequence", "last_sequence", "first_previous_hash", "last_entry_hash")}
+                for chain in metadata["chains"]
+            ],
+            "ticket_ids": metadata["ticket_ids"],
+            "content_sha256": metadata["content_sha256"],
+            "created_at": time.time()
+        }
+        try:
+            segments_collection.insert_one(segment_doc)
+        except DuplicateKeyError:
+            print(f"ZTDIGS: Archive segment {segment_index} already written elsewhere, discarding {file_name}.")
+            os.remove(path)
+            return None
+        watermarks_collection.bulk_write([
+            UpdateOne(
+                {"chain_id": chain["chain_id"]},
+                {"$set": {"archived_through": chain["last_sequence"], "last_entry_hash": chain["last_entry_hash"], "segment_index": segment_index}},
+                upsert=True
+            )
+            for chain in segment_doc["chains"]
+        ])
+        print(f"ZTDIGS: Archived {segment_doc['entry_count']} provenance entries from {len(segment_doc['chains'])} chains into {file_name}.")
+
+    # Only now remove the archived range from the hot collection (readers skip duplicates meanwhile)
+    removable_ids = [entry["_id"] for entry in selected] + stale_ids
+    for start in range(0, len(removable_ids), 1000):
+        provenance_collection.delete_many({"_id": {"$in": removable_ids[start:start + 1000]}})
+    if segment_doc:
+        segment_doc["id"] = str(segment_doc.pop("_id"))
+    return segment_doc
+
+def archive_provenance_entries() -> List[Dict[str, Any]]:
+    """Moves finished ranges of every chain into new archive segments. Returns the segments written."""
+    if not _archive_lock.acquire(blocking=False):
+        return [] # An archive run is already in progress in this process
+    try:
+        db = get_mongo_db_connection()
+        _ensure_archive_indexes(db)
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        cutoff = time.time() - max(ARCHIVE_MIN_AGE_SECONDS, DUPLICATE_CLAIM_WINDOW_SECONDS)
+        candidates = db["provenance_log"].find({"sequence": {"$exists": True}, "timestamp": {"$lt": cutoff}}).sort(CHAIN_ORDER)
+
+        created, groups, pending_count = [], [], 0
+        for chain_id, chain_entries in itertools.groupby(candidates, key=lambda entry: entry["chain_id"]):
+            # Long chains are split across segments; each piece continues from the chain's watermark
+            while True:
+                piece = list(itertools.islice(chain_entries, ARCHIVE_SEGMENT_SIZE - pending_count))
+                if not piece:
+                    break
+                groups.append((chain_id, piece))
+                pending_count += len(piece)
+                if pending_count >= ARCHIVE_SEGMENT_SIZE:
+                    segment_doc = _seal_archive_segment(db, groups)
+                    if segment_doc:
+                        created.append(segment_doc)
+                    groups, pending_count = [], 0
+        if groups:
+            segment_doc = _seal_archive_segment(db, groups)
+            if segment_doc:
+                created.append(segment_doc)
+        return created
+    finally:
+        _archive_lock.release()
+
+
+# --- Ticket Timelines ---
+# A ticket's events, in chain order, paged by keyset on (sequence, _id). Entries logged before chains
+# existed have no sequence and come first. Archived entries are read from the segments holding the ticket.
+TICKET_TIMELINE_MAX_LIMIT = 500
+
+def _timeline_key(entry: Dict[str, Any]):
+    sequence = entry.get("sequence")
+    return (sequence is not None, sequence if sequence is not None else 0, entry["_id"])
+
+def encode_timeline_cursor(entry: Dict[str, Any]) -> str:
+    sequence = entry.get("sequence")
+    return f"{sequence if sequence is not None else ''}:{entry['_id']}"
+
+def decode_timeline_cursor(cursor: str) -> tuple:
+    """Parses a cursor from encode_timeline_cursor into a timeline key. Raises ValueError if malformed."""
+    sequence, _, entry_id = cursor.partition(":")
+    if not ObjectId.is_valid(entry_id):
+        raise ValueError(f"ZTDIGS: Invalid timeline cursor '{cursor}'.")
+    return (sequence != "", int(sequence) if sequence else 0, ObjectId(entry_id))
+
+def _timeline_keyset_filter(after: tuple) -> Dict[str, Any]:
+    has_sequence, sequence, entry_id = after
+    if not has_sequence:
+        return {"$or": [{"sequence": None, "_id": {"$gt": entry_id}}, {"sequence": {"$ne": None}}]}
+    return {"$or": [{"sequence": {"$gt": sequence}}, {"sequence": sequence, "_id": {"$gt": entry_id}}]}
+
+def get_ticket_provenance_page(ticket_id: str, limit: int = 50, cursor: Optional[str] = None, event_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns one page of a ticket's provenance timeline: {"entries": [...], "next_cursor": str or None}.
+    Pass next_cursor back as cursor to continue; event_type optionally restricts the page to one event type.
+    """
+    if not 1 <= limit <= TICKET_TIMELINE_MAX_LIMIT:
+        raise ValueError(f"ZTDIGS: limit must be between 1 and {TICKET_TIMELINE_MAX_LIMIT}.")
+    after = decode_timeline_cursor(cursor) if cursor else None
+    db = get_mongo_db_connection()
+    provenance_collection = db["provenance_log"]
+    _ensure_chain_indexes(provenance_collection)
+
+    query_filter: Dict[str, Any] = {"ticket_id": ticket_id}
+    if event_type:
+        query_filter["event_type"] = event_type
+    if after:
+        query_filter = {"$and": [query_filter, _timeline_keyset_filter(after)]}
+    hot_entries = provenance_collection.find(query_filter).sort([("sequence", 1), ("_id", 1)]).limit(limit + 1)
+
+    def archived_entries():
+        segment_filter: Dict[str, Any] = {"ticket_ids": ticket_id}
+        if after and after[0]:
+            segment_filter["chains.last_sequence"] = {"$gt": after[1]} # Skip segments that end before the cursor
+        for segment_doc in db["provenance_segments"].find(segment_filter).sort("segment_index", 1):
+            for entry in _cached_segment_reader(segment_doc).ticket_entries(ticket_id):
+                if (after is None or _timeline_key(entry) > after) and (not event_type or entry["event_type"] == event_type):
+                    yield entry
+
+    entries, last_position = [], None
+    for entry in heapq.merge(archived_entries(), hot_entries, key=_timeline_key):
+        position = (entry.get("chain_id"), entry.get("sequence"))
+        if position[1] is not None and position == last_position:
+            continue # Archived, but not yet removed from provenance_log
+        last_position = position
+        entries.append(entry)
+        if len(entries) > limit:
+            break
+
+    next_cursor = encode_timeline_cursor(entries[limit - 1]) if len(entries) > limit else None
+    page = []
+    for entry in entries[:limit]:
+        entry["id"] = str(entry.pop("_id"))
+        page.append(entry)
+    return {"entries": page, "next_cursor": next_cursor}
+
+def _find_chain_entry(db, chain_id: str, sequence: int) -> Optional[Dict[str, Any]]:
+    """Finds one entry by chain position, in provenance_log or the archive."""
+    entry = db["provenance_log"].find_one({"chain_id": chain_id, "sequence": sequence})
+    if entry:
+        return entry
+    segment_doc = db["provenance_segments"].find_one({"chains": {"$elemMatch": {"chain_id": chain_id, "first_sequence": {"$lte": sequence}, "last_sequence": {"$gte": sequence}}}})
+    if segment_doc:
+        for archived_entry in _cached_segment_reader(segment_doc).iter_entries(chain_id):
+            if archived_entry["sequence"] == sequence:
+                return archived_entry
+    return None
+
+@traced("ztdigs.verify_ticket_provenance")
+def verify_ticket_provenance(ticket_id: str) -> Dict[str, Any]:
+    """
+    Verifies only one ticket's slice of its chain: each of the ticket's entries must carry a valid signature
+    and link (by hash and sequence) to its actual predecessor in the chain, whichever ticket that belongs to.
+    Costs O(events for the ticket). Proves every entry is authentic and in place; proving that none of the
+    ticket's entries were removed needs the whole chain (as in "ticket" chain mode, where the slice is the chain).
+    """
+    db = get_mongo_db_connection()
+    provenance_collection = db["provenance_log"]
+    try:
+        entries = get_ticket_provenance_history(ticket_id)
+    except ValueError as e: # Archive segment failed its integrity check
+        print(str(e))
+        return {"status": "FAILED", "reason": str(e), "passed": False}
+    if not entries:
+        return {"status": "No entries to verify.", "passed": True}
+
+    for entry in entries:
+        entry["_id"] = ObjectId(entry.pop("id"))
+    blocks = load_merkle_blocks(db, entries)
+    members = merkle_block_members(blocks)
+    verified_blocks = set()
+    previous_entry = None
+    for entry in entries:
+        entry_id = str(entry["_id"])
+        if not verify_entry_signature(entry, blocks, verified_blocks=verified_blocks, members=members):
+            print(f"ZTDIGS: Signature verification FAILED for entry {entry_id}")
+            return {"status": "FAILED", "reason": f"Signature mismatch for entry {entry_id}", "entry_id": entry_id, "passed": False}
+
+        # The chain predecessor: the previous slice entry when adjacent, otherwise looked up by position
+        sequence = entry.get("sequence")
+        if sequence is None or (sequence == 1 and entry.get("chain_id") == GLOBAL_CHAIN_ID):
+            # Pre-chain legacy entries (and the first global entry after them) link to the previous legacy entry
+            legacy_filter: Dict[str, Any] = {"chain_id": {"$exists": False}}
+            if sequence is None:
+                legacy_filter["timestamp"] = {"$lt": entry["timestamp"]}
+            predecessor = provenance_collection.find_one(legacy_filter, sort=[("timestamp", -1)])
+        elif sequence == 1:
+            predecessor = None
+        elif previous_entry is not None and previous_entry.get("chain_id") == entry.get("chain_id") and previous_entry.get("sequence") == sequence - 1:
+            predecessor = previous_entry
+        else:
+            predecessor = _find_chain_entry(db, entry["chain_id"], sequence - 1)
+            if predecessor is None:
+                return {"status": "FAILED", "reason": f"Missing chain predecessor (sequence {sequence - 1}) of entry {entry_id}", "entry_id": entry_id, "passed": False}
+
+        link_failure = check_chain_link(predecessor, entry)
+        if link_failure:
+            print(f"ZTDIGS: {link_failure['reason']}")
+            return link_failure
+        previous_entry = entry
+
+    return {"status": "PASSED", "message": f"All {len(entries)} provenance entries of ticket {ticket_id} verified successfully.", "passed": True, "entries_verified": len(entries)}
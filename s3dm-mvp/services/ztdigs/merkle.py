@@ -0,0 +1,55 @@
+# services/ztdigs/merkle.py
+from typing import List, Dict
+import hashlib
+
+# --- Merkle Tree Helpers ---
+# Leaves and interior nodes use distinct prefixes (as in RFC 6962) so a leaf can never be
+# passed off as an interior node. An odd node at the end of a level is promoted unchanged.
+
+def merkle_leaf_hash(data: str) -> str:
+    """Hashes a leaf value (e.g. a provenance signature payload)."""
+    return hashlib.sha256(b"\x00" + data.encode('utf-8')).hexdigest()
+
+def merkle_node_hash(left_hash: str, right_hash: str) -> str:
+    """Hashes two child nodes into their parent."""
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left_hash) + bytes.fromhex(right_hash)).hexdigest()
+
+def build_merkle_tree(leaf_hashes: List[str]) -> List[List[str]]:
+    """Builds all levels of the tree, from the leaves (level 0) up to the root level."""
+    if not leaf_hashes:
+        raise ValueError("Cannot build a Merkle tree without leaves.")
+    levels = [list(leaf_hashes)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parent_level = [merkle_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2 == 1:
+            parent_level.append(level[-1]) # Promote the odd node
+        levels.append(parent_level)
+    return levels
+
+def merkle_root(leaf_hashes: List[str]) -> str:
+    """Returns the root hash over the given leaves."""
+    return build_merkle_tree(leaf_hashes)[-1][0]
+
+def merkle_inclusion_proof(levels: List[List[str]], leaf_index: int) -> List[Dict[str, str]]:
+    """Returns the sibling path for a leaf as [{"hash": ..., "side": "left"|"right"}, ...], leaf to root."""
+    if not 0 <= leaf_index < len(levels[0]):
+        raise ValueError(f"Leaf index {leaf_index} out of range for a tree of {len(levels[0])} leaves.")
+    proof = []
+    index = leaf_index
+    for level in levels[:-1]:
+        sibling_index = index ^ 1
+        if sibling_index < len(level):
+            proof.append({"hash": level[sibling_index], "side": "left" if sibling_index < index else "right"})
+        index //= 2
+    return proof
+
+def verify_inclusion_proof(leaf_hash: str, proof: List[Dict[str, str]], root: str) -> bool:
+    """Recomputes the root from a leaf and its sibling path (O(log n) hashes)."""
+    current = leaf_hash
+    for step in proof:
+        if step["side"] == "left":
+            current = merkle_node_hash(step["hash"], current)
+        else:
+            current = merkle_node_hash(current, step["hash"])
+    return current == root
@@ -0,0 +1,165 @@
+# services/ztdigs/policy.py
+from typing import List, Optional, Dict, Any, Callable, Tuple
+from collections import OrderedDict
+import threading
+import time
+import os
+
+# --- Policy Configuration ---
+# Contracts are compiled once into a CompiledPolicy and cached by policy_hash (contracts are immutable,
+# so the hash identifies the policy). Violations of the allowed data elements and jurisdiction rules
+# are rejected in "strict" mode and only logged in "warn" mode (default). Expired contracts and
+# policy hash mismatches are always rejected.
+POLICY_MODE = os.getenv("ZTDIGS_POLICY_MODE", "warn").lower()
+if POLICY_MODE not in ("strict", "warn"):
+    raise ValueError(f"Unknown ZTDIGS_POLICY_MODE '{POLICY_MODE}'. Expected strict or warn.")
+POLICY_CACHE_SIZE = int(os.getenv("ZTDIGS_POLICY_CACHE_SIZE", "10000"))
+# Payload keys holding personal data, which only agents compliant with the contract's jurisdictions may receive
+PII_DATA_ELEMENTS = frozenset(k.strip() for k in os.getenv("ZTDIGS_PII_DATA_ELEMENTS", "customer_name,customer_address,customer_phone,customer_email,address").split(",") if k.strip())
+# How long an agent's GARS compliant_regions are reused before they are looked up again
+AGENT_REGIONS_TTL_SECONDS = float(os.getenv("ZTDIGS_AGENT_REGIONS_TTL_SECONDS", "60"))
+
+# Jurisdiction rule names used in contracts, and the GARS compliant_regions value each one requires
+JURISDICTION_REGIONS = {
+    "GDPR": "EU-GDPR",
+    "PDPB": "India-PDPB",
+    "DPDP": "India-PDPB",
+    "LGPD": "Brazil-LGPD",
+    "CCPA": "US-CCPA"
+}
+
+def resolve_jurisdiction_rule(rule: str) -> Optional[str]:
+    """Maps a contract jurisdiction rule (e.g. "GDPR", or a region such as "EU-GDPR") to a GARS region."""
+    rule = rule.strip()
+    if rule.upper() in JURISDICTION_REGIONS:
+        return JURISDICTION_REGIONS[rule.upper()]
+    if rule in JURISDICTION_REGIONS.values():
+        return rule
+    return None
+
+class CompiledPolicy:
+    """
+    A data contract compiled for enforcement: the allowed-key set, the GARS regions an agent must be
+    compliant with to receive personal data, and the enforcement mode. evaluate() checks an event in
+    one pass over its payload keys, whatever the number of rules in the contract.
+    """
+    __slots__ = ("contract_id", "policy_hash", "expiry_timestamp", "allowed_elements", "required_regions", "unresolved_rules", "strict")
+
+    def __init__(self, contract: Dict[str, Any], mode: str = POLICY_MODE):
+        self.contract_id = contract.get("id")
+        self.policy_hash = contract.get("policy_hash")
+        self.expiry_timestamp = contract.get("expiry_timestamp", 0)
+        self.allowed_elements = frozenset(contract.get("data_elements_allowed", []))
+        required_regions, unresolved_rules = set(), []
+        for rule in contract.get("jurisdiction_rules_applied", []):
+            region = resolve_jurisdiction_rule(rule)
+            if region:
+                required_regions.add(region)
+            else:
+                unresolved_rules.append(rule)
+        self.required_regions = frozenset(required_regions)
+        self.unresolved_rules = tuple(unresolved_rules)
+        self.strict = mode == "strict"
+
+    def evaluate(self, log_data: Dict[str, Any], agent_regions: Callable[[str], Optional[List[str]]], now: Optional[float] = None) -> List[str]:
+        """
+        Checks an event against the policy. Raises ValueError for an expired contract or a policy hash
+        mismatch, and for any other violation in strict mode. Returns the violations (warn mode).
+        """
+        event_type = log_data["event_type"]
+        if (now if now is not None else time.time()) > self.expiry_timestamp:
+            raise ValueError(f"ZTDIGS: Contract {self.contract_id} has expired for event {event_type}")
+        # Check policy hash (if provided by sender, ensures sender uses correct contract)
+        if log_data.get("policy_hash") and log_data["policy_hash"] != self.policy_hash:
+            raise ValueError(f"ZTDIGS: Policy hash mismatch for contract {self.contract_id}. Tampering detected or incorrect contract used.")
+
+        violations = []
+        disallowed, personal = [], False
+        allowed, check_allowed = self.allowed_elements, bool(self.allowed_elements) # An empty allowed set allows everything
+        for key in log_data.get("data_payload") or ():
+            if check_allowed and key not in allowed:
+                disallowed.append(key)
+            if key in PII_DATA_ELEMENTS:
+                personal = True
+        if disallowed:
+            violations.append(f"Data element(s) {disallowed} not allowed by contract {self.contract_id}.")
+        if personal and self.required_regions:
+            regions = agent_regions(log_data["agent_id"])
+            missing = sorted(self.required_regions.difference(regions or ()))
+            if regions is None:
+                violations.append(f"Personal data sent to agent {log_data['agent_id']}, which is not registered in GARS; contract {self.contract_id} requires {sorted(self.required_regions)}.")
+            elif missing:
+                violations.append(f"Personal data sent to agent {log_data['agent_id']}, which is not compliant with {missing} required by contract {self.contract_id}.")
+
+        if violations and self.strict:
+            raise ValueError(f"ZTDIGS: Event {event_type} violates its data contract: " + " ".join(violations))
+        for violation in violations:
+            print(f"ZTDIGS: Warning: {violation}")
+        return violations
+
+class PolicyCache:
+    """Thread-safe LRU cache of compiled policies keyed by policy_hash."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._policies: "OrderedDict[str, CompiledPolicy]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "compiles": 0}
+
+    def get(self, contract: Dict[str, Any]) -> CompiledPolicy:
+        """Returns the compiled policy for a contract, compiling it on first use."""
+        policy_hash = contract.get("policy_hash")
+        if not policy_hash:
+            return CompiledPolicy(contract) # Nothing identifies the policy; compile without caching
+        with self._lock:
+            policy = self._policies.get(policy_hash)
+            if policy is not None:
+                self._policies.move_to_end(policy_hash)
+                self._stats["hits"] += 1
+                return policy
+        policy = CompiledPolicy(contract)
+        if policy.unresolved_rules:
+            print(f"ZTDIGS: Warning: Contract {policy.contract_id} has jurisdiction rules without a known GARS region: {list(policy.unresolved_rules)}.")
+        with self._lock:
+            self._policies[policy_hash] = policy
+            self._stats["compiles"] += 1
+            while len(self._policies) > self.max_entries:
+                self._policies.popitem(last=False)
+        return policy
+
+    def clear(self):
+        with self._lock:
+            self._policies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, size=len(self._policies), max_size=self.max_entries)
+
+class AgentRegionCache:
+    """Short-lived cache of agents' GARS compliant_regions (None for unknown agents), filled by a lookup function."""
+
+    def __init__(self, lookup: Callable[[str], Optional[List[str]]], ttl_seconds: float):
+        self.lookup = lookup
+        self.ttl_seconds = ttl_seconds
+        self._regions: Dict[str, Tuple[Optional[frozenset], float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, agent_id: str) -> Optional[frozenset]:
+        now = time.time()
+        with self._lock:
+            item = self._regions.get(agent_id)
+        if item is not None and now < item[1]:
+            return item[0]
+        regions = self.lookup(agent_id)
+        regions = frozenset(regions) if regions is not None else None
+        with self._lock:
+            if len(self._regions) >= POLICY_CACHE_SIZE:
+                self._regions.clear()
+            self._regions[agent_id] = (regions, now + self.ttl_seconds)
+        return regions
+
+    def clear(self):
+        with self._lock:
+            self._regions.clear()
+
+policy_cache = PolicyCache(POLICY_CACHE_SIZE)
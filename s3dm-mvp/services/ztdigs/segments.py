@@ -0,0 +1,136 @@
+# services/ztdigs/segments.py
+from typing import List, Optional, Dict, Any, Callable, Iterator
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+import bson
+
+# --- Segment File Format ---
+# A segment is an immutable, compressed file holding a finished range of provenance entries, sorted in
+# chain order (chain_id, sequence). It may cover many chains (e.g. one short range per ticket chain).
+#
+#   header   MAGIC
+#   blocks   zlib(BSON entry + BSON entry + ...), up to block_size entries each
+#   index    zlib(BSON {"format", "entry_count", "blocks": [...], "chains": [...], "tickets": [...]})
+#   footer   index offset (u64), index length (u64), MAGIC
+#
+# The index lets readers jump to one chain's blocks or one ticket's entries without decompressing the
+# rest, and records each chain's boundary hashes (the previous_log_hash of its first archived entry and
+# the chaining hash of its last), so links between segments can be checked from indexes alone.
+# Entries are stored as BSON so every value (ObjectId, int vs float, ...) round-trips exactly and
+# chaining hashes recomputed from a segment match those computed from MongoDB.
+MAGIC = b"ZTDSEG01"
+FORMAT_VERSION = 1
+_FOOTER = struct.Struct(">QQ8s")
+
+def write_segment(path: str, entries: List[Dict[str, Any]], block_size: int, entry_hash: Callable[[Dict[str, Any]], str]) -> Dict[str, Any]:
+    """
+    Writes entries (already in chain order) to a new segment file at path and returns its metadata:
+    entry_count, chains (with boundary hashes), ticket_ids and the content_sha256 of the file.
+    The file is written to a temporary name, fsynced and renamed, then made read-only.
+    """
+    if not entries:
+        raise ValueError("Cannot write an empty segment.")
+    blocks, chains, tickets = [], [], {}
+    content_hash = hashlib.sha256(MAGIC)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+        for block_number, start in enumerate(range(0, len(entries), block_size)):
+            block_entries = entries[start:start + block_size]
+            data = zlib.compress(b"".join(bson.encode(entry) for entry in block_entries), 6)
+            f.write(data)
+            content_hash.update(data)
+            blocks.append({"offset": offset, "length": len(data), "count": len(block_entries)})
+            offset += len(data)
+            for position, entry in enumerate(block_entries):
+                tickets.setdefault(entry["ticket_id"], []).append([block_number, position])
+                if not chains or chains[-1]["chain_id"] != entry["chain_id"]:
+                    chains.append({
+                        "chain_id": entry["chain_id"],
+                        "first_sequence": entry["sequence"],
+                        "first_block": block_number,
+                        "first_previous_hash": entry.get("previous_log_hash")
+                    })
+                chains[-1].update({"last_sequence": entry["sequence"], "last_block": block_number, "last_entry": entry})
+
+        for chain in chains:
+            chain["last_entry_hash"] = entry_hash(chain.pop("last_entry"))
+        index = {
+            "format": FORMAT_VERSION,
+            "entry_count": len(entries),
+            "blocks": blocks,
+            "chains": chains,
+            "tickets": [{"ticket_id": ticket_id, "positions": positions} for ticket_id, positions in tickets.items()]
+        }
+        index_data = zlib.compress(bson.encode(index), 6)
+        footer = _FOOTER.pack(offset, len(index_data), MAGIC)
+        f.write(index_data)
+        f.write(footer)
+        content_hash.update(index_data)
+        content_hash.update(footer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    os.chmod(path, 0o444)
+    return {
+        "entry_count": len(entries),
+        "chains": chains,
+        "ticket_ids": list(tickets),
+        "content_sha256": content_hash.hexdigest()
+    }
+
+class SegmentReader:
+    """Read-only, memory-mapped view of a segment file. Blocks are decompressed on demand."""
+
+    def __init__(self, path: str, expected_sha256: Optional[str] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC or self._mmap[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"ZTDIGS: {path} is not a provenance segment file.")
+        if expected_sha256 and hashlib.sha256(self._mmap).hexdigest() != expected_sha256:
+            self.close()
+            raise ValueError(f"ZTDIGS: Archive segment {os.path.basename(path)} does not match its recorded content hash. Tampering detected.")
+        index_offset, index_length, _ = _FOOTER.unpack(self._mmap[-_FOOTER.size:])
+        self.index = bson.decode(zlib.decompress(self._mmap[index_offset:index_offset + index_length]))
+        self._chains = {chain["chain_id"]: chain for chain in self.index["chains"]}
+        self._tickets = {ticket["ticket_id"]: ticket["positions"] for ticket in self.index["tickets"]}
+
+    def close(self):
+        self._mmap.close()
+
+    def read_block(self, block_number: int) -> List[Dict[str, Any]]:
+        block = self.index["blocks"][block_number]
+        return bson.decode_all(zlib.decompress(self._mmap[block["offset"]:block["offset"] + block["length"]]))
+
+    def chain_range(self, chain_id: str) -> Optional[Dict[str, Any]]:
+        """Index entry (sequence range, blocks, boundary hashes) for one chain, or None if not in this segment."""
+        return self._chains.get(chain_id)
+
+    def iter_entries(self, chain_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yields all entries in chain order, or only those of one chain."""
+        if chain_id is None:
+            for block_number in range(len(self.index["blocks"])):
+                yield from self.read_block(block_number)
+            return
+        chain = self._chains.get(chain_id)
+        if chain is None:
+            return
+        for block_number in range(chain["first_block"], chain["last_block"] + 1):
+            for entry in self.read_block(block_number):
+                if entry["chain_id"] == chain_id:
+                    yield entry
+
+    def ticket_entries(self, ticket_id: str) -> List[Dict[str, Any]]:
+        """Returns one ticket's entries (in chain order), decompressing only the blocks that hold them."""
+        entries, block_cache = [], {}
+        for block_number, position in self._tickets.get(ticket_id, []):
+            if block_number not in block_cache:
+                block_cache[block_number] = self.read_block(block_number)
+            entries.append(block_cache[block_number][position])
+        return entries
@@ -0,0 +1,181 @@
+# services/ztdigs/signers.py
+from typing import Optional, Dict
+from abc import ABC, abstractmethod
+import os
+import glob
+import time
+import hashlib
+import threading
+from Crypto.PublicKey import RSA, ECC # From pycryptodome
+from Crypto.Signature import pkcs1_15, eddsa
+from Crypto.Hash import SHA256
+from services.cluster import CLUSTER_MODE
+
+# --- Signer Configuration ---
+# ZTDIGS_SIGNER: algorithm used when a new signing key has to be generated ("rsa" or "ed25519").
+# ZTDIGS_PRIVATE_KEY_PATH: PEM file holding the active signing key. Created on first use if missing,
+#   so signatures stay verifiable across restarts (and across workers sharing the file).
+#   In multi-worker mode (S3DM_CLUSTER_MODE=multi) it defaults to CLUSTER_KEY_PATH, as per-worker ephemeral
+#   keys would make one worker's signatures fail verification in the others.
+# ZTDIGS_PUBLIC_KEYS_DIR: optional directory of additional PEM keys (e.g. retired keys) used for verification only.
+SIGNER_ALGORITHM = os.getenv("ZTDIGS_SIGNER", "rsa").lower()
+CLUSTER_KEY_PATH = "ztdigs_signing_key.pem" # Relative to the working directory all workers share
+PRIVATE_KEY_PATH = os.getenv("ZTDIGS_PRIVATE_KEY_PATH") or (CLUSTER_KEY_PATH if CLUSTER_MODE == "multi" else None)
+PUBLIC_KEYS_DIR = os.getenv("ZTDIGS_PUBLIC_KEYS_DIR")
+
+# --- Signer Backends ---
+class Signer(ABC):
+    """Signs and verifies provenance data strings with one key. Verify-only when no private key is held."""
+    algorithm = None
+
+    def __init__(self, key):
+        self._key = key
+        self.can_sign = key.has_private()
+        self.key_id = hashlib.sha256(self._public_key().export_key(format='DER')).hexdigest()[:16]
+
+    def _public_key(self):
+        return self._key.public_key()
+
+    def public_key_pem(self) -> str:
+        return self._public_key().export_key(format='PEM')
+
+    def private_key_pem(self) -> str:
+        return self._key.export_key(format='PEM')
+
+    @abstractmethod
+    def sign(self, data: str) -> str:
+        """Returns the hex signature of data."""
+
+    @abstractmethod
+    def verify(self, data: str, signature_hex: str) -> bool:
+        """True if signature_hex is a valid signature of data by this key; never raises for a bad signature."""
+
+class RSASigner(Signer):
+    """RSA-2048 PKCS#1 v1.5 over SHA-256."""
+    algorithm = "rsa"
+
+    @classmethod
+    def generate(cls) -> "RSASigner":
+        return cls(RSA.generate(2048))
+
+    def _public_key(self):
+        return self._key.publickey()
+
+    def public_key_pem(self) -> str:
+        return self._public_key().export_key().decode('utf-8')
+
+    def private_key_pem(self) -> str:
+        return self._key.export_key().decode('utf-8')
+
+    def sign(self, data: str) -> str:
+        return pkcs1_15.new(self._key).sign(SHA256.new(data.encode('utf-8'))).hex()
+
+    def verify(self, data: str, signature_hex: str) -> bool:
+        try:
+            pkcs1_15.new(self._public_key()).verify(SHA256.new(data.encode('utf-8')), bytes.fromhex(signature_hex))
+            return True
+        except (ValueError, TypeError):
+            return False
+
+class Ed25519Signer(Signer):
+    """Ed25519 (RFC 8032); much cheaper to sign and verify than RSA-2048."""
+    algorithm = "ed25519"
+
+    @classmethod
+    def generate(cls) -> "Ed25519Signer":
+        return cls(ECC.generate(curve='ed25519'))
+
+    def sign(self, data: str) -> str:
+        return eddsa.new(self._key, 'rfc8032').sign(data.encode('utf-8')).hex()
+
+    def verify(self, data: str, signature_hex: str) -> bool:
+        try:
+            eddsa.new(self._public_key(), 'rfc8032').verify(data.encode('utf-8'), bytes.fromhex(signature_hex))
+            return True
+        except (ValueError, TypeError):
+            return False
+
+SIGNER_BACKENDS = {"rsa": RSASigner, "ed25519": Ed25519Signer}
+
+def signer_from_pem(pem: str) -> Signer:
+    """Loads an RSA or Ed25519 key (private or public) from PEM text."""
+    try:
+        return RSASigner(RSA.import_key(pem))
+    except (ValueError, IndexError, TypeError):
+        pass
+    key = ECC.import_key(pem)
+    if key.curve.lower() != "ed25519":
+        raise ValueError(f"Unsupported key curve '{key.curve}'. Only RSA and Ed25519 keys are supported.")
+    return Ed25519Signer(key)
+
+# --- Key Registry ---
+# The active signer is created lazily on first use, so importing ZTDIGS costs no key generation.
+_active_signer: Optional[Signer] = None
+_verification_signers: Dict[str, Signer] = {}
+_default_key_id: Optional[str] = None # Set in verify-only processes; entries without a key id use it
+_registry_lock = threading.Lock()
+
+def _load_or_create_private_key(path: str) -> Signer:
+    """Loads the signing key from path, creating it (exclusively, so concurrent workers agree) if missing."""
+    backend = SIGNER_BACKENDS.get(SIGNER_ALGORITHM)
+    if backend is None:
+        raise ValueError(f"Unknown ZTDIGS_SIGNER '{SIGNER_ALGORITHM}'. Expected one of: {', '.join(SIGNER_BACKENDS)}.")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process may still be writing the key it just created; wait briefly for content.
+        for _ in range(50):
+            with open(path) as f:
+                pem = f.read()
+            if "-----END" in pem:
+                print(f"ZTDIGS Signers: Loaded signing key from {path}.")
+                return signer_from_pem(pem)
+            time.sleep(0.1)
+        raise RuntimeError(f"Signing key file {path} is empty or incomplete.")
+    signer = backend.generate()
+    with os.fdopen(fd, "w") as f:
+        f.write(signer.private_key_pem())
+    print(f"ZTDIGS Signers: Generated new {signer.algorithm} signing key at {path} (key id {signer.key_id}).")
+    return signer
+
+def get_active_signer() -> Signer:
+    """Returns the signer for new signatures, loading or generating its key on first use."""
+    global _active_signer
+    if _active_signer is None:
+        with _registry_lock:
+            if _active_signer is None:
+                if PRIVATE_KEY_PATH:
+                    signer = _load_or_create_private_key(PRIVATE_KEY_PATH)
+                else:
+                    # DO NOT USE IN PRODUCTION: an ephemeral key makes signatures unverifiable after a restart.
+                    signer = SIGNER_BACKENDS.get(SIGNER_ALGORITHM, RSASigner).generate()
+                    print(f"ZTDIGS Signers: Warning: ZTDIGS_PRIVATE_KEY_PATH not set; generated ephemeral {signer.algorithm} key {signer.key_id}.")
+                if not signer.can_sign:
+                    raise ValueError(f"Signing key {signer.key_id} has no private part.")
+                _verification_signers[signer.key_id] = signer
+                if PUBLIC_KEYS_DIR:
+                    for pem_path in sorted(glob.glob(os.path.join(PUBLIC_KEYS_DIR, "*.pem"))):
+                        with open(pem_path) as f:
+                            extra = signer_from_pem(f.read())
+                        _verification_signers.setdefault(extra.key_id, extra)
+                _active_signer = signer
+    return _active_signer
+
+def get_verification_signer(key_id: Optional[str] = None) -> Optional[Signer]:
+    """Returns the signer for a key id (the default key when key_id is None), or None if unknown."""
+    if _active_signer is None and _default_key_id is None:
+        get_active_signer()
+    return _verification_signers.get(key_id or _default_key_id or _active_signer.key_id)
+
+def export_verification_keys() -> Dict[str, str]:
+    """Returns {key_id: public key PEM} for every known key, e.g. to seed verifier worker processes."""
+    get_active_signer()
+    return {key_id: signer.public_key_pem() for key_id, signer in _verification_signers.items()}
+
+def load_verification_keys(public_keys: Dict[str, str], default_key_id: str):
+    """Registers verify-only keys (as produced by export_verification_keys) in a process that never signs."""
+    global _default_key_id
+    for pem in public_keys.values():
+        signer = signer_from_pem(pem)
+        _verification_signers[signer.key_id] = signer
+    _default_key_id = default_key_id
@@ -1,13 +1,26 @@
 # services/ztdigs/test_ztdigs.py
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
 import time
-from core import (
+import tempfile
+from services.ztdigs.core import (
     get_mongo_db_connection, close_mongo_db_connection,
     generate_and_store_contract, get_data_contract,
-    log_provenance_event, verify_provenance_chain,
+    log_provenance_event, log_provenance_events_batch, verify_provenance_chain,
     check_duplicate_claim, create_data_contract_doc, create_provenance_log_entry_data,
-    calculate_data_hash # For testing
+    calculate_data_hash, # For testing
+    chain_id_for_ticket
 )
-from pymongo.errors import ConnectionFailure
+import services.ztdigs.core as ztdigs_core
+from services.ztdigs.verify_jobs import verify_provenance_chain_parallel
+from services.ztdigs.canonical import canonical_sha256, cbor2
+from services.ztdigs.policy import CompiledPolicy, policy_cache
+from services.ztdigs.signers import RSASigner, Ed25519Signer, signer_from_pem
+from services.ztdigs.claim_window import ClaimWindow
+from services.cluster.invalidation import InvalidationBus, LocalTransport
+from pymongo.errors import ConnectionFailure, BulkWriteError
+from bson import ObjectId
 
 def run_ztdigs_tests():
     print("--- Running ZTDIGS Core Tests ---")
@@ -15,9 +28,35 @@ def run_ztdigs_tests():
         db = get_mongo_db_connection()
         # Clean collections for a fresh test run (optional, for repeatable tests)
         db["data_contracts"].delete_many({})
+        db["data_contracts_expired"].delete_many({})
         db["provenance_log"].delete_many({})
+        db["provenance_segments"].delete_many({})
+        db["provenance_archive_watermarks"].delete_many({})
         print("ZTDIGS: Cleared old test data.")
 
+        # --- Test Signer Backends ---
+        print("\n--- Testing Signer Backends ---")
+        for backend in (RSASigner, Ed25519Signer):
+            signer = backend.generate()
+            signature = signer.sign("TKT001-AGT001-task_dispatched")
+            verifier = signer_from_pem(signer.public_key_pem()) # Verify-only copy, as loaded from a PEM file
+            assert verifier.key_id == signer.key_id, f"{signer.algorithm}: key id changed after PEM round trip!"
+            assert verifier.verify("TKT001-AGT001-task_dispatched", signature), f"{signer.algorithm}: valid signature rejected!"
+            assert not verifier.verify("TKT001-AGT001-task_completed", signature), f"{signer.algorithm}: tampered data accepted!"
+            print(f"Signer {signer.algorithm}: key id {signer.key_id}, sign/verify OK")
+        assert not ztdigs_core.verify_signature("TKT001-AGT001-task_dispatched", "DUMMY_SIGNATURE_PLACEHOLDER"), "Placeholder signature accepted!"
+
+        # --- Test Canonical Hashing ---
+        print("\n--- Testing Canonical Hashing ---")
+        object_id = ObjectId()
+        assert canonical_sha256({"ref": object_id}) != canonical_sha256({"ref": str(object_id)}), "ObjectId and its string hash alike!"
+        assert len({canonical_sha256(value) for value in ("1", 1, 1.0, True)}) == 4, "Differently typed values hash alike!"
+        assert canonical_sha256({"b": [1, 2.5], "a": None}) == canonical_sha256({"a": None, "b": (1, 2.5)}), "Canonical hash depends on key order!"
+        if cbor2 is not None:
+            sample = {"ref": object_id, "readings": [0.1, 1e300, -0.0, 2 ** 70], "note": "naïve", "raw": b"\x00"}
+            assert canonical_sha256(sample, "python") == canonical_sha256(sample, "cbor2"), "Canonical backends disagree!"
+        print("Canonical hashing OK")
+
         # --- Test Data Contract Management ---
         ticket_id_1 = "TKT001"
         agent_id_1 = "AGT001_RepairCo"
@@ -49,6 +88,43 @@ def run_ztdigs_tests():
         retrieved_contract = get_data_contract(contract_1['id'])
         print(f"Retrieved Contract 1: {retrieved_contract is not None}, ID={retrieved_contract['id'] if retrieved_contract else 'N/A'}")
 
+        # --- Test Contract Expiry Sweep ---
+        print("\n--- Testing Contract Expiry Sweep ---")
+        expired_contract = generate_and_store_contract(create_data_contract_doc(
+            "TKT-EXPIRED", [{"agent_id": agent_id_1, "role": "technician"}], ["device_id"], "for_diagnostics", time.time() - 1, []
+        ))
+        unswept_contract = get_data_contract(expired_contract['id']) # Cached as a tombstone, still in data_contracts
+        assert unswept_contract is not None and "archived_at" not in unswept_contract, "Expired contract awaiting the sweep is not served!"
+        sweep_result = ztdigs_core.sweep_expired_contracts()
+        print(f"Sweep Result: {sweep_result}")
+        assert db["data_contracts_expired"].find_one({"_id": ObjectId(expired_contract['id'])}), "Expired contract was not archived!"
+        archived_contract = get_data_contract(expired_contract['id'])
+        assert archived_contract is not None and archived_contract["id"] == expired_contract['id'], "Swept contract is no longer served!"
+        assert "archived_at" in archived_contract, "Swept contract was not read from the expired collection!"
+        assert get_data_contract(contract_1['id']) is not None, "Sweeper removed a live contract!"
+        try:
+            log_provenance_event(create_provenance_log_entry_data("TKT-EXPIRED", agent_id_1, "diagnostic_note", "Late note.", {"device_id": "DEV001"}, expired_contract['id']))
+            assert False, "Event under an expired contract was accepted!"
+        except ValueError as e:
+            print(f"Rejected as expected: {e}")
+
+        # --- Test Compiled Contract Policies ---
+        print("\n--- Testing Compiled Contract Policies ---")
+        gdpr_contract = dict(contract_1, jurisdiction_rules_applied=["GDPR"], data_elements_allowed=["device_id", "customer_name"])
+        strict_policy = CompiledPolicy(gdpr_contract, mode="strict")
+        assert strict_policy.required_regions == {"EU-GDPR"}, "GDPR rule not resolved to its GARS region!"
+        agent_regions = {"AGT_EU": ["EU-GDPR"], "AGT_IN": ["India-PDPB"]}.get
+        pii_event = {"ticket_id": ticket_id_1, "event_type": "data_shared", "data_payload": {"customer_name": "Jane Doe"}}
+        assert strict_policy.evaluate(dict(pii_event, agent_id="AGT_EU"), agent_regions) == [], "Compliant agent rejected!"
+        for agent_id, payload in (("AGT_IN", {"customer_name": "Jane Doe"}), ("AGT_EU", {"error_code": "E-42"})):
+            try:
+                strict_policy.evaluate(dict(pii_event, agent_id=agent_id, data_payload=payload), agent_regions)
+                assert False, f"Strict policy accepted a violating event ({agent_id}, {list(payload)})!"
+            except ValueError as e:
+                print(f"Rejected as expected: {e}")
+        assert len(CompiledPolicy(gdpr_contract, mode="warn").evaluate(dict(pii_event, agent_id="AGT_IN"), agent_regions)) == 1, "Warn mode did not report the violation!"
+        assert policy_cache.get(contract_1) is policy_cache.get(dict(contract_1)), "Compiled policies are not cached by policy_hash!"
+
         # --- Test Provenance Logging ---
         print("\n--- Testing Provenance Logging ---")
         # Log event 1
@@ -101,6 +177,36 @@ def run_ztdigs_tests():
         print(f"Logged Event 4 (with potential warning): ID={logged_event_4['id']}")
 
 
+        # --- Test Bulk Provenance Logging ---
+        print("\n--- Testing Bulk Provenance Logging ---")
+        batch_results = log_provenance_events_batch([
+            create_provenance_log_entry_data(ticket_id_1, agent_id_1, "diagnostic_note", "Batch note 1.", {"device_id": "DEV001"}, contract_1['id']),
+            create_provenance_log_entry_data(ticket_id_1, agent_id_1, "diagnostic_note", "Batch note 2.", {"device_id": "DEV001"}, "000000000000000000000000"), # Unknown contract
+            create_provenance_log_entry_data(ticket_id_1, agent_id_1, "diagnostic_note", "Batch note 3.", {"error_code": "E-42"}, contract_1['id'])
+        ])
+        print(f"Batch Results: {[result['status'] for result in batch_results]}")
+        assert [result['status'] for result in batch_results] == ["logged", "rejected", "logged"], "Batch results are wrong or out of order!"
+        assert batch_results[2]['entry']['sequence'] == batch_results[0]['entry']['sequence'] + 1, "Batch entries were not chained in order!"
+
+        # Write errors part way through a batch: a chain conflict is retried per event, anything else fails the rest
+        collection_class = type(db["provenance_log"])
+        original_insert_many = collection_class.insert_many
+        for error_code, expected_statuses in ((ztdigs_core.DUPLICATE_KEY_ERROR_CODE, ["logged"] * 3), (50, ["logged", "failed", "failed"])):
+            def partially_failing_insert_many(self, documents, ordered=True, **kwargs):
+                documents = list(documents)
+                self.insert_one(documents[0])
+                raise BulkWriteError({"nInserted": 1, "writeErrors": [{"index": 1, "code": error_code, "errmsg": "simulated write error"}]})
+            collection_class.insert_many = partially_failing_insert_many
+            try:
+                partial_results = log_provenance_events_batch([
+                    create_provenance_log_entry_data(ticket_id_1, agent_id_1, "diagnostic_note", f"Partial batch note {i}.", {"device_id": "DEV001"}, contract_1['id'])
+                    for i in range(3)
+                ])
+            finally:
+                collection_class.insert_many = original_insert_many
+            print(f"Batch with write error {error_code}: {[result['status'] for result in partial_results]}")
+            assert [result['status'] for result in partial_results] == expected_statuses, f"Wrong batch results after write error {error_code}!"
+
         # --- Test Provenance Verification ---
         print("\n--- Testing Provenance Chain Verification ---")
         verification_result = verify_provenance_chain()
@@ -108,6 +214,99 @@ def run_ztdigs_tests():
         if not verification_result['passed']:
             print(f"Reason: {verification_result.get('reason')}")
 
+        ticket_verification_result = verify_provenance_chain(chain_id_for_ticket(ticket_id_1)) # Only this ticket's chain
+        print(f"Ticket-Scoped Verification Result ({chain_id_for_ticket(ticket_id_1)}): {ticket_verification_result['status']}")
+        assert ticket_verification_result['passed'], "Ticket-scoped chain verification failed!"
+
+        print("\n--- Testing Parallel Provenance Chain Verification ---")
+        parallel_result = verify_provenance_chain_parallel(workers=2, chunk_size=2) # Small ranges to exercise boundary links
+        print(f"Parallel Verification Result: {parallel_result['status']}")
+        assert parallel_result['passed'] == verification_result['passed'], "Parallel and serial verification disagree!"
+
+        # --- Test Merkle Block Signing ---
+        print("\n--- Testing Merkle Block Signing ---")
+        merkle_settings = (ztdigs_core.SIGNING_MODE, ztdigs_core.MERKLE_UNSEALED_GRACE_SECONDS)
+        ztdigs_core.SIGNING_MODE = "merkle"
+        try:
+            merkle_entries = [
+                log_provenance_event(create_provenance_log_entry_data("TKT-MERKLE", agent_id_1, "diagnostic_note", f"Merkle note {i}.", {"device_id": "DEV001"}, contract_1['id']))
+                for i in range(3)
+            ]
+            assert verify_provenance_chain().get('unsealed_entries') == 3, "Recent unsealed entries not reported!"
+            ztdigs_core.MERKLE_UNSEALED_GRACE_SECONDS = 0
+            assert not verify_provenance_chain()['passed'], "Entries left unsealed past the grace period verified!"
+            ztdigs_core.MERKLE_UNSEALED_GRACE_SECONDS = merkle_settings[1]
+
+            block = ztdigs_core.seal_pending_merkle_block(force=True)
+            assert block and block['leaf_count'] == 3, "Pending entries were not sealed into one block!"
+            assert verify_provenance_chain()['passed'], "Sealed Merkle entries failed verification!"
+            assert ztdigs_core.get_provenance_inclusion_proof(merkle_entries[1]['id'])['verified'], "Inclusion proof did not verify!"
+
+            # Tampering with a sealed entry (the chain head, so no later link covers it)
+            provenance_collection = db["provenance_log"]
+            sealed_head = provenance_collection.find_one({"_id": ObjectId(merkle_entries[-1]['id'])})
+            tampered_entries = (
+                {"agent_id": "AGT_FORGED"}, # Content no longer matches its leaf
+                {"agent_id": "AGT_FORGED", "block_index": None, "leaf_index": None}, # ...with its block reference cleared
+                {"leaf_index": 0} # Pointing at another entry's leaf
+            )
+            for changes in tampered_entries:
+                provenance_collection.update_one({"_id": sealed_head["_id"]}, {"$set": changes})
+                assert not verify_provenance_chain()['passed'], f"Tampered sealed entry verified ({sorted(changes)})!"
+                provenance_collection.replace_one({"_id": sealed_head["_id"]}, sealed_head)
+
+            # A seal interrupted after storing its block: the entries are still found through the block, then marked
+            provenance_collection.update_one({"_id": sealed_head["_id"]}, {"$set": {"block_index": None, "leaf_index": None}})
+            assert verify_provenance_chain()['passed'], "Entry of a stored block rejected before it was marked!"
+            assert ztdigs_core.seal_pending_merkle_block(force=True) is None, "Entry of a stored block was sealed twice!"
+            assert provenance_collection.find_one({"_id": sealed_head["_id"]})['block_index'] == block['block_index'], "Interrupted seal was not repaired!"
+            print(f"Merkle block {block['block_index']}: sealing, tamper detection and seal repair OK")
+        finally:
+            ztdigs_core.SIGNING_MODE, ztdigs_core.MERKLE_UNSEALED_GRACE_SECONDS = merkle_settings
+
+        # --- Test Chain Anchors ---
+        print("\n--- Testing Chain Anchors ---")
+        log_provenance_event(create_provenance_log_entry_data(ticket_id_1, agent_id_1, "diagnostic_note", "Anchored note.", {"device_id": "DEV001"}, contract_1['id']))
+        anchor = ztdigs_core.anchor_chain_heads()
+        assert anchor and verify_provenance_chain()['passed'], "Chain failed verification after anchoring!"
+        anchored_head = ztdigs_core.get_chain_head(chain_id_for_ticket(ticket_id_1))
+        db["provenance_log"].delete_one({"_id": anchored_head["_id"]}) # Truncate the chain's tail
+        try:
+            truncated_result = verify_provenance_chain()
+            print(f"Truncated chain: {truncated_result.get('reason')}")
+            assert not truncated_result['passed'], "Truncated chain tail went undetected!"
+        finally:
+            db["provenance_log"].insert_one(anchored_head)
+        assert verify_provenance_chain()['passed'], "Restored chain failed verification!"
+
+        # --- Test Cold Archive ---
+        print("\n--- Testing Cold Archive ---")
+        entries_before = [str(entry["_id"]) for entry in ztdigs_core.iter_provenance_entries()]
+        archive_settings = (ztdigs_core.ARCHIVE_DIR, ztdigs_core.ARCHIVE_MIN_AGE_SECONDS, ztdigs_core.DUPLICATE_CLAIM_WINDOW_SECONDS)
+        ztdigs_core.ARCHIVE_DIR, ztdigs_core.ARCHIVE_MIN_AGE_SECONDS, ztdigs_core.DUPLICATE_CLAIM_WINDOW_SECONDS = tempfile.mkdtemp(), 0, 0 # Archive everything but chain heads
+        try:
+            segments = ztdigs_core.archive_provenance_entries()
+            print(f"Archived {sum(segment['entry_count'] for segment in segments)} entries into {len(segments)} segments")
+            assert [str(entry["_id"]) for entry in ztdigs_core.iter_provenance_entries()] == entries_before, "Archived chain does not read back unchanged!"
+            assert len(ztdigs_core.get_ticket_provenance_history(ticket_id_1)) == sum(1 for entry in ztdigs_core.iter_provenance_entries() if entry["ticket_id"] == ticket_id_1), "Ticket history misses archived entries!"
+            assert verify_provenance_chain()['passed'] == verification_result['passed'], "Verification result changed after archiving!"
+        finally:
+            ztdigs_core.ARCHIVE_DIR, ztdigs_core.ARCHIVE_MIN_AGE_SECONDS, ztdigs_core.DUPLICATE_CLAIM_WINDOW_SECONDS = archive_settings
+
+        # --- Test Ticket Timeline ---
+        print("\n--- Testing Ticket Timeline ---")
+        timeline_ids, cursor = [], None
+        while True:
+            page = ztdigs_core.get_ticket_provenance_page(ticket_id_1, limit=2, cursor=cursor)
+            timeline_ids.extend(entry["id"] for entry in page["entries"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert timeline_ids == [entry["id"] for entry in ztdigs_core.get_ticket_provenance_history(ticket_id_1)], "Paged timeline differs from the ticket history!"
+        ticket_slice_result = ztdigs_core.verify_ticket_provenance(ticket_id_1)
+        print(f"Timeline: {len(timeline_ids)} entries; slice verification: {ticket_slice_result['status']}")
+        assert ticket_slice_result['passed'], "Ticket slice verification failed!"
+
         # --- Test Anti-Fraud: Duplicate Claim ---
         print("\n--- Testing Anti-Fraud: Duplicate Claim Detection ---")
         # Log a second invoice event for the same ticket
@@ -139,6 +338,40 @@ def run_ztdigs_tests():
         print(f"Duplicate Claim Check for TKT001: {duplicate_check['message']} (Count: {duplicate_check['count']})")
         assert duplicate_check['is_duplicate'] is True, "Duplicate claim not detected!"
 
+        # --- Test Claim Window Eviction ---
+        print("\n--- Testing Claim Window Eviction ---")
+        window = ClaimWindow(max_window_seconds=10, max_keys=2, event_types=["invoice_issued"])
+        window.bootstrapped = True
+        start = time.time()
+        for ticket in ("TKT_A", "TKT_B", "TKT_C"): # TKT_A is evicted with a live event
+            window.record(ticket, "invoice_issued", start)
+        assert window.count("TKT_C", "invoice_issued", 10, now=start) == 1, "Live key miscounted!"
+        assert window.count("TKT_A", "invoice_issued", 10, now=start) is None, "Evicted key answered from memory!"
+        assert window.count("TKT_A", "invoice_issued", 10, now=start + 15) is None, "Evicted key forgotten while its events may be in the window!"
+        assert window.count("TKT_A", "invoice_issued", 10, now=start + 26) == 0, "Eviction filter was never rotated!"
+        print("Claim window eviction filter rotation OK")
+
+        # --- Test Cluster Claim Broadcast ---
+        print("\n--- Testing Cluster Claim Broadcast ---")
+        # Two buses on one local transport stand in for two workers
+        worker_bus = ztdigs_core.invalidation_bus
+        original_transport, worker_bus.transport = worker_bus.transport, LocalTransport()
+        peer_bus = InvalidationBus(worker_bus.transport, origin="peer-worker")
+        peer_claims = []
+        peer_bus.subscribe("ztdigs.claims", lambda payload: peer_claims.extend(payload["claims"]))
+        worker_bus.start()
+        peer_bus.start()
+        try:
+            ztdigs_core.bootstrap_claim_window()
+            peer_bus.publish("ztdigs.claims", claims=[{"ticket_id": "TKT_PEER", "event_type": "invoice_issued", "timestamp": time.time()}])
+            assert check_duplicate_claim("TKT_PEER", "invoice_issued", time_window_seconds=60)['count'] == 1, "Claim recorded by another worker not counted!"
+            log_provenance_event(create_provenance_log_entry_data(ticket_id_1, "AGT004_Billing", "invoice_issued", "Third invoice.", {"invoice_amount": 150}, contract_1['id']))
+            assert [claim['ticket_id'] for claim in peer_claims] == [ticket_id_1], "Claim not broadcast to the other worker!"
+        finally:
+            peer_bus.stop()
+            worker_bus.stop()
+            worker_bus.transport = original_transport
+
         print("\n--- ZTDIGS Core Tests PASSED! ---")
 
     except ConnectionFailure:
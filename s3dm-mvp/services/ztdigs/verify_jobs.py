@@ -0,0 +1,202 @@
+# services/ztdigs/verify_jobs.py
+from typing import List, Optional, Dict, Any, Callable
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+import threading
+import time
+import uuid
+import os
+
+from services.ztdigs.core import get_mongo_db_connection, verify_entry_signature, check_chain_link, iter_provenance_entries, load_merkle_blocks, merkle_block_members, verify_chain_anchors
+from services.ztdigs.signers import export_verification_keys, load_verification_keys, get_active_signer
+
+# --- Configuration ---
+# Entries per range handed to a worker process, and number of worker processes (never more than the CPU count).
+VERIFY_CHUNK_SIZE = int(os.getenv("ZTDIGS_VERIFY_CHUNK_SIZE", "5000"))
+VERIFY_MAX_WORKERS = os.cpu_count() or 1
+VERIFY_WORKERS = min(int(os.getenv("ZTDIGS_VERIFY_WORKERS", "0")) or VERIFY_MAX_WORKERS, VERIFY_MAX_WORKERS)
+# Finished verification jobs kept in memory for status lookups; older ones are dropped.
+VERIFY_JOBS_KEPT = int(os.getenv("ZTDIGS_VERIFY_JOBS_KEPT", "20"))
+
+# --- Worker Process Side ---
+# Each worker receives the public verification keys once (via the pool initializer), so it never
+# loads or generates signing key material of its own.
+def _init_verifier_worker(public_keys: Dict[str, str], default_key_id: str):
+    load_verification_keys(public_keys, default_key_id)
+
+def _verify_range(chunk_index: int, entries: List[Dict[str, Any]], blocks: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Verifies signatures (or Merkle block membership) and internal hash links of one contiguous range of the chain."""
+    # The range's first and last entries are returned so the parent can check the links between ranges.
+    result = {
+        "chunk_index": chunk_index,
+        "count": len(entries),
+        "first_entry": entries[0],
+        "last_entry": entries[-1],
+        "failure": None
+    }
+    verified_blocks = set()
+    members = merkle_block_members(blocks)
+    for i, entry in enumerate(entries):
+        entry_id = str(entry.get("_id"))
+        if not verify_entry_signature(entry, blocks, verified_blocks, members):
+            result["failure"] = {"offset": i, "status": "FAILED", "reason": f"Signature mismatch for entry {entry_id}", "entry_id": entry_id, "passed": False}
+            return result
+        if i > 0:
+            link_failure = check_chain_link(entries[i - 1], entry)
+            if link_failure:
+                result["failure"] = dict(link_failure, offset=i)
+                return result
+    return result
+
+# --- Parallel Chain Verification ---
+def _iter_chain_ranges(chunk_size: int):
+    """
+    Streams the provenance log (archived segments and provenance_log) in chain order, yielding
+    (entries, blocks) for ranges of at most chunk_size entries, where blocks holds the Merkle blocks
+    the range's entries belong to.
+    """
+    db = get_mongo_db_connection()
+
+    def with_blocks(chunk):
+        return chunk, load_merkle_blocks(db, chunk)
+
+    chunk = []
+    for entry in iter_provenance_entries():
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield with_blocks(chunk)
+            chunk = []
+    if chunk:
+        yield with_blocks(chunk)
+
+def verify_provenance_chain_parallel(
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, Any]:
+    """
+    Verifies the provenance chain like verify_provenance_chain, but splits it into ranges that are
+    verified in a process pool. Links between ranges are checked here from each range's boundary hashes.
+    Returns the same result shape as the serial verifier, reporting the earliest failure in chain order.
+    """
+    workers = min(workers or VERIFY_WORKERS, VERIFY_MAX_WORKERS)
+    chunk_size = chunk_size or VERIFY_CHUNK_SIZE
+    results: Dict[int, Dict[str, Any]] = {}
+    verified_entries = 0
+    stop_submitting = False
+
+    # "spawn" keeps workers independent of the parent's threads (pymongo monitors, the job thread).
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_verifier_worker, initargs=(export_verification_keys(), get_active_signer().key_id)) as executor:
+        in_flight = set()
+        for chunk_index, (chunk, blocks) in enumerate(_iter_chain_ranges(chunk_size)):
+            in_flight.add(executor.submit(_verify_range, chunk_index, chunk, blocks))
+            # Bound the number of ranges held in memory at once
+            while len(in_flight) >= workers * 2 or (stop_submitting and in_flight):
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk_result = future.result()
+                    results[chunk_result["chunk_index"]] = chunk_result
+                    verified_entries += chunk_result["count"]
+                    stop_submitting = stop_submitting or chunk_result["failure"] is not None
+                if progress_callback:
+                    progress_callback(verified_entries, len(results))
+            if stop_submitting:
+                break
+        for future in in_flight:
+            chunk_result = future.result()
+            results[chunk_result["chunk_index"]] = chunk_result
+            verified_entries += chunk_result["count"]
+        if progress_callback:
+            progress_callback(verified_entries, len(results))
+
+    if not results:
+        return {"status": "No entries to verify.", "passed": True}
+
+    # Walk ranges in chain order; the first failure (internal or at a boundary) wins.
+    for chunk_index in sorted(results):
+        chunk_result = results[chunk_index]
+        failure = chunk_result["failure"]
+        if not (failure and failure["offset"] == 0):
+            previous_result = results.get(chunk_index - 1)
+            link_failure = check_chain_link(previous_result["last_entry"] if previous_result else None, chunk_result["first_entry"])
+            if link_failure:
+                print(f"ZTDIGS: {link_failure['reason']}")
+                return link_failure
+        if failure:
+            failure = dict(failure)
+            failure.pop("offset")
+            print(f"ZTDIGS: {failure['reason']}")
+            return failure
+
+    anchor_failure = verify_chain_anchors() # Looks up each chain's last anchored head (truncation check)
+    if anchor_failure:
+        print(f"ZTDIGS: {anchor_failure['reason']}")
+        return anchor_failure
+
+    return {"status": "PASSED", "message": "All provenance log entries verified successfully.", "passed": True, "entries_verified": verified_entries}
+
+# --- Background Verification Jobs ---
+# Jobs run in a daemon thread per job so the API worker never blocks on chain verification.
+# Only one job runs at a time, since each one already spreads over all CPUs.
+_verification_jobs: Dict[str, Dict[str, Any]] = {}
+_jobs_lock = threading.Lock()
+
+def _run_verification_job(job_id: str, workers: Optional[int], chunk_size: Optional[int]):
+    def on_progress(verified_entries: int, chunks_completed: int):
+        with _jobs_lock:
+            _verification_jobs[job_id]["verified_entries"] = verified_entries
+            _verification_jobs[job_id]["chunks_completed"] = chunks_completed
+
+    try:
+        result = verify_provenance_chain_parallel(workers, chunk_size, on_progress)
+        status = "passed" if result.get("passed") else "failed"
+    except ValueError as e: # Archive segment failed its integrity check
+        print(f"ZTDIGS: Verification job {job_id} failed: {e}")
+        result = {"status": "FAILED", "reason": str(e), "passed": False}
+        status = "failed"
+    except Exception as e:
+        print(f"ZTDIGS: Verification job {job_id} errored: {e}")
+        result = {"status": "ERROR", "reason": str(e), "passed": False}
+        status = "error"
+
+    with _jobs_lock:
+        _verification_jobs[job_id].update({"status": status, "result": result, "finished_at": time.time()})
+        _prune_finished_jobs()
+
+def _prune_finished_jobs():
+    """Drops the oldest finished jobs beyond VERIFY_JOBS_KEPT. Caller holds _jobs_lock."""
+    finished = sorted((job for job in _verification_jobs.values() if job["finished_at"] is not None), key=lambda job: job["finished_at"])
+    for job in finished[:max(len(finished) - VERIFY_JOBS_KEPT, 0)]:
+        del _verification_jobs[job["job_id"]]
+
+def start_verification_job(workers: Optional[int] = None, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Starts a background parallel verification of the provenance chain and returns the job record.
+    Raises RuntimeError if a verification job is already running.
+    """
+    db = get_mongo_db_connection()
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "status": "running",
+        "total_entries": db["provenance_log"].estimated_document_count() + sum(segment["entry_count"] for segment in db["provenance_segments"].find({}, {"entry_count": 1})),
+        "verified_entries": 0,
+        "chunks_completed": 0,
+        "result": None,
+        "started_at": time.time(),
+        "finished_at": None
+    }
+    with _jobs_lock:
+        running = next((other for other in _verification_jobs.values() if other["status"] == "running"), None)
+        if running:
+            raise RuntimeError(f"Verification job {running['job_id']} is already running.")
+        _verification_jobs[job_id] = job
+    threading.Thread(target=_run_verification_job, args=(job_id, workers, chunk_size), daemon=True).start()
+    return get_verification_job(job_id)
+
+def get_verification_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Returns a snapshot of a verification job, including progress, or None if unknown."""
+    with _jobs_lock:
+        job = _verification_jobs.get(job_id)
+        return dict(job) if job else None